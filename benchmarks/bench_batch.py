@@ -0,0 +1,56 @@
+"""
+convert_files throughput for an increasing number of worker processes.
+
+    python -m benchmarks.bench_batch --files 2000 --max-jobs 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import yaml
+
+from xmapper.batch import convert_files
+
+from benchmarks.bench_transformer import build_rules, build_template
+from benchmarks.synthetic import make_feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--records', type=int, default=5,
+                        help='records per file')
+    parser.add_argument('--max-jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        in_dir = os.path.join(tmp, 'in')
+        os.makedirs(in_dir)
+        for idx in range(args.files):
+            with open(os.path.join(in_dir, '{}.xml'.format(idx)), 'w') as f:
+                f.write(make_feed(args.records, seed=idx))
+        rules = os.path.join(tmp, 'map.yaml')
+        with open(rules, 'w') as f:
+            yaml.safe_dump(build_rules(), f)
+        template = os.path.join(tmp, 'template.xml')
+        with open(template, 'w') as f:
+            f.write(build_template())
+
+        jobs = 1
+        base = None
+        while jobs <= args.max_jobs:
+            out_dir = os.path.join(tmp, 'out{}'.format(jobs))
+            start = time.perf_counter()
+            result = convert_files(rules, template, in_dir, out_dir,
+                                   jobs=jobs)
+            elapsed = time.perf_counter() - start
+            assert not result.errors
+            base = base or elapsed
+            print('jobs {:>3} {:>10.0f} files/s  speedup {:.2f}'.format(
+                jobs, args.files / elapsed, base / elapsed))
+            jobs *= 2
+
+
+if __name__ == '__main__':
+    main()
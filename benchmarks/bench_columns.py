@@ -0,0 +1,68 @@
+"""
+pulling three fields of every ad out of a feed: the former value_mapping
+of the parsed tree regrouped by the ad position against to_columns
+streaming the feed file, time and peak traced memory.
+
+    python -m benchmarks.bench_columns --records 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from xmapper.columns import to_columns
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed
+
+
+FIELDS = ['@id', 'field0', 'field1']
+
+
+def legacy_columns(feed):
+    obj = parse(feed, mode='r')
+    rows = {}
+    for path, value in obj.value_mapping.items():
+        parts = path.split('.')
+        if parts[1] == 'ad' and parts[3] in FIELDS:
+            rows.setdefault(int(parts[2]), {})[parts[3]] = value
+    columns = {field: [] for field in FIELDS if not field.startswith('@')}
+    for idx in sorted(rows):
+        for field, column in columns.items():
+            column.append(rows[idx].get(field))
+    columns['@id'] = [ad['id'] for ad in obj.listing.ad]
+    return columns
+
+
+def measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        feed = os.path.join(tmp, 'feed.xml')
+        with open(feed, 'w') as f:
+            f.write(make_feed(args.records))
+        legacy, legacy_time, legacy_peak = measure(legacy_columns, feed)
+        columns, columns_time, columns_peak = measure(
+            to_columns, feed, 'listing.ad', FIELDS, as_numpy=False)
+    assert len(columns['field1']) == len(legacy['field1'])
+    print('legacy     {:>6.2f} s {:>8.1f} MiB peak'.format(
+        legacy_time, legacy_peak))
+    print('to_columns {:>6.2f} s {:>8.1f} MiB peak'.format(
+        columns_time, columns_peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+memory of the parsed tree, Node against CompactNode, measured with
+tracemalloc after parsing (the path caches are not built).
+
+    python -m benchmarks.bench_compact --records 20000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed
+
+
+def measure(feed, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = parse(feed, mode='r', **kwargs)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    feed = make_feed(args.records)
+    source = len(feed.encode('utf-8'))
+    node_size, node_time = measure(feed)
+    compact_size, compact_time = measure(feed, compact=True)
+    print('source       {:>8.1f} MiB'.format(source / 2 ** 20))
+    print('Node         {:>8.1f} MiB {:>5.1f}x source  {:.2f} s'.format(
+        node_size / 2 ** 20, node_size / source, node_time))
+    print('CompactNode  {:>8.1f} MiB {:>5.1f}x source  {:.2f} s'.format(
+        compact_size / 2 ** 20, compact_size / source, compact_time))
+    print('saved {:.0%}'.format(1 - compact_size / node_size))
+
+
+if __name__ == '__main__':
+    main()
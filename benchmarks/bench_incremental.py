@@ -0,0 +1,57 @@
+"""
+a feed file edited in place at a few records: a full parse and dump_xml
+against IncrementalDocument.refresh and its copy-through dump.
+
+    python -m benchmarks.bench_incremental --records 20000 --edits 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from xmapper.incremental import IncrementalDocument
+from xmapper.utils import dump_xml, parse
+
+from benchmarks.synthetic import make_feed
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--edits', type=int, default=10)
+    args = parser.parse_args()
+
+    feed = make_feed(args.records)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'feed.xml')
+        out = os.path.join(tmp, 'out.xml')
+        with open(path, 'w') as f:
+            f.write(feed)
+        doc, load_time = timed(IncrementalDocument, path, 'listing.ad')
+        step = args.records // args.edits
+        for idx in range(0, args.records, step):
+            feed = feed.replace('<ad id="{}">'.format(idx),
+                                '<ad id="{}" edited="1">'.format(idx))
+        with open(path, 'w') as f:
+            f.write(feed)
+
+        obj, parse_time = timed(parse, path)
+        _, dump_time = timed(dump_xml, obj, out)
+        stats, refresh_time = timed(doc.refresh)
+        dump_stats, copy_time = timed(doc.dump, out)
+        assert doc.root.value_mapping == obj.value_mapping
+        print('load       {:>6.2f} s'.format(load_time))
+        print('parse      {:>6.2f} s  refresh {:>6.2f} s  {} parsed'.format(
+            parse_time, refresh_time, stats['parsed']))
+        print('dump_xml   {:>6.2f} s  dump    {:>6.2f} s  {} copied'.format(
+            dump_time, copy_time, dump_stats['copied']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+infer_candidates throughput over sample pairs for an increasing number
+of worker processes, the outputs are made by the benchmark rules so the
+inferred exact matches can be checked against them.
+
+    python -m benchmarks.bench_inference --pairs 500 --max-jobs 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from xmapper.inference import infer_candidates
+from xmapper.transformer import Transformer
+from xmapper.utils import dump_xml
+
+from benchmarks.bench_transformer import build_rules, build_template
+from benchmarks.synthetic import make_feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pairs', type=int, default=500)
+    parser.add_argument('--max-jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    rules = build_rules()
+    transformer = Transformer(rules, build_template())
+    with tempfile.TemporaryDirectory() as tmp:
+        pairs = []
+        for idx in range(args.pairs):
+            input = os.path.join(tmp, '{}.in.xml'.format(idx))
+            output = os.path.join(tmp, '{}.out.xml'.format(idx))
+            with open(input, 'w') as f:
+                f.write(make_feed(1, seed=idx))
+            dump_xml(transformer.transform(input), output)
+            pairs.append((input, output))
+
+        jobs = 1
+        base = None
+        while jobs <= args.max_jobs:
+            start = time.perf_counter()
+            inference = infer_candidates(pairs, jobs=jobs, skip=('',))
+            elapsed = time.perf_counter() - start
+            assert not inference.errors
+            base = base or elapsed
+            print('jobs {:>3} {:>10.0f} pairs/s  speedup {:.2f}'.format(
+                jobs, args.pairs / elapsed, base / elapsed))
+            jobs *= 2
+        unique = {k: next(iter(v)) for k, v in inference.candidates.items()
+                  if len(v) == 1}
+        # like Mapper, only the text values are searched, not the
+        # attributes and the repeated images
+        fields = {k: v for k, v in rules['exact_match'].items()
+                  if k.startswith('property.value')}
+        print('{} of {} field rules inferred exactly'.format(
+            sum(unique.get(k) == v for k, v in fields.items()),
+            len(fields)))
+
+
+if __name__ == '__main__':
+    main()
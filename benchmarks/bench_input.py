@@ -0,0 +1,88 @@
+"""
+parse input paths: the former xml.sax reading of a file name and
+StringIO wrapping of a string against the memory mapped file, the sliced
+string and bytes and a gzip file fed in chunks. Every variant runs in
+its own process to get the growth of its peak RSS while parsing.
+
+    python -m benchmarks.bench_input --records 50000
+"""
+import argparse
+import gzip
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import StringIO
+from xml.sax import make_parser
+
+from xmapper.utils import CompactNode, Handler, parse
+
+from benchmarks.synthetic import make_feed
+
+
+VARIANTS = ['file-legacy', 'file', 'str-legacy', 'str', 'bytes', 'gzip']
+
+
+def legacy_parse(source):
+    parser = make_parser()
+    sax_handler = Handler('r', CompactNode)
+    parser.setContentHandler(sax_handler)
+    parser.parse(source)
+    return sax_handler.root
+
+
+def peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(variant, path):
+    if variant in ('str-legacy', 'str'):
+        with open(path) as f:
+            source = f.read()
+    elif variant == 'bytes':
+        with open(path, 'rb') as f:
+            source = f.read()
+    elif variant == 'gzip':
+        source = path + '.gz'
+    else:
+        source = path
+    if variant == 'str-legacy':
+        source = StringIO(source)
+    before = peak_rss()
+    start = time.perf_counter()
+    if variant.endswith('-legacy'):
+        legacy_parse(source)
+    else:
+        parse(source, mode='r', compact=True)
+    elapsed = time.perf_counter() - start
+    print('{:<12} {:>6.2f} s {:>8.1f} MiB peak RSS growth'.format(
+        variant, elapsed, peak_rss() - before))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    feed = make_feed(args.records)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'feed.xml')
+        with open(path, 'w') as f:
+            f.write(feed)
+        with gzip.open(path + '.gz', 'wt') as f:
+            f.write(feed)
+        print('source {:>8.1f} MiB'.format(os.path.getsize(path) / 2 ** 20))
+        for variant in VARIANTS:
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_input',
+                            '--child', variant, path], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+parse speed of the sax and lxml backends on a synthetic feed,
+both build the same Nodes.
+
+    python -m benchmarks.bench_parse --records 20000
+"""
+import argparse
+import time
+
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed
+
+
+def best_of(repeat, feed, **kwargs):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(feed, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    feed = make_feed(args.records)
+    source = len(feed.encode('utf-8')) / 2 ** 20
+    assert (parse(feed, mode='r', backend='lxml').value_mapping ==
+            parse(feed, mode='r').value_mapping)
+    print('source  {:>8.1f} MiB'.format(source))
+    sax = best_of(args.repeat, feed)
+    print('sax     {:>8.2f} s {:>6.1f} MiB/s'.format(sax, source / sax))
+    lxml = best_of(args.repeat, feed, backend='lxml')
+    print('lxml    {:>8.2f} s {:>6.1f} MiB/s'.format(lxml, source / lxml))
+    print('speedup {:.2f}x'.format(sax / lxml))
+
+
+if __name__ == '__main__':
+    main()
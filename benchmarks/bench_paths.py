@@ -0,0 +1,78 @@
+"""
+Node.paths / Node.all_paths against the former raw_paths + deepcopy
+implementation, time and tracemalloc peak per tree size.
+
+    python -m benchmarks.bench_paths --max-leaves 1000000
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed, records_for_leaves
+
+
+def legacy_paths(node):
+    raw_paths = copy.deepcopy(node.raw_paths())
+    for p in raw_paths:
+        if None in p:
+            p.remove(None)
+    if node._name is not None:
+        for p in raw_paths:
+            del p[0]
+    return {str('.'.join(p)) for p in raw_paths}
+
+
+def legacy_all_paths(node):
+    full_paths = legacy_paths(node)
+    paths = set()
+    for full_path in full_paths:
+        partials = full_path.split('.')
+        for i in range(1, len(partials) + 1)[::-1]:
+            to_add_path = '.'.join(partials[0:i])
+            if to_add_path in paths:
+                break
+            paths.add(to_add_path)
+    return full_paths, paths
+
+
+def current_all_paths(node):
+    return node.paths, node.all_paths
+
+
+def measure(func, node):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(node)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--max-leaves', type=int, default=10 ** 5)
+    args = parser.parse_args()
+
+    print('{:>9} {:>12} {:>12} {:>12} {:>12}'.format(
+        'leaves', 'legacy s', 'legacy MiB', 'current s', 'current MiB'))
+    leaves = 10 ** 3
+    while leaves <= args.max_leaves:
+        obj = parse(make_feed(records_for_leaves(leaves)), mode='rw')
+        legacy, legacy_time, legacy_peak = measure(legacy_all_paths, obj)
+        # nothing cached by the legacy run
+        obj.clean_path_cache()
+        current, current_time, current_peak = measure(
+            current_all_paths, obj)
+        assert legacy == current
+        print('{:>9} {:>12.3f} {:>12.1f} {:>12.3f} {:>12.1f}'.format(
+            len(current[0]), legacy_time, legacy_peak / 2 ** 20,
+            current_time, current_peak / 2 ** 20))
+        leaves *= 10
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+the images of the ads with some id: hand composed get_obj_by_attr_value
+and get_value_by_path calls against a compiled query, on a fresh tree
+and on a tree with its indexes built, then **.image.
+
+    python -m benchmarks.bench_query --records 20000
+"""
+import argparse
+import time
+
+from xmapper.query import compile_query
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed
+
+
+def legacy_images(obj, ids):
+    images = []
+    for ad_id in ids:
+        for ad in obj.get_obj_by_attr_value('ad', 'id', ad_id):
+            value = ad.get_value_by_path('images.image')
+            images.extend(value if isinstance(value, list) else [value])
+    return images
+
+
+def query_images(obj, ids):
+    images = []
+    for ad_id in ids:
+        query = compile_query(
+            "**.ad[@id='{}'].images.image".format(ad_id))
+        images.extend(query.values(obj))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args()
+
+    feed = make_feed(args.records)
+    ids = [str(i * args.records // args.queries)
+           for i in range(args.queries)]
+    for label, func in (('legacy', legacy_images), ('query', query_images)):
+        obj = parse(feed, mode='r')
+        start = time.perf_counter()
+        images = func(obj, ids)
+        print('{:<8} {:>8.3f} s  {} images'.format(
+            label, time.perf_counter() - start, len(images)))
+    obj = parse(feed, mode='r', tag_index=True)
+    obj.attr_index
+    start = time.perf_counter()
+    images = query_images(obj, ids)
+    print('{:<8} {:>8.3f} s  {} images'.format(
+        'indexed', time.perf_counter() - start, len(images)))
+    start = time.perf_counter()
+    count = sum(1 for _ in compile_query('**.image').iter(obj))
+    print('{:<8} {:>8.3f} s  {} images'.format(
+        '**.image', time.perf_counter() - start, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+reloading a parsed document: parsing it again against loading its
+snapshot at once or lazily and through the parse cache, with the file
+sizes. Node trees do not unpickle, untangle's __getattr__ recurses
+before their __dict__ is restored.
+
+    python -m benchmarks.bench_snapshot --records 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from xmapper.snapshot import load_snapshot, save_snapshot
+from xmapper.utils import parse
+
+from benchmarks.synthetic import make_feed
+
+
+def timed(label, func, size=None):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print('{:<16} {:>8.3f} s {}'.format(
+        label, elapsed,
+        '' if size is None else '{:>8.1f} MiB'.format(size / 2 ** 20)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'feed.xml')
+        with open(source, 'w') as f:
+            f.write(make_feed(args.records))
+        obj = timed('parse', lambda: parse(source), os.path.getsize(source))
+        timed('parse compact', lambda: parse(source, mode='r', compact=True))
+
+        path = os.path.join(tmp, 'feed.xsnap')
+        save_snapshot(obj, path)
+        size = os.path.getsize(path)
+        timed('snapshot rw', lambda: load_snapshot(path, mode='rw'), size)
+        timed('snapshot compact', lambda: load_snapshot(path, lazy=False))
+        lazy = timed('snapshot lazy', lambda: load_snapshot(path))
+        timed('lazy one value',
+              lambda: lazy.listing.ad[args.records // 2].field0.cdata)
+
+        cache = os.path.join(tmp, 'cache')
+        timed('cache miss', lambda: parse(source, cache=cache))
+        timed('cache hit', lambda: parse(source, cache=cache))
+        timed('cache hit lazy', lambda: parse(source, mode='r', compact=True,
+                                              cache=cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Transformer throughput in records per second, streaming records with
+transform_records and whole single record documents with transform,
+against a hand written get_value_by_path/set_value_by_path loop.
+
+    python -m benchmarks.bench_transformer --records 20000
+"""
+import argparse
+import time
+
+from xmapper.transformer import Transformer
+from xmapper.utils import iterparse, parse
+
+from benchmarks.synthetic import make_feed
+
+
+FIELDS = 8
+IMAGES = 2
+
+
+def build_rules():
+    rules = {}
+    for field in range(FIELDS):
+        rules['property.value{}'.format(field)] = \
+            'listing.ad.field{}'.format(field)
+    rules['property.image'] = 'listing.ad.images.image'
+    rules['property.@id'] = 'listing.ad.@id'
+    return {'exact_match': rules}
+
+
+def build_template():
+    fields = ''.join('<value{0}></value{0}>'.format(field)
+                     for field in range(FIELDS))
+    images = '<image></image>' * IMAGES
+    return '<property>{}{}</property>'.format(fields, images)
+
+
+def report(name, records, elapsed):
+    print('{:<24} {:>10.0f} records/s'.format(name, records / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    feed = make_feed(args.records, fields=FIELDS, images=IMAGES)
+    rules = build_rules()
+    template = build_template()
+    transformer = Transformer(rules, template)
+
+    start = time.perf_counter()
+    count = sum(1 for _ in transformer.transform_records(feed, 'listing.ad'))
+    report('transform_records', count, time.perf_counter() - start)
+
+    documents = [parse(make_feed(1, FIELDS, IMAGES, seed=seed))
+                 for seed in range(min(args.records, 2000))]
+    start = time.perf_counter()
+    for document in documents:
+        transformer.transform(document)
+    report('transform', len(documents), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for document in documents:
+        output = parse(template)
+        for output_path, input_path in rules['exact_match'].items():
+            value = document.get_value_by_path(input_path)
+            if output_path.endswith('@id'):
+                output.set_attr_by_path('property', {'id': value})
+            else:
+                output.set_value_by_path(output_path, value)
+    report('hand written loop', len(documents), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    count = sum(1 for _ in iterparse(feed, 'listing.ad'))
+    report('iterparse only', count, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
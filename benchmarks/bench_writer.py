@@ -0,0 +1,92 @@
+"""
+writing the converted records of a feed: collecting the outputs in one
+tree for dump_xml against XmlStreamWriter writing every record as it is
+converted. Every variant runs in its own process to get the growth of
+its peak RSS.
+
+    python -m benchmarks.bench_writer --records 50000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from xmapper import Transformer, XmlStreamWriter
+from xmapper.utils import Node, dump_xml
+
+from benchmarks.synthetic import make_feed
+
+
+TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id></id>
+    <kind></kind>
+    <image></image>
+</property>"""
+
+RULES = {'exact_match': {'property.id': 'listing.ad.0.@id',
+                         'property.kind': 'listing.ad.0.field0',
+                         'property.image': 'listing.ad.0.images.image.0'}}
+
+
+def peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def tree_output(records, source, target):
+    root = Node(None, None)
+    listing = Node('property_list', {})
+    root._attach(listing)
+    for output in records:
+        listing._attach(output.children[0])
+    listing.build_position()
+    dump_xml(root, target)
+
+
+def stream_output(records, source, target):
+    with XmlStreamWriter(target, 'property_list') as writer:
+        writer.write_many(records)
+
+
+def child(variant, source, target):
+    transformer = Transformer(RULES, TEMPLATE)
+    func = tree_output if variant == 'tree' else stream_output
+    before = peak_rss()
+    start = time.perf_counter()
+    func(transformer.transform_records(source, 'listing.ad'), source,
+         target)
+    print('{:<8} {:>6.2f} s {:>8.1f} MiB peak RSS growth {:>8.1f} MiB '
+          'written'.format(variant, time.perf_counter() - start,
+                           peak_rss() - before,
+                           os.path.getsize(target) / 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'feed.xml')
+        with open(source, 'w') as f:
+            f.write(make_feed(args.records))
+        outputs = []
+        for variant in ('tree', 'stream'):
+            target = os.path.join(tmp, variant + '.xml')
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_writer',
+                            '--child', variant, source, target], check=True)
+            with open(target, 'rb') as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+benchmark suite of the public operations on reproducible synthetic feeds
+of several shapes and sizes: wall time, throughput and peak memory
+traced by tracemalloc (the Python allocations, not the ones of lxml) of
+parse, paths, value_mapping, Mapper.build_mapping,
+Comparer.compare and dump_xml, saved as JSON.
+
+    python -m benchmarks.suite run --sizes kb mb --output results.json
+    python -m benchmarks.suite compare baseline.json results.json \\
+        --threshold 0.25
+
+compare, or run with --baseline, exits with status 1 when an operation
+got slower or used more memory than the baseline by more than the
+threshold, so it can gate a CI job. The feeds are written in chunks
+and kept in --data-dir between runs, the gb size needs a few GB of
+disk and a lot more memory for the operations on the parsed tree.
+"""
+import argparse
+from contextlib import redirect_stdout
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from xmapper import Comparer, Mapper
+from xmapper.utils import dump_xml, parse
+
+from benchmarks.synthetic import FeedShape, write_feed
+
+
+SIZES = {'kb': 100 * 2 ** 10, 'mb': 10 * 2 ** 20, 'large': 100 * 2 ** 20,
+         'gb': 2 ** 30}
+
+SHAPES = {
+    'flat': FeedShape(depth=1, fanout=16, repeats=4, attributes=0),
+    'nested': FeedShape(depth=4, fanout=3, repeats=2, attributes=1),
+    'repeated': FeedShape(depth=2, fanout=3, repeats=12, attributes=1),
+    'attributes': FeedShape(depth=2, fanout=4, repeats=3, attributes=8),
+}
+
+OPERATIONS = ['parse', 'paths', 'value_mapping', 'build_mapping',
+              'compare', 'dump_xml']
+
+# the changes smaller than that are noise, seconds and MiB
+_NOISE = {'seconds': 0.005, 'peak_mib': 1.0}
+
+
+class Case(object):
+    """
+    the feed files of a shape and size: the feed, a similar feed with
+    some edited values and a smaller output sample of the feed
+    """
+    def __init__(self, data_dir, shape_name, size_name):
+        self.name = '{}/{}'.format(shape_name, size_name)
+        self.shape = SHAPES[shape_name]
+        self.size = SIZES[size_name]
+        prefix = os.path.join(data_dir, '{}-{}-{}'.format(
+            shape_name, size_name,
+            '{depth}-{fanout}-{repeats}-{attributes}'.format(
+                **self.shape.as_dict())))
+        self.path = prefix + '.xml'
+        self.edited_path = prefix + '-edited.xml'
+        self.sample_path = prefix + '-sample.xml'
+        self.records = self.write(self.path, self.size)
+        self.write(self.edited_path, self.size, edit_every=50)
+        self.write(self.sample_path, max(self.size // 50, 1))
+
+    def write(self, path, size, edit_every=0):
+        count_path = path + '.records'
+        if os.path.exists(path) and os.path.exists(count_path):
+            with open(count_path) as f:
+                return int(f.read())
+        with open(path, 'w') as f:
+            records = write_feed(f, size, self.shape, edit_every=edit_every)
+        with open(count_path, 'w') as f:
+            f.write(str(records))
+        return records
+
+
+def measure(setup, run, repeat, memory):
+    """
+    :param setup: called before every run, not measured
+    :param run: called with the result of setup
+    :return: best seconds of the runs, peak traced MiB of one more run
+        or None
+    """
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del state
+    peak = None
+    if memory:
+        state = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(state)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def _quiet(func):
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return func()
+
+
+def operations(case, out_dir):
+    """
+    :return: {operation: (setup, run)}
+    """
+    parsed = {}
+
+    def tree():
+        # parsed once for the operations on a tree, caches dropped
+        if 'obj' not in parsed:
+            parsed['obj'] = parse(case.path)
+        parsed['obj'].clean_path_cache()
+        return parsed['obj']
+
+    def paths_built():
+        obj = tree()
+        obj.paths
+        return obj
+
+    out_path = os.path.join(out_dir, 'dump.xml')
+    return {
+        'parse': (lambda: case.path, parse),
+        'paths': (tree, lambda obj: obj.paths),
+        'value_mapping': (paths_built, lambda obj: obj.value_mapping),
+        'build_mapping': (lambda: Mapper(case.path, case.sample_path),
+                          lambda mapper: _quiet(mapper.build_mapping)),
+        'compare': (lambda: Comparer(case.path, case.edited_path),
+                    lambda comparer: _quiet(comparer.compare)),
+        'dump_xml': (tree, lambda obj: dump_xml(obj, out_path)),
+    }
+
+
+def run_suite(shapes, sizes, ops, repeat=3, memory=True, data_dir=None,
+              log=print):
+    """
+    :return: results dict, see save
+    """
+    results = {
+        'version': 1,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape_name in shapes:
+            for size_name in sizes:
+                case = Case(data_dir or tmp, shape_name, size_name)
+                size = os.path.getsize(case.path)
+                entry = results['cases'][case.name] = {
+                    'shape': case.shape.as_dict(),
+                    'bytes': size,
+                    'records': case.records,
+                    'operations': {},
+                }
+                available = operations(case, tmp)
+                for op in ops:
+                    setup, run = available[op]
+                    seconds, peak = measure(setup, run, repeat, memory)
+                    entry['operations'][op] = {
+                        'seconds': seconds,
+                        'mib_per_s': size / 2 ** 20 / seconds
+                        if seconds else None,
+                        'peak_mib': peak,
+                    }
+                    log('{:<20} {:<14} {:>9.4f} s {:>9.1f} MiB/s '
+                        '{:>9} MiB peak'.format(
+                            case.name, op, seconds,
+                            entry['operations'][op]['mib_per_s'] or 0,
+                            '-' if peak is None else '{:.1f}'.format(peak)))
+    return results
+
+
+def compare_results(baseline, current, threshold=0.2, log=print):
+    """
+    :param threshold: allowed relative growth of the time and the peak
+        memory, 0.2 is 20% slower
+    :return: list of (case, operation, metric, baseline, current) of
+        the regressions
+    """
+    regressions = []
+    for name, case in sorted(current['cases'].items()):
+        base_case = baseline['cases'].get(name)
+        if base_case is None:
+            log('{:<20} not in the baseline'.format(name))
+            continue
+        for op, metrics in sorted(case['operations'].items()):
+            base_metrics = base_case['operations'].get(op)
+            if base_metrics is None:
+                continue
+            for metric, noise in sorted(_NOISE.items()):
+                before = base_metrics.get(metric)
+                after = metrics.get(metric)
+                if before is None or after is None:
+                    continue
+                change = (after - before) / before if before else 0.0
+                status = 'ok'
+                if after > before * (1 + threshold) and \
+                        after - before > noise:
+                    status = 'REGRESSION'
+                    regressions.append((name, op, metric, before, after))
+                log('{:<20} {:<14} {:<8} {:>10.4f} -> {:>10.4f} '
+                    '{:>+7.1%} {}'.format(name, op, metric, before, after,
+                                          change, status))
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('--shapes', nargs='+', choices=sorted(SHAPES),
+                     default=sorted(SHAPES))
+    run.add_argument('--sizes', nargs='+', choices=sorted(SIZES),
+                     default=['kb', 'mb'])
+    run.add_argument('--ops', nargs='+', choices=OPERATIONS,
+                     default=OPERATIONS)
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--no-memory', action='store_true',
+                     help='skip the traced memory run')
+    run.add_argument('--data-dir', help='keep the feeds there')
+    run.add_argument('--output', help='JSON file of the results')
+    run.add_argument('--baseline', help='JSON results to compare with')
+    run.add_argument('--threshold', type=float, default=0.2)
+    compare = commands.add_parser('compare', help='compare two results')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        if args.data_dir:
+            os.makedirs(args.data_dir, exist_ok=True)
+        results = run_suite(args.shapes, args.sizes, args.ops, args.repeat,
+                            not args.no_memory, args.data_dir)
+        if args.output:
+            save(results, args.output)
+        if not args.baseline:
+            return 0
+        baseline = load(args.baseline)
+    elif args.command == 'compare':
+        baseline = load(args.baseline)
+        results = load(args.current)
+    else:
+        parser.print_help()
+        return 2
+    regressions = compare_results(baseline, results, args.threshold)
+    if regressions:
+        print('{} regression(s) over {:.0%}'.format(
+            len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
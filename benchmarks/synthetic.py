@@ -0,0 +1,162 @@
+"""
+deterministic synthetic feeds for the benchmarks
+"""
+import random
+
+
+_WORDS = ['house', 'unit', 'villa', 'land', 'apartment', 'studio',
+          'high', 'low', 'sale', 'rent', 'sold', 'active']
+
+
+def make_feed(records, fields=8, images=2, seed=0):
+    """
+    build a listing feed like:
+    <listing>
+      <ad id="0">
+        <field0>house</field0>
+        ...
+        <images>
+          <image>https://img.example.com/0/0.jpg</image>
+          ...
+        </images>
+      </ad>
+      ...
+    </listing>
+    every ad has fields + images leaves
+    :param records: number of <ad> records
+    :param fields: number of distinct leaf fields per record
+    :param images: number of repeated <image> per record
+    :param seed: random seed, same seed gives the same feed
+    :return: xml string
+    """
+    rnd = random.Random(seed)
+    parts = ["<?xml version='1.0' encoding='UTF-8'?>\n<listing>\n"]
+    for record in range(records):
+        parts.append('  <ad id="{}">\n'.format(record))
+        for field in range(fields):
+            if field % 2:
+                value = str(rnd.randint(0, 10 ** 6))
+            else:
+                value = rnd.choice(_WORDS)
+            parts.append('    <field{0}>{1}</field{0}>\n'.format(field, value))
+        if images:
+            parts.append('    <images>\n')
+            for image in range(images):
+                parts.append(
+                    '      <image>https://img.example.com/{}/{}.jpg'
+                    '</image>\n'.format(record, image))
+            parts.append('    </images>\n')
+        parts.append('  </ad>\n')
+    parts.append('</listing>\n')
+    return ''.join(parts)
+
+
+def records_for_leaves(leaves, fields=8, images=2):
+    """
+    :return: number of records needed for about that many leaves
+    """
+    return max(1, leaves // (fields + images))
+
+
+class FeedShape(object):
+    """
+    shape of the records of write_feed
+    :param depth: levels of nested elements below a record
+    :param fanout: distinct child elements of every nested element
+    :param repeats: repeated siblings of the last child of every level
+    :param attributes: attributes of every element
+    """
+    def __init__(self, depth=2, fanout=4, repeats=3, attributes=1):
+        if depth < 1 or fanout < 1 or repeats < 1 or attributes < 0:
+            raise ValueError('invalid feed shape')
+        self.depth = depth
+        self.fanout = fanout
+        self.repeats = repeats
+        self.attributes = attributes
+
+    def as_dict(self):
+        return {'depth': self.depth, 'fanout': self.fanout,
+                'repeats': self.repeats, 'attributes': self.attributes}
+
+    def leaves(self):
+        """
+        :return: number of leaves of a record
+        """
+        return self.fanout * \
+            (self.fanout - 1 + self.repeats) ** (self.depth - 1)
+
+
+def _write_element(write, rnd, shape, name, level, indent, record, edited):
+    attrs = ''.join(' a{}="{}"'.format(i, rnd.randint(0, 999))
+                    for i in range(shape.attributes))
+    if level == shape.depth:
+        if rnd.random() < 0.5:
+            value = str(rnd.randint(0, 10 ** 6))
+        else:
+            value = '{} {}'.format(rnd.choice(_WORDS), rnd.choice(_WORDS))
+        if edited:
+            value = 'edited {}'.format(record)
+            edited = False
+        write('{}<{}{}>{}</{}>\n'.format(indent, name, attrs, value, name))
+        return edited
+    write('{}<{}{}>\n'.format(indent, name, attrs))
+    children = ['{}{}'.format(name, i) for i in range(shape.fanout - 1)]
+    children += ['{}r'.format(name)] * shape.repeats
+    for child in children:
+        edited = _write_element(write, rnd, shape, child, level + 1,
+                                indent + '  ', record, edited)
+    write('{}</{}>\n'.format(indent, name))
+    return edited
+
+
+def write_feed(f, size, shape=None, seed=0, edit_every=0):
+    """
+    write a feed of records of the shape up to about size bytes, in
+    chunks so files of GB do not need the memory
+    <feed>
+      <record id="0" a0="42">
+        <e0 a0="7">
+          <e00 a0="1">house sale</e00>
+          ...
+          <e0r a0="3">530911</e0r>
+          <e0r a0="8">villa low</e0r>
+        </e0>
+        ...
+      </record>
+      ...
+    </feed>
+    :param f: text file object
+    :param size: number of bytes to write about
+    :param shape: FeedShape of the records
+    :param seed: random seed, the same arguments give the same feed
+    :param edit_every: change the first value of every that many
+        records, to get a similar feed to compare, 0 for none
+    :return: number of records
+    """
+    shape = shape or FeedShape()
+    rnd = random.Random(seed)
+    buffer = []
+    buffered = written = 0
+    head = "<?xml version='1.0' encoding='UTF-8'?>\n<feed>\n"
+    f.write(head)
+    written += len(head)
+    records = 0
+    while written + buffered < size or not records:
+        # the values do not depend on the edits so both feeds match
+        edited = bool(edit_every) and records % edit_every == 0
+        start = len(buffer)
+        buffer.append('  <record id="{}">\n'.format(records))
+        for i in range(shape.fanout):
+            _write_element(buffer.append, rnd, shape, 'e{}'.format(i), 1,
+                           '    ', records, edited and i == 0)
+        buffer.append('  </record>\n')
+        buffered += sum(len(part) for part in buffer[start:])
+        records += 1
+        if buffered > 1 << 20:
+            f.write(''.join(buffer))
+            written += buffered
+            buffer = []
+            buffered = 0
+    buffer.append('</feed>\n')
+    f.write(''.join(buffer))
+    return records
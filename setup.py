@@ -22,10 +22,15 @@ setup(
     long_description_content_type='text/x-rst',
     author='Alex xi',
     author_email='alexxi0213@gmail.com',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'tests']),
     include_package_data=True,
     zip_safe=False,
     url="https://github.com/xxh840912/xmapper",
+    entry_points={
+        "console_scripts": [
+            "xmapper=xmapper.cli:main",
+        ],
+    },
     install_requires=[
         "lxml==4.6.5",
         "PyYAML==5.4.1",
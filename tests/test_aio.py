@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import gzip
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+
+from xmapper.aio import aparse, aparse_many
+from xmapper.utils import parse
+
+
+FEED = ''.join(
+    ['<?xml version="1.0" encoding="UTF-8"?>\n<listing>\n'] +
+    ['  <ad id="{0}"><price>{0}</price><type>Café</type></ad>\n'.format(i)
+     for i in range(2000)] +
+    ['</listing>\n']).encode('utf-8')
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/feed.xml':
+            self.reply(FEED)
+        elif self.path == '/feed.xml.gz':
+            self.reply(gzip.compress(FEED))
+        elif self.path == '/encoded.xml':
+            self.reply(gzip.compress(FEED), [('Content-Encoding', 'gzip')])
+        elif self.path == '/chunked.xml':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(FEED), 1000):
+                chunk = FEED[start:start + 1000]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode())
+                self.wfile.write(chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        elif self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/feed.xml')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/host.xml':
+            self.reply('<host>{}</host>'.format(
+                self.headers['Host']).encode('utf-8'))
+        elif self.path == '/broken.xml':
+            self.reply(b'<listing><ad>')
+        elif self.path == '/slow.xml':
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(FEED)))
+            self.end_headers()
+            self.wfile.write(FEED[:100])
+            self.wfile.flush()
+            time.sleep(1)
+        else:
+            self.send_error(404)
+
+    def reply(self, body, headers=()):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TestAio(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingServer(('127.0.0.1', 0), FeedHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.base = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        cls.expected = parse(FEED).value_mapping
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_aparse(self):
+        for path in ('feed.xml', 'feed.xml.gz', 'encoded.xml',
+                     'chunked.xml', 'moved'):
+            root = self.run_async(aparse(self.base + path, chunk_size=4096))
+            self.assertEqual(root.value_mapping, self.expected, path)
+        root = self.run_async(aparse(FEED.decode('utf-8'), mode='r',
+                                     compact=True))
+        self.assertEqual(root.value_mapping, self.expected)
+        with self.assertRaises(HTTPError):
+            self.run_async(aparse(self.base + 'missing.xml'))
+        # the credentials of the url are not sent as the host
+        root = self.run_async(aparse(self.base.replace(
+            'http://', 'http://user:secret@') + 'host.xml'))
+        self.assertEqual(root.host.cdata, self.base[7:-1])
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(aparse(self.base + 'slow.xml', timeout=0.2))
+
+    def test_aparse_many(self):
+        urls = [self.base + path for path in ('feed.xml', 'chunked.xml',
+                                              'missing.xml', 'broken.xml')]
+
+        async def collect(**kwargs):
+            results = {}
+            async for url, root in aparse_many(urls, concurrency=2,
+                                               **kwargs):
+                results[url] = root
+            return results
+
+        results = self.run_async(collect(return_exceptions=True))
+        self.assertEqual(results[urls[0]].value_mapping, self.expected)
+        self.assertEqual(results[urls[1]].value_mapping, self.expected)
+        self.assertIsInstance(results[urls[2]], HTTPError)
+        self.assertIsInstance(results[urls[3]], Exception)
+        with self.assertRaises(Exception):
+            self.run_async(collect())
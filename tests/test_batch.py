@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from xmapper.batch import convert_files
+from xmapper.cli import main
+from xmapper.utils import parse
+
+
+TEMPLATE = "<property><id></id><type></type></property>"
+
+RULES = {'exact_match': {
+    'property.id': 'listing.ad.listingId',
+    'property.type': 'listing.ad.type'
+}}
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.in_dir = os.path.join(self.tmp.name, 'in')
+        self.out_dir = os.path.join(self.tmp.name, 'out')
+        os.makedirs(os.path.join(self.in_dir, 'sub'))
+        for idx in range(5):
+            name = os.path.join('sub' if idx % 2 else '', '{}.xml'.format(idx))
+            with open(os.path.join(self.in_dir, name), 'w') as f:
+                f.write('<listing><ad><listingId>{}</listingId>'
+                        '<type>house</type></ad></listing>'.format(idx))
+        with open(os.path.join(self.in_dir, 'broken.xml'), 'w') as f:
+            f.write('<listing><ad>')
+        self.rules = os.path.join(self.tmp.name, 'map.yaml')
+        with open(self.rules, 'w') as f:
+            yaml.safe_dump(RULES, f)
+        self.template = os.path.join(self.tmp.name, 'template.xml')
+        with open(self.template, 'w') as f:
+            f.write(TEMPLATE)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check_output(self, result):
+        self.assertEqual(len(result.converted), 5)
+        self.assertEqual(list(result.errors), ['broken.xml'])
+        obj = parse(os.path.join(self.out_dir, 'sub', '3.xml'))
+        self.assertEqual(obj.value_mapping,
+                         {'property.id': '3', 'property.type': 'house'})
+
+    def test_convert_files(self):
+        self.check_output(convert_files(
+            self.rules, self.template, self.in_dir, self.out_dir, jobs=1))
+
+    def test_convert_files_pool(self):
+        self.check_output(convert_files(
+            self.rules, self.template, self.in_dir, self.out_dir, jobs=2,
+            chunk_bytes=64))
+
+    def test_changed_rules(self):
+        convert_files(self.rules, self.template, self.in_dir, self.out_dir,
+                      jobs=1)
+        with open(self.rules, 'w') as f:
+            yaml.safe_dump({'exact_match': {
+                'property.id': 'listing.ad.listingId',
+                'property.type': 'listing.ad.listingId'}}, f)
+        for jobs in (1, 2):
+            convert_files(self.rules, self.template, self.in_dir,
+                          self.out_dir, jobs=jobs)
+            obj = parse(os.path.join(self.out_dir, 'sub', '3.xml'))
+            self.assertEqual(obj.value_mapping,
+                             {'property.id': '3', 'property.type': '3'})
+
+    def test_cli(self):
+        code = main(['convert', '--rules', self.rules, '--template',
+                     self.template, '--jobs', '1', self.in_dir, self.out_dir])
+        self.assertEqual(code, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, '0.xml')))
@@ -0,0 +1,70 @@
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.suite import compare_results, main
+from benchmarks.synthetic import FeedShape, write_feed
+from xmapper.utils import parse
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_write_feed(self):
+        shape = FeedShape(depth=3, fanout=2, repeats=3, attributes=2)
+        feeds = []
+        for _ in range(2):
+            f = io.StringIO()
+            records = write_feed(f, 20000, shape, seed=7)
+            feeds.append(f.getvalue())
+        self.assertEqual(feeds[0], feeds[1])
+        self.assertGreaterEqual(len(feeds[0]), 20000)
+        obj = parse(feeds[0])
+        self.assertEqual(len(obj.feed.record), records)
+        self.assertEqual(len(obj.value_mapping), records * shape.leaves())
+        self.assertEqual(len(obj.feed.record[0].e0.e00.e00r), 3)
+        self.assertEqual(sorted(obj.feed.record[0].e0._attributes),
+                         ['a0', 'a1'])
+
+        edited = io.StringIO()
+        write_feed(edited, 20000, shape, seed=7, edit_every=2)
+        values = parse(feeds[0]).value_mapping
+        changed = {k for k, v in parse(edited.getvalue()).value_mapping
+                   .items() if values[k] != v}
+        self.assertEqual(len(changed), (records + 1) // 2)
+        with self.assertRaises(ValueError):
+            FeedShape(depth=0)
+
+    def test_compare(self):
+        def results(seconds, peak):
+            return {'cases': {'flat/kb': {'operations': {
+                'parse': {'seconds': seconds, 'peak_mib': peak}}}}}
+
+        baseline = results(1.0, 10.0)
+        log = [].append
+        self.assertEqual(compare_results(baseline, results(1.1, 10.5), 0.2,
+                                         log), [])
+        self.assertEqual(
+            compare_results(baseline, results(1.3, 20.0), 0.2, log),
+            [('flat/kb', 'parse', 'peak_mib', 10.0, 20.0),
+             ('flat/kb', 'parse', 'seconds', 1.0, 1.3)])
+        # within the noise
+        self.assertEqual(compare_results(results(0.001, 0.1),
+                                         results(0.002, 0.2), 0.2, log), [])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, name) for name in ('a.json',
+                                                          'b.json')]
+            for path, data in zip(paths, (baseline, results(2.0, 10.0))):
+                with open(path, 'w') as f:
+                    json.dump(data, f)
+            with open(os.devnull, 'w') as devnull:
+                with redirect_stdout(devnull):
+                    self.assertEqual(main(['compare', paths[0], paths[0]]),
+                                     0)
+                    self.assertEqual(main(['compare', paths[0], paths[1]]),
+                                     1)
+                    self.assertEqual(main(['compare', paths[0], paths[1],
+                                           '--threshold', '1.5']), 0)
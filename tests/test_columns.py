@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import math
+import unittest
+
+from xmapper.columns import Dictionary, infer_type, numpy, to_columns
+from xmapper.utils import parse
+
+
+XML = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad id="1">
+        <price>100</price>
+        <type>house</type>
+        <images><image>a.jpg</image><image>b.jpg</image></images>
+    </ad>
+    <other><ad id="x"><price>1</price></ad></other>
+    <ad id="2">
+        <price>99.5</price>
+        <type>unit</type>
+        <images><image>c.jpg</image></images>
+    </ad>
+    <ad id="3">
+        <type>house</type>
+        <images><image>d.jpg</image><image>e.jpg</image></images>
+    </ad>
+</listing>"""
+
+FIELDS = ['@id', 'price', 'type', 'images.image.1', 'agent.@id']
+
+
+class TestColumns(unittest.TestCase):
+
+    def check(self, columns):
+        self.assertEqual(list(columns['@id']), [1, 2, 3])
+        price = list(columns['price'])
+        self.assertEqual(price[:2], [100.0, 99.5])
+        self.assertTrue(math.isnan(price[2]))
+        codes, values = columns['type']
+        self.assertEqual([values[c] for c in codes],
+                         ['house', 'unit', 'house'])
+        codes, values = columns['images.image.1']
+        self.assertEqual([values[c] if c >= 0 else None for c in codes],
+                         ['b.jpg', None, 'e.jpg'])
+        self.assertEqual(list(columns['agent.@id'].codes), [-1] * 3)
+
+    def test_stream(self):
+        self.check(to_columns(XML, 'listing.ad', FIELDS, as_numpy=False))
+        for chunk_size in (1, 7):
+            self.assertEqual(
+                to_columns(XML, 'listing.ad', FIELDS, as_numpy=False,
+                           chunk_size=chunk_size)['images.image.1'],
+                to_columns(XML, 'listing.ad', FIELDS,
+                           as_numpy=False)['images.image.1'])
+
+    def test_tree(self):
+        self.check(to_columns(parse(XML), 'listing.ad', FIELDS,
+                              as_numpy=False))
+
+    def test_strings(self):
+        columns = to_columns(XML, 'listing.ad', ['@id'], infer_types=False,
+                             as_numpy=False)
+        self.assertEqual(columns['@id'],
+                         Dictionary(columns['@id'].codes, ['1', '2', '3']))
+        with self.assertRaises(ValueError):
+            to_columns(XML, 'listing.ad', ['a.@b.c'])
+
+    def test_leading_zeros(self):
+        columns = to_columns(
+            '<l><ad><zip>0800</zip><id>7</id></ad>'
+            '<ad><zip>2000</zip><id>007.5</id></ad></l>',
+            'l.ad', ['zip', 'id'], as_numpy=False)
+        for field, expected in (('zip', ['0800', '2000']),
+                                ('id', ['7', '007.5'])):
+            codes, values = columns[field]
+            self.assertEqual([values[c] for c in codes], expected)
+        self.assertIsNone(infer_type(['007']))
+        self.assertIsNone(infer_type(['1', '00.5']))
+        self.assertIs(infer_type(['0', '0.5', '-0.25', '.5']), float)
+        self.assertIs(infer_type(['0', '-12']), int)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        columns = to_columns(XML, 'listing.ad', FIELDS, as_numpy=True)
+        self.assertEqual(columns['@id'].dtype, numpy.int64)
+        self.assertEqual(columns['price'].dtype, numpy.float64)
+        self.check(columns)
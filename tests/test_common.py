@@ -1,7 +1,17 @@
 # -*- coding: utf-8 -*-
+import bz2
+import gzip
+import lzma
+import gc
+import os
+import sys
+import tempfile
 import unittest
+from unittest import mock
+import warnings
 
-from xmapper.utils import parse, dump_str
+from xmapper import utils
+from xmapper.utils import Node, parse, dump_str, iterparse
 from xmapper import Comparer
 
 
@@ -222,3 +232,368 @@ class TestCommon(unittest.TestCase):
         output_xml_str = dump_str(obj)
         self.assertTrue('<shedlock-provider-jdbc_template.version>' in output_xml_str)
         self.assertTrue('<java.version>' in output_xml_str)
+
+    def test_path_index(self):
+        xml_str = """<?xml version='1.0' encoding='UTF-8'?>
+        <bookstore>
+            <book category="cooking">
+                <title lang="en">Everyday Italian</title>
+            </book>
+            <book category="children">
+                <title lang="fr">Harry Potter</title>
+            </book>
+        </bookstore>"""
+        for mode in ('r', 'rw'):
+            obj = parse(xml_str, mode=mode)
+            self.assertEqual(set(obj.path_index.nodes), obj.all_paths)
+            self.assertEqual(
+                obj.get_value_by_path('bookstore.book.title'),
+                'Everyday Italian'
+            )
+            self.assertEqual(
+                obj.get_value_by_path('bookstore.book.1.title.@lang'), 'fr')
+            self.assertEqual(obj.get_value_by_path('bookstore.pen'), '')
+            self.assertIsNone(obj.get_object_by_path('bookstore.book.title'))
+            self.assertEqual(
+                obj.get_attr_value_by_path('bookstore.book.1.@category'),
+                'children'
+            )
+            obj.set_value_by_path('bookstore.book.1.title', 'Dune')
+            self.assertEqual(
+                obj.get_value_by_path('bookstore.book.1.title'), 'Dune')
+            obj.set_attr_by_path('bookstore.book.0', {'category': 'food'})
+            self.assertEqual(
+                obj.get_attr_by_path('bookstore.book.0'),
+                {'category': 'food'}
+            )
+            self.assertRaises(
+                AttributeError, obj.set_value_by_path, 'bookstore.pen', 'x')
+
+    def test_all_paths(self):
+        xml_str = """<?xml version='1.0' encoding='UTF-8'?>
+        <listing>
+            <ad>
+                <type>house</type>
+                <images><image>a.jpg</image><image>b.jpg</image></images>
+            </ad>
+            <ad><type>unit</type></ad>
+        </listing>"""
+        obj = parse(xml_str, mode='r')
+        self.assertEqual(obj.paths, {
+            'listing.ad.0.type',
+            'listing.ad.0.images.image.0',
+            'listing.ad.0.images.image.1',
+            'listing.ad.1.type'
+        })
+        self.assertEqual(obj.all_paths, obj.paths | {
+            'listing',
+            'listing.ad',
+            'listing.ad.0',
+            'listing.ad.0.images',
+            'listing.ad.0.images.image',
+            'listing.ad.1'
+        })
+
+    def test_iterparse(self):
+        xml_str = """<?xml version='1.0' encoding='UTF-8'?>
+        <listing>
+            <header><date>2020-01-01</date></header>
+            <ad id="1">
+                <type>house</type>
+                <images><image>a.jpg</image><image>b.jpg</image></images>
+            </ad>
+            <ad id="2"><type>unit</type></ad>
+        </listing>"""
+        records = list(iterparse(xml_str, 'listing.ad', chunk_size=16))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0].value_mapping, {
+            'type': 'house',
+            'images.image.0': 'a.jpg',
+            'images.image.1': 'b.jpg'
+        })
+        self.assertEqual(records[1].get_value_by_path('type'), 'unit')
+        self.assertEqual(records[1].get_attr_value_by_path('@id'), '2')
+        self.assertEqual(
+            [r.get_value_by_path('date') for r in
+             iterparse(xml_str.encode('utf-8'), 'listing.header')],
+            ['2020-01-01']
+        )
+
+    def test_dump_str_blank_text(self):
+        xml_str = """<?xml version='1.0' encoding='UTF-8'?>
+        <listing>
+            <ad><type>house</type><note>  </note><empty></empty></ad>
+            <ad>mixed <b>bold</b> text</ad>
+        </listing>"""
+        self.assertEqual(
+            dump_str(parse(xml_str)),
+            "<?xml version='1.0' encoding='utf-8'?>\n"
+            "<listing>\n"
+            "  <ad>\n"
+            "    <type>house</type>\n"
+            "    <note>  </note>\n"
+            "    <empty/>\n"
+            "  </ad>\n"
+            "  <ad>mixed  text<b>bold</b></ad>\n"
+            "</listing>\n"
+        )
+        # the blank cdata of big parents is dropped as well
+        many = '<listing>{}</listing>'.format('\n  <ad>1</ad>' * 2000)
+        self.assertTrue(dump_str(parse(many)).startswith(
+            "<?xml version='1.0' encoding='utf-8'?>\n<listing>\n  <ad>1</ad>"))
+
+    def test_compact(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <bookstore>
+            <book category="cooking">
+                <title lang="en">Everyday Italian</title>
+                <price>30.00</price>
+            </book>
+            <book category="children">
+                <title lang="en">Harry Potter</title>
+                <price>29.99</price>
+            </book>
+        </bookstore>"""
+        obj = parse(xml_str, mode='r')
+        compact = parse(xml_str, mode='r', compact=True)
+        self.assertEqual(compact.paths, obj.paths)
+        self.assertEqual(compact.all_paths, obj.all_paths)
+        self.assertEqual(compact.value_mapping, obj.value_mapping)
+        self.assertEqual(compact.attr_mapping, obj.attr_mapping)
+        self.assertEqual(compact.get_value_by_tag('price'),
+                         obj.get_value_by_tag('price'))
+        self.assertEqual(
+            compact.get_attr_value_by_path('bookstore.book.1.@category'),
+            'children'
+        )
+        self.assertEqual(compact.bookstore.book[1].title.cdata,
+                         'Harry Potter')
+        self.assertEqual(dump_str(compact), dump_str(obj))
+        self.assertRaises(ValueError, parse, xml_str, compact=True)
+        self.assertRaises(ValueError, compact.set_value_by_path,
+                          'bookstore.book.1.title', 'x')
+        self.assertRaises(ValueError, compact.set_attr_by_path,
+                          'bookstore.book.1', {'category': 'x'})
+        self.assertRaises(ValueError, compact.set_value_by_tag, 'title', 'x')
+        self.assertRaises(ValueError, compact.bookstore.add_child,
+                          Node('book', {}))
+        self.assertEqual(compact.value_mapping, obj.value_mapping)
+
+    def test_lxml_backend(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <!-- feed -->
+        <bookstore xmlns:x="urn:x">
+            <book category="cooking" xml:lang="en">
+                <title>Everyday <!-- note -->Italian</title>
+                <x:price x:currency="EUR">30.00</x:price>
+            </book>
+            <book category="children">
+                <title>Harry Potter</title>
+                <java.version>1.8</java.version>
+            </book>
+        </bookstore>"""
+        obj = parse(xml_str)
+        lxml_obj = parse(xml_str, backend='lxml')
+        self.assertEqual(lxml_obj.paths, obj.paths)
+        self.assertEqual(lxml_obj.value_mapping, obj.value_mapping)
+        self.assertEqual(lxml_obj.attr_mapping, obj.attr_mapping)
+        self.assertEqual(
+            lxml_obj.get_value_by_path('bookstore.book.0.title'),
+            'Everyday Italian'
+        )
+        self.assertEqual(
+            lxml_obj.get_attr_value_by_path('bookstore.@xmlns:x'), 'urn:x')
+        compact = parse(xml_str, mode='r', compact=True, backend='lxml')
+        self.assertEqual(compact.value_mapping, obj.value_mapping)
+        self.assertRaises(ValueError, parse, xml_str, backend='expat')
+        self.assertRaises(ValueError, parse, xml_str, backend='lxml',
+                          feature_external_ges=False)
+
+    def test_internal_entities(self):
+        xml_str = ('<!DOCTYPE a [<!ENTITY e "hello">]>'
+                   '<a>x &e; y<b>&e;</b>&e;</a>')
+        # lxml < 5 keeps the entities unresolved
+        for options in ({}, {'resolve_entities': False}):
+            with mock.patch.dict(utils._LXML_OPTIONS, options):
+                for backend in ('sax', 'lxml'):
+                    obj = parse(xml_str, backend=backend)
+                    self.assertEqual(obj.a.cdata, 'x hello yhello')
+                    self.assertEqual(obj.get_value_by_path('a.b'), 'hello')
+        with mock.patch.dict(utils._LXML_OPTIONS, resolve_entities=False):
+            self.assertRaises(
+                ValueError, parse,
+                '<!DOCTYPE a [<!ENTITY e "<b/>">]><a>&e;</a>', backend='lxml')
+
+    def test_content_hash(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <bookstore>
+            <book category="cooking">
+                <title>Everyday Italian</title>
+                <price>30.00</price>
+            </book>
+            <book category="cooking">
+                <title>Everyday Italian</title>
+                <price>30.00</price>
+            </book>
+            <book category="children">
+                <price>29.99</price>
+                <title>Harry Potter</title>
+            </book>
+        </bookstore>"""
+        obj = parse(xml_str, content_hash=True)
+        books = obj.bookstore.book
+        self.assertIsNotNone(books[0]._cached('content_hash'))
+        self.assertEqual(books[0].content_hash, books[1].content_hash)
+        self.assertNotEqual(books[0].content_hash, books[2].content_hash)
+        one = parse('<a><b>1</b><c>2</c><b>3</b></a>')
+        two = parse('<a><b>3</b><c>2</c><b>1</b></a>')
+        self.assertNotEqual(one.content_hash, two.content_hash)
+        self.assertEqual(one.unordered_hash, two.unordered_hash)
+        compact = parse(xml_str, mode='r', compact=True, backend='lxml')
+        self.assertEqual(compact.content_hash, obj.content_hash)
+
+        # setting a value or an attribute drops the hashes of the ancestors
+        before = obj.content_hash
+        obj.set_value_by_path('bookstore.book.1.price', '31.00')
+        self.assertIsNone(obj.bookstore._cached('content_hash'))
+        self.assertIsNotNone(books[0]._cached('content_hash'))
+        self.assertNotEqual(books[0].content_hash, books[1].content_hash)
+        self.assertEqual(obj.content_hash,
+                         parse('31.00'.join(xml_str.rsplit('30.00', 1)))
+                         .content_hash)
+        obj.set_value_by_path('bookstore.book.1.price', '30.00')
+        self.assertEqual(obj.content_hash, before)
+        obj.set_attr_by_path('bookstore.book.1', {'category': 'food'})
+        self.assertNotEqual(obj.content_hash, before)
+
+        records = list(iterparse(xml_str, 'bookstore.book',
+                                 content_hash=True))
+        self.assertEqual(len({r.content_hash for r in records}), 2)
+
+    def test_rw_cache(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <bookstore>
+            <book><title>Everyday Italian</title></book>
+            <shelf><label>A</label></shelf>
+        </bookstore>"""
+        obj = parse(xml_str)
+        self.assertIs(obj.paths, obj.paths)
+        self.assertEqual(obj.get_value_by_path('bookstore.book.title'),
+                         'Everyday Italian')
+        shelf = obj.bookstore.shelf
+        shelf_paths = shelf.paths
+
+        # setting values keeps the paths
+        obj.set_value_by_path('bookstore.book.title', 'Harry Potter')
+        self.assertIsNotNone(obj._cached('paths'))
+        self.assertEqual(obj.value_mapping['bookstore.book.title'],
+                         'Harry Potter')
+
+        # adding a child only invalidates the ancestors
+        book = obj.bookstore.book
+        book.add_child(Node('price', {}))
+        self.assertIsNone(obj._cached('paths'))
+        self.assertIs(shelf.paths, shelf_paths)
+        self.assertIn('bookstore.book.price', obj.paths)
+        obj.bookstore.add_child(Node('book', {}))
+        self.assertIn('bookstore.book.price', obj.paths)
+        obj.bookstore.build_position()
+        self.assertEqual(len(obj.bookstore.book), 2)
+        self.assertIn('bookstore.book.1', obj.all_paths)
+        self.assertIn('bookstore.book.0.price', obj.paths)
+        self.assertNotIn('bookstore.book.price', obj.paths)
+        self.assertEqual(
+            obj.path_index.get('bookstore.book.0.title').cdata,
+            'Harry Potter')
+
+    def test_tag_index(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <bookstore>
+            <book category="cooking">
+                <title lang="en">Everyday Italian</title>
+                <book category="web"><title>Nested</title></book>
+            </book>
+            <book category="web"><title lang="en">XQuery</title></book>
+        </bookstore>"""
+        for obj in (parse(xml_str), parse(xml_str, tag_index=True),
+                    parse(xml_str, mode='r', compact=True, tag_index=True)):
+            self.assertEqual(obj.get_value_by_tag('title'),
+                             ['Everyday Italian', 'Nested', 'XQuery'])
+            self.assertEqual(obj.get_attr_value_by_tag('book', 'category'),
+                             ['cooking', 'web'])
+            self.assertEqual(len(obj.get_obj_by_tag('book')), 2)
+            self.assertEqual(len(list(obj.iter_by_tag('book'))), 3)
+            self.assertEqual(
+                [b.title.cdata for b in
+                 obj.get_obj_by_attr_value('book', 'category', 'web')],
+                ['Nested', 'XQuery'])
+            self.assertEqual(obj.get_obj_by_attr_value('book', 'id', '1'),
+                             [])
+        self.assertIsNotNone(
+            parse(xml_str, tag_index=True)._cached('tag_index'))
+
+        obj = parse(xml_str)
+        self.assertEqual(obj.get_attr_by_tag('title'), [{'lang': 'en'}] * 2)
+        obj.set_attr_by_path('bookstore.book.1', {'category': 'xml'})
+        self.assertEqual(
+            len(obj.get_obj_by_attr_value('book', 'category', 'xml')), 1)
+        obj.set_value_by_tag('title', 'Same')
+        self.assertEqual(obj.get_value_by_tag('title'), ['Same'] * 3)
+        obj.bookstore.add_child(Node('title', {}))
+        self.assertEqual(len(obj.get_value_by_tag('title')), 4)
+
+        # deeper than the recursion limit
+        deep = parse('<a>' * 2000 + '<b>x</b>' + '</a>' * 2000)
+        self.assertEqual(deep.get_value_by_tag('b'), ['x'])
+        self.assertEqual(len(deep.get_obj_by_tag('a')), 1)
+
+    def test_sources(self):
+        xml_str = """<?xml version="1.0" encoding="UTF-8"?>
+        <bookstore><book>Café</book><book>Tea</book></bookstore>"""
+        expected = parse(xml_str).value_mapping
+        data = xml_str.encode('utf-8')
+        with tempfile.TemporaryDirectory() as tmp:
+            sources = [data, bytearray(data)]
+            for name, compress in (('a.xml', bytes), ('a.xml.gz', gzip),
+                                   ('a.xml.bz2', bz2), ('a.xml.xz', lzma)):
+                path = os.path.join(tmp, name)
+                with open(path, 'wb') as f:
+                    f.write(data if compress is bytes
+                            else compress.compress(data))
+                sources.append(path)
+                if compress is not bytes:
+                    sources.append(compress.compress(data))
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always', ResourceWarning)
+                for source in sources:
+                    self.assertEqual(parse(source).value_mapping, expected)
+                    self.assertEqual(
+                        parse(source, backend='lxml').value_mapping,
+                        expected)
+                    self.assertEqual(
+                        [r.cdata for r in iterparse(
+                            source, 'bookstore.book', chunk_size=7)],
+                        ['Café', 'Tea'])
+                gc.collect()
+            # the compressed files are closed with their stream
+            self.assertEqual([w.message for w in caught], [])
+
+            # the mapping of a malformed file is closed on the error
+            bad = os.path.join(tmp, 'bad.xml')
+            with open(bad, 'w') as f:
+                f.write('<bookstore><book></b>' + 'x' * 100)
+            unraisable = []
+            hook = sys.unraisablehook
+            sys.unraisablehook = unraisable.append
+            try:
+                for backend in ('sax', 'lxml'):
+                    with self.assertRaises(Exception):
+                        parse(bad, backend=backend)
+                gc.collect()
+            finally:
+                sys.unraisablehook = hook
+            self.assertEqual(unraisable, [])
+            with open(sources[2], 'rb') as f:
+                self.assertEqual(parse(f).value_mapping, expected)
+        with self.assertRaises(ValueError):
+            parse(b' ')
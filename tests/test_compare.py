@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from xmapper.cli import main
+from xmapper.compare import FingerprintCache, compare_dirs
+
+
+class TestCompareDirs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.old_dir = os.path.join(self.tmp.name, 'old')
+        self.new_dir = os.path.join(self.tmp.name, 'new')
+        self.cache = os.path.join(self.tmp.name, 'cache.sqlite')
+        for directory in (self.old_dir, self.new_dir):
+            os.makedirs(directory)
+            for idx in range(4):
+                self.write(directory, '{}.xml'.format(idx),
+                           '<ad id="{0}"><price>{0}</price></ad>'.format(idx))
+        self.write(self.new_dir, '1.xml', '<ad id="1"><price>9</price></ad>')
+        self.write(self.new_dir, '2.xml', '<ad id="2"><type>a</type></ad>')
+        self.write(self.new_dir, '3.xml', '<ad id="3"><price>3')
+        self.write(self.old_dir, 'gone.xml', '<ad/>')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, directory, name, content):
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(content)
+
+    def check_result(self, result):
+        self.assertEqual(result.identical, ['0.xml'])
+        self.assertEqual(result.different['1.xml'].changed,
+                         {'ad.price': ('1', '9')})
+        self.assertEqual(result.different['2.xml'].added, ['ad.type'])
+        self.assertEqual(result.different['2.xml'].removed, ['ad.price'])
+        self.assertEqual(list(result.errors), ['3.xml'])
+        self.assertEqual(result.only_old, ['gone.xml'])
+        self.assertEqual(result.stats['top_paths'][0], ('ad.price', 2))
+
+    def test_compare_dirs(self):
+        result = compare_dirs(self.old_dir, self.new_dir, cache=self.cache,
+                              jobs=1)
+        self.check_result(result)
+        self.assertEqual(result.stats['parsed'], 7)
+
+        # the second run only parses what changed
+        self.write(self.new_dir, '0.xml', '<ad id="0"><price>5</price></ad>')
+        result = compare_dirs(self.old_dir, self.new_dir, cache=self.cache,
+                              jobs=2)
+        self.assertEqual(result.stats['parsed'], 1)
+        self.assertEqual(result.different['0.xml'].changed,
+                         {'ad.price': ('0', '5')})
+
+        # same content with a new mtime is not parsed again
+        self.write(self.new_dir, '0.xml', '<ad id="0"><price>0</price></ad>')
+        self.write(self.new_dir, '0.xml', '<ad id="0"><price>5</price></ad>')
+        os.utime(os.path.join(self.new_dir, '0.xml'), ns=(1, 1))
+        cache = FingerprintCache(self.cache)
+        result = compare_dirs(self.old_dir, self.new_dir, cache=cache, jobs=1)
+        self.assertEqual(result.stats['parsed'], 0)
+        self.assertIn('0.xml', result.different)
+        cache.close()
+
+    def test_cli(self):
+        code = main(['compare-dirs', '--jobs', '1', '--cache', self.cache,
+                     self.old_dir, self.new_dir])
+        self.assertEqual(code, 1)
+        self.check_result(compare_dirs(self.old_dir, self.new_dir,
+                                       cache=self.cache, jobs=1))
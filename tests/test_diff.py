@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from xmapper import Comparer
+from xmapper.diff import diff, equal
+from xmapper.utils import parse
+
+
+XML_A = """<?xml version='1.0' encoding='UTF-8'?>
+<bookstore name="central">
+    <book category="cooking">
+        <title>Everyday Italian</title>
+        <price>30.00</price>
+    </book>
+    <book category="children">
+        <title>Harry Potter</title>
+        <price>29.99</price>
+    </book>
+    <owner>Ann</owner>
+</bookstore>"""
+
+# the books swapped
+XML_B = """<?xml version='1.0' encoding='UTF-8'?>
+<bookstore name="central">
+    <owner>Ann</owner>
+    <book category="children">
+        <title>Harry Potter</title>
+        <price>29.99</price>
+    </book>
+    <book category="cooking">
+        <title>Everyday Italian</title>
+        <price>30.00</price>
+    </book>
+</bookstore>"""
+
+XML_C = """<?xml version='1.0' encoding='UTF-8'?>
+<bookstore name="corner" open="1">
+    <book category="cooking">
+        <title>Everyday Italian</title>
+        <price>35.00</price>
+    </book>
+    <book category="children">
+        <title>Harry Potter</title>
+        <price>29.99</price>
+        <isbn>123</isbn>
+    </book>
+    <book category="web">
+        <title>Learning XML</title>
+    </book>
+</bookstore>"""
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.a = parse(XML_A)
+        self.b = parse(XML_B)
+        self.c = parse(XML_C)
+
+    def test_equal(self):
+        self.assertTrue(equal(self.a, parse(XML_A)))
+        self.assertFalse(equal(self.a, self.b))
+        self.assertTrue(equal(self.a, self.b, ordered=False))
+        self.assertFalse(equal(self.a, self.c, ordered=False))
+        # the equal hashes built while parsing end the walk at the top
+        self.assertTrue(equal(parse(XML_A, content_hash=True),
+                              parse(XML_A, content_hash=True)))
+        self.assertEqual(diff(parse(XML_A, content_hash=True),
+                              parse(XML_C, content_hash=True)),
+                         diff(self.a, self.c))
+
+    def test_moved(self):
+        report = diff(self.a, self.b, ordered=False)
+        self.assertEqual(report.moved, {
+            'bookstore.book.0': 'bookstore.book.1',
+            'bookstore.book.1': 'bookstore.book.0',
+        })
+        self.assertEqual((report.added, report.removed, report.changed),
+                         ([], [], {}))
+        report = diff(self.a, self.b)
+        self.assertEqual(report.changed['bookstore.book.0.title'],
+                         ('Everyday Italian', 'Harry Potter'))
+        self.assertEqual(report.changed['bookstore.book.1.@category'],
+                         ('children', 'cooking'))
+        self.assertEqual(report.moved, {})
+
+    def test_report(self):
+        report = diff(self.a, self.c)
+        self.assertEqual(report.added, [
+            'bookstore.@open',
+            'bookstore.book.1.isbn',
+            'bookstore.book.2',
+        ])
+        self.assertEqual(report.removed, ['bookstore.owner'])
+        self.assertEqual(report.changed, {
+            'bookstore.@name': ('central', 'corner'),
+            'bookstore.book.0.price': ('30.00', '35.00'),
+        })
+        self.assertEqual(json.loads(json.dumps(report._asdict()))['removed'],
+                         ['bookstore.owner'])
+
+    def test_comparer(self):
+        self.assertFalse(Comparer(XML_A, XML_B).compare())
+        self.assertTrue(Comparer(XML_A, XML_B).compare(ordered=False))
+        self.assertFalse(Comparer(XML_A, XML_C).equal())
+        # only the leaf values unless asked for the attributes
+        self.assertTrue(Comparer('<a id="1"/>', '<a id="2"/>').compare())
+        self.assertFalse(Comparer('<a id="1"/>', '<a id="2"/>').compare(
+            attributes=True))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from xmapper.incremental import IncrementalDocument
+from xmapper.utils import Node, parse
+
+
+XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<listing>
+  <header><date>1</date></header>
+  <ad id="1">
+    <price>10</price>
+    <!-- kept by dump -->
+  </ad>
+  <ad id="2" note="a>b"><price>20</price></ad>
+  <ad id="3"/>
+</listing>
+"""
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'feed.xml')
+        self.out = os.path.join(self.tmp.name, 'out.xml')
+        self.write(XML)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        # a new mtime even on a coarse clock
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns,
+                                stat.st_mtime_ns + 10 ** 9))
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_load_dump(self):
+        doc = IncrementalDocument(self.path, 'listing.ad')
+        self.assertEqual(doc.root.value_mapping,
+                         parse(XML.decode()).value_mapping)
+        self.assertEqual([XML[s.start:s.end][:8] for s in doc.spans],
+                         [b'<ad id="'] * 3)
+        self.assertEqual(doc.dump(self.out),
+                         {'copied': 3, 'written': 0, 'full': False})
+        self.assertEqual(self.read(self.out), XML)
+
+        doc.root.set_value_by_path('listing.ad.1.price', '21')
+        doc.root.listing.add_child(Node('ad', {'id': '4'}))
+        doc.root.listing.build_position()
+        self.assertEqual(doc.dump(self.out),
+                         {'copied': 2, 'written': 2, 'full': False})
+        out = self.read(self.out)
+        self.assertIn(b'<!-- kept by dump -->', out)
+        self.assertEqual(
+            parse(out.decode()).value_mapping['listing.ad.1.price'], '21')
+
+        # changed outside the records
+        doc.root.set_value_by_path('listing.header.date', '2')
+        self.assertTrue(doc.dump(self.out)['full'])
+        self.assertEqual(parse(self.out).value_mapping,
+                         doc.root.value_mapping)
+
+    def test_refresh(self):
+        doc = IncrementalDocument(self.path, 'listing.ad')
+        first = doc.root.listing.ad[0]
+        self.write(XML.replace(b'<price>20', b'<price>22').replace(
+            b'<ad id="3"/>', b'<ad id="3"/>\n  <ad id="4"/>'))
+        self.assertEqual(doc.refresh(),
+                         {'records': 4, 'parsed': 2, 'full': False})
+        self.assertIs(doc.root.listing.ad[0], first)
+        self.assertEqual([ad['id'] for ad in doc.root.listing.ad],
+                         ['1', '2', '3', '4'])
+        self.assertEqual(doc.root.get_value_by_path('listing.ad.1.price'),
+                         '22')
+        self.assertEqual(doc.dump(self.out)['copied'], 4)
+        self.assertEqual(self.read(self.out), self.read(self.path))
+
+        self.write(XML.replace(b'<date>1', b'<date>2'))
+        self.assertTrue(doc.refresh()['full'])
+        self.assertEqual(doc.root.get_value_by_path('listing.header.date'),
+                         '2')
+        self.assertEqual(doc.refresh()['parsed'], 0)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from xmapper import MultiMapper
+from xmapper.inference import infer_candidates
+
+
+INPUT = """<listing><ad>
+    <type>{type}</type>
+    <category>{category}</category>
+    <listingId>{id}</listingId>
+    <priority>high</priority>
+</ad></listing>"""
+
+OUTPUT = """<property>
+    <id>{id}</id>
+    <type>{type}</type>
+    <propertyType>{property_type}</propertyType>
+    <salePriority>{priority}</salePriority>
+</property>"""
+
+
+def make_pair(idx, type, category, property_type, priority='high'):
+    return (INPUT.format(type=type, category=category, id=idx),
+            OUTPUT.format(type=type, id=idx, property_type=property_type,
+                          priority=priority))
+
+
+class TestInference(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = [make_pair(1, 'house', 'house', 'house'),
+                      make_pair(2, 'unit', 'residential', 'apartment'),
+                      make_pair(3, 'land', 'land', 'land', priority='')]
+
+    def test_infer_candidates(self):
+        # one pair can not tell type from category
+        inference = infer_candidates(self.pairs[:1], jobs=1)
+        self.assertEqual(inference.candidates['property.type'],
+                         {'listing.ad.type', 'listing.ad.category'})
+        inference = infer_candidates(self.pairs, jobs=1, skip=('',))
+        self.assertEqual(inference.candidates, {
+            'property.id': {'listing.ad.listingId'},
+            'property.type': {'listing.ad.type'},
+            'property.propertyType': set(),
+            'property.salePriority': {'listing.ad.priority'},
+        })
+        self.assertEqual(inference.samples['property.propertyType'], 'house')
+        self.assertEqual(inference.errors, {})
+
+    def test_multi_mapper(self):
+        pairs = self.pairs + [('<listing>', OUTPUT)]
+        mapper = MultiMapper(pairs, jobs=2)
+        mapper.build_mapping()
+        self.assertEqual(mapper.MAPPER['exact_match'], {
+            'property.id': 'listing.ad.listingId',
+            'property.type': 'listing.ad.type',
+            'property.salePriority': 'listing.ad.priority',
+        })
+        self.assertEqual(mapper.MAPPER['human_intervention'],
+                         {'property.propertyType': 'house'})
+        self.assertEqual(list(mapper.errors), [3])
+        # the same sections as the config of a Mapper
+        self.assertEqual(mapper.MAPPER['scored_match'], {})
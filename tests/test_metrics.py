@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import json
+import tracemalloc
+import unittest
+
+from xmapper import Transformer, collect
+from xmapper.metrics import to_prometheus
+from xmapper.utils import BaseNode, CachedProperty, dump_str, parse
+
+
+INPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad id="7">
+        <listingId>353324</listingId>
+        <type>Café</type>
+    </ad>
+</listing>"""
+
+TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id></id>
+    <kind></kind>
+</property>"""
+
+RULES = {'exact_match': {'property.id': 'listing.ad.listingId',
+                         'property.kind': 'listing.ad.type'}}
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_nested_memory(self):
+        with collect('outer', memory=True) as outer:
+            big = bytes(8 << 20)
+            del big
+            with collect('inner', memory=True) as inner:
+                small = bytes(1 << 20)
+                del small
+        # the inner block does not reset the peak of the outer one
+        self.assertGreaterEqual(outer.peak_bytes, 8 << 20)
+        self.assertGreaterEqual(inner.peak_bytes, 1 << 20)
+        if hasattr(tracemalloc, 'reset_peak'):
+            self.assertLess(inner.peak_bytes, 8 << 20)
+
+    def test_collect(self):
+        transformer = Transformer(RULES, TEMPLATE)
+        reported = []
+        get_value_by_path = BaseNode.get_value_by_path
+        cached_get = CachedProperty.__get__
+        with collect('all') as outer:
+            with collect('input.xml', memory=True,
+                         callback=reported.append) as metrics:
+                self.assertIsNot(BaseNode.get_value_by_path,
+                                 get_value_by_path)
+                output = transformer.transform(INPUT)
+                dump_str(output)
+                obj = parse(INPUT)
+                obj.value_mapping
+                obj.value_mapping
+            parse(INPUT)
+        # the hooks are gone after the last block
+        self.assertIs(BaseNode.get_value_by_path, get_value_by_path)
+        self.assertIs(CachedProperty.__get__, cached_get)
+        self.assertEqual(reported, [metrics])
+
+        self.assertEqual(metrics.stages['parse'][0], 2)
+        self.assertEqual(metrics.stages['transform'][0], 1)
+        self.assertEqual(metrics.stages['dump'][0], 1)
+        self.assertEqual(metrics.stages['dump.tree'][0], 1)
+        self.assertEqual(metrics.stages['value_mapping'][0], 2)
+        self.assertEqual(metrics.stages['paths'][0], 1)
+        self.assertEqual(outer.stages['parse'][0], 3)
+        # listing, ad, listingId, type twice
+        self.assertEqual(metrics.counts['elements'], 8)
+        stack = [parse(INPUT)]
+        cdata = 0
+        while stack:
+            node = stack.pop()
+            cdata += len(node.cdata.encode('utf-8'))
+            stack.extend(node.children)
+        self.assertEqual(metrics.counts['cdata_bytes'], 2 * cdata)
+        self.assertEqual(metrics.counts['path_lookups'], 4)
+        self.assertGreater(metrics.counts['cache_hits'], 0)
+        self.assertGreater(metrics.counts['cache_misses'], 0)
+        self.assertGreater(metrics.peak_bytes, 0)
+        self.assertIsNone(outer.peak_bytes)
+
+        data = json.loads(metrics.to_json())
+        self.assertEqual(data[0]['document'], 'input.xml')
+        self.assertEqual(data[0]['stages']['parse']['calls'], 2)
+        self.assertEqual(data[0]['counts']['elements'], 8)
+
+        text = to_prometheus([metrics, outer])
+        self.assertIn('# TYPE xmapper_stage_seconds_total counter', text)
+        self.assertIn('xmapper_elements_total{document="input.xml"} 8',
+                      text)
+        self.assertIn('xmapper_stage_calls_total{document="all",'
+                      'stage="parse"} 3', text)
+        self.assertEqual(text.count('# TYPE xmapper_elements_total'), 1)
+
+    def test_disabled(self):
+        parse(INPUT).value_mapping
+        with collect() as metrics:
+            pass
+        self.assertEqual(metrics.stages, {})
+        self.assertEqual(sum(metrics.counts.values()), 0)
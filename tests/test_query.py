@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from xmapper.query import compile_query, select_values
+from xmapper.utils import iterparse, parse
+
+
+XML = """<?xml version='1.0' encoding='UTF-8'?>
+<export>
+    <listings>
+        <ad id="1" status="active">
+            <images><image>a</image><image>b</image></images>
+            <ad id="9" status="active">
+                <images><image>n</image></images>
+            </ad>
+        </ad>
+        <ad id="2" status="sold">
+            <images><image>c</image></images>
+        </ad>
+        <ad id="3" status="active">
+            <images><image>d</image><image>e</image><image>f</image></images>
+        </ad>
+    </listings>
+</export>"""
+
+
+class TestQuery(unittest.TestCase):
+
+    def test_select(self):
+        obj = parse(XML)
+        expected = {
+            "export.listings.ad[@status='active'].images.image":
+                ['a', 'b', 'd', 'e', 'f'],
+            "**.ad[@status='active'].images.image":
+                ['a', 'b', 'n', 'd', 'e', 'f'],
+            "**.ad[@status!='sold'].images.image[0:2]":
+                ['a', 'b', 'n', 'd', 'e'],
+            'export.listings.ad.1.images.image': ['c'],
+            'export.listings.ad[-1].images.image.1': ['e'],
+            'export.*.*.@id': ['1', '2', '3'],
+            '**.image': ['a', 'b', 'n', 'c', 'd', 'e', 'f'],
+            '**.**.image': ['a', 'b', 'n', 'c', 'd', 'e', 'f'],
+            '**.ad[@id="9"].@status': ['active'],
+            'export.listings.ad[@missing]': [],
+        }
+        for query, values in expected.items():
+            self.assertEqual(list(obj.select_values(query)), values, query)
+        # the same results from the indexes
+        obj.path_index
+        obj.tag_index
+        for query, values in expected.items():
+            self.assertEqual(list(select_values(obj, query)), values, query)
+
+        self.assertEqual([ad['id'] for ad in obj.select('**.ad')],
+                         ['1', '9', '2', '3'])
+        self.assertIs(compile_query('**.ad'), compile_query('**.ad'))
+
+    def test_records(self):
+        query = compile_query('images.image')
+        records = iterparse(XML, 'export.listings.ad')
+        self.assertEqual(list(query.iter_records(records, values=True)),
+                         ['a', 'b', 'c', 'd', 'e', 'f'])
+
+    def test_invalid(self):
+        for query in ('', 'a..b', 'a[@x=1]', 'a.@b.c', '0', '**.1',
+                      'a[x]', 'a[1-2]'):
+            with self.assertRaises(ValueError):
+                compile_query(query)
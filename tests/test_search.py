@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from xmapper import Mapper
+from xmapper.search import ValueIndex, normalize_number
+
+
+INPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad>
+        <type>house</type>
+        <price>30.00</price>
+        <title>Sunny   Villa</title>
+        <url>https://img.example.com/a%20b.jpg</url>
+        <agent>John Smith</agent>
+    </ad>
+</listing>"""
+
+OUTPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <category>house</category>
+    <price>30</price>
+    <headline>sunny villa</headline>
+    <image>https://img.example.com/a b.jpg</image>
+    <contact>Jon Smith</contact>
+    <note>unrelated</note>
+</property>"""
+
+
+class TestValueIndex(unittest.TestCase):
+
+    def test_normalize_number(self):
+        self.assertEqual(normalize_number('30.00'), '30')
+        self.assertEqual(normalize_number('3E1'), '30')
+        self.assertEqual(normalize_number('0.50'), '0.5')
+        self.assertEqual(normalize_number('house'), 'house')
+
+    def test_search(self):
+        index = ValueIndex({'a.b': 'Hello  World', 'a.c': '30.00',
+                            'a.d': 'Hello Word', 'a.e': 'bye'})
+        self.assertEqual(index.search('30.00'), [('a.c', 1.0)])
+        self.assertEqual(index.search('30'), [('a.c', 0.9)])
+        self.assertEqual(index.search('hello world'), [('a.b', 0.9)])
+        candidates = index.search('Hello Worlds')
+        self.assertEqual([path for path, _ in candidates], ['a.b', 'a.d'])
+        self.assertTrue(0.5 < candidates[1][1] < candidates[0][1] < 0.8)
+        self.assertEqual(index.search('nothing alike'), [])
+
+    def test_custom_normalizers(self):
+        index = ValueIndex({'a.b': 'ABC'}, normalizers=[str.lower])
+        self.assertEqual(index.search('abc'), [('a.b', 0.9)])
+        # without normalize_space a blank only matches by its n-grams
+        self.assertEqual(index.search('abc ')[0][0], 'a.b')
+        self.assertLess(index.search('abc ')[0][1], 0.8)
+
+    def test_mapper_scored_match(self):
+        mapper = Mapper(INPUT, OUTPUT)
+        mapper.build_mapping()
+        self.assertEqual(mapper.MAPPER['exact_match'],
+                         {'property.category': 'listing.ad.type'})
+        scored = mapper.MAPPER['scored_match']
+        self.assertEqual(scored['property.price'],
+                         [{'path': 'listing.ad.price', 'score': 0.9}])
+        self.assertEqual(scored['property.headline'],
+                         [{'path': 'listing.ad.title', 'score': 0.9}])
+        self.assertEqual(scored['property.image'],
+                         [{'path': 'listing.ad.url', 'score': 0.9}])
+        self.assertEqual(scored['property.contact'][0]['path'],
+                         'listing.ad.agent')
+        self.assertEqual(mapper.MAPPER['human_intervention'],
+                         {'property.note': 'unrelated'})
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from http.client import HTTPConnection
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import yaml
+
+from xmapper import Transformer
+from xmapper.serve import ConversionService, UnixHTTPConnection, make_server
+from xmapper.utils import dump_str, parse
+
+
+RULES = {'exact_match': {'property.id': 'listing.ad.listingId',
+                         'property.type': 'listing.ad.type'}}
+
+RECORD_RULES = {'exact_match': {'property.id': 'listing.ad.0.listingId',
+                                'property.type': 'listing.ad.0.type'}}
+
+TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id></id>
+    <type></type>
+</property>"""
+
+INPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad>
+        <listingId>353324</listingId>
+        <type>Café</type>
+    </ad>
+</listing>"""
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad><listingId>1</listingId><type>house</type></ad>
+    <ad><listingId>2</listingId><type>unit</type></ad>
+</listing>"""
+
+
+class TestServe(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for name, content in (('map.yaml', yaml.safe_dump(RULES)),
+                              ('records.yaml', yaml.safe_dump(RECORD_RULES)),
+                              ('template.xml', TEMPLATE),
+                              ('input.xml', INPUT), ('feed.xml', FEED)):
+            with open(os.path.join(self.tmp.name, name), 'w') as f:
+                f.write(content)
+        self.service = ConversionService(self.tmp.name, 'map.yaml',
+                                         'template.xml', workers=2,
+                                         max_pending=0)
+        self.servers = []
+
+    def tearDown(self):
+        for server, thread in self.servers:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.tmp.cleanup()
+
+    def start(self, **kwargs):
+        server = make_server(self.service, port=0, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.servers.append((server, thread))
+        return server
+
+    def request(self, connection, method, path, body=None):
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, response.read().decode('utf-8')
+
+    def test_convert(self):
+        server = self.start()
+        connection = HTTPConnection('127.0.0.1', server.server_address[1])
+        expected = dump_str(Transformer(RULES, TEMPLATE).transform(INPUT))
+        # the same connection is kept alive between the requests
+        for _ in range(3):
+            status, text = self.request(connection, 'POST', '/convert',
+                                        INPUT.encode('utf-8'))
+            self.assertEqual((status, text), (200, expected))
+        status, text = self.request(connection, 'POST',
+                                    '/convert?source=input.xml')
+        self.assertEqual((status, text), (200, expected))
+        stats = json.loads(self.request(connection, 'GET', '/stats')[1])
+        self.assertEqual(stats['transformers']['misses'], 1)
+        self.assertEqual(stats['transformers']['hits'], 3)
+        self.assertEqual(stats['requests'], 4)
+
+        status, text = self.request(
+            connection, 'POST',
+            '/convert?source=feed.xml&record_path=listing.ad'
+            '&rules=records.yaml&wrapper=properties')
+        self.assertEqual(status, 200)
+        outputs = parse(text)
+        self.assertEqual(outputs.value_mapping, {
+            'properties.property.0.id': '1',
+            'properties.property.0.type': 'house',
+            'properties.property.1.id': '2',
+            'properties.property.1.type': 'unit'})
+
+        for path, body, expected_status in (
+                ('/convert', b'<listing><ad>', 400),
+                ('/convert?record_path=listing.ad&rules=records.yaml',
+                 b'<listing><ad><id>1</id></ad><ad>', 400),
+                ('/convert?source=missing.xml', None, 404),
+                ('/convert?source=../input.xml', None, 403),
+                ('/convert?rules=missing.yaml', INPUT.encode(), 404),
+                ('/convert', None, 400),
+                ('/other', None, 404)):
+            status, text = self.request(connection, 'POST', path, body)
+            self.assertEqual(status, expected_status, (path, text))
+        connection.close()
+
+    def test_busy_and_unix_socket(self):
+        path = os.path.join(self.tmp.name, 'xmapper.sock')
+        self.start(socket_path=path)
+        connection = UnixHTTPConnection(path)
+        self.service.acquire()
+        self.service.acquire()
+        try:
+            status, text = self.request(connection, 'POST', '/convert',
+                                        INPUT.encode('utf-8'))
+            self.assertEqual(status, 503)
+        finally:
+            self.service.release()
+            self.service.release()
+        status, text = self.request(connection, 'POST', '/convert',
+                                    INPUT.encode('utf-8'))
+        self.assertEqual(status, 200)
+        self.assertEqual(parse(text).value_mapping,
+                         {'property.id': '353324', 'property.type': 'Café'})
+        connection.close()
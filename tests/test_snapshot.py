@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from xmapper.snapshot import (LazyNode, SnapshotCache, load_snapshot,
+                              save_snapshot, set_default_cache)
+from xmapper.utils import CompactNode, Node, dump_str, parse
+
+
+XML = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad id="1" status="active">
+        <type>Café</type>
+        <images>
+            <image>a.jpg</image>
+            <image>b.jpg</image>
+        </images>
+        <my-tag.name>x</my-tag.name>
+        <empty/>
+    </ad>
+    <ad id="2">
+        <type>unit</type>
+    </ad>
+</listing>"""
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'listing.xsnap')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameTree(self, obj, expected):
+        self.assertEqual(obj.value_mapping, expected.value_mapping)
+        self.assertEqual(obj.attr_mapping, expected.attr_mapping)
+        self.assertEqual(obj.all_paths, expected.all_paths)
+        self.assertEqual(obj.content_hash, expected.content_hash)
+        self.assertEqual(dump_str(obj), dump_str(expected))
+
+    def test_save_load(self):
+        expected = parse(XML)
+        save_snapshot(expected, self.path)
+
+        lazy = load_snapshot(self.path)
+        self.assertIsInstance(lazy, LazyNode)
+        ad = lazy.listing.ad[0]
+        self.assertEqual(ad['status'], 'active')
+        self.assertEqual(ad.images.image[1].cdata, 'b.jpg')
+        self.assertEqual(ad.images.image[1].position, '1')
+        self.assertEqual(lazy.listing.ad[1].type.cdata, 'unit')
+        self.assertSameTree(lazy, expected)
+
+        compact = load_snapshot(self.path, lazy=False)
+        self.assertIs(type(compact), CompactNode)
+        self.assertIsInstance(compact.listing.ad[0].children, tuple)
+        self.assertSameTree(compact, expected)
+
+        obj = load_snapshot(self.path, mode='rw')
+        self.assertIsInstance(obj, Node)
+        self.assertSameTree(obj, expected)
+        obj.set_value_by_path('listing.ad.1.type', 'house')
+        self.assertEqual(obj.get_value_by_path('listing.ad.1.type'), 'house')
+        self.assertEqual(obj.listing.ad[1].type.cdata, 'house')
+
+        # a subtree
+        save_snapshot(expected.listing.ad[0], self.path)
+        sub = load_snapshot(self.path, lazy=False)
+        self.assertEqual(sub._name, 'ad')
+        self.assertEqual(sub.value_mapping,
+                         expected.listing.ad[0].value_mapping)
+
+        with open(self.path, 'wb') as f:
+            f.write(b'<xml/>')
+        with self.assertRaises(ValueError):
+            load_snapshot(self.path)
+
+    def test_cache(self):
+        cache = SnapshotCache(self.tmp.name)
+        with open(os.path.join(self.tmp.name, 'listing.xml'), 'w') as f:
+            f.write(XML)
+        source = os.path.join(self.tmp.name, 'listing.xml')
+        expected = parse(source)
+        for mode, compact in (('rw', False), ('r', True), ('rw', False)):
+            obj = parse(source, mode=mode, compact=compact, cache=cache)
+            self.assertSameTree(obj, expected)
+        snapshot = cache.path(cache.key(source))
+        self.assertTrue(os.path.exists(snapshot))
+        self.assertEqual(cache.key(XML.encode('utf-8')), cache.key(source))
+        # the encoding declaration does not apply to a string
+        self.assertNotEqual(cache.key(XML), cache.key(source))
+        latin = ('<?xml version="1.0" encoding="ISO-8859-1"?>'
+                 '<a>\u00e9</a>')
+        self.assertEqual(parse(latin, cache=cache).a.cdata, '\u00e9')
+        self.assertEqual(parse(latin.encode('utf-8'), cache=cache).a.cdata,
+                         '\u00c3\u00a9')
+        self.assertIsInstance(parse(XML.encode('utf-8'), mode='r',
+                                    compact=True, cache=self.tmp.name),
+                              LazyNode)
+
+        # another content is another snapshot
+        with open(source, 'w') as f:
+            f.write(XML.replace('unit', 'villa'))
+        obj = parse(source, cache=cache, tag_index=True)
+        self.assertEqual(obj.get_value_by_path('listing.ad.1.type'), 'villa')
+        self.assertEqual(len(list(obj.iter_by_tag('ad'))), 2)
+
+        # a broken snapshot is parsed again
+        with open(snapshot, 'wb') as f:
+            f.write(b'broken')
+        self.assertSameTree(parse(XML.encode('utf-8'), cache=cache),
+                            expected)
+
+        set_default_cache(cache)
+        try:
+            self.assertIsInstance(parse(XML.encode('utf-8'), mode='r',
+                                        compact=True), LazyNode)
+            self.assertIs(type(parse(XML, mode='r', compact=True,
+                                     cache=False)), CompactNode)
+        finally:
+            set_default_cache(None)
+        self.assertIs(type(parse(XML, mode='r', compact=True)), CompactNode)
+        cache.clear()
+        self.assertFalse(os.path.exists(snapshot))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from xmapper import Mapper, Transformer
+
+
+INPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad id="7">
+        <type>house</type>
+        <listingId>353324</listingId>
+        <priority>high</priority>
+        <url>https://img.599245196.jpg</url>
+    </ad>
+</listing>"""
+
+OUTPUT = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id>353324</id>
+    <salePriority>high</salePriority>
+    <image>https://img.599245196.jpg</image>
+</property>"""
+
+TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id></id>
+    <salePriority></salePriority>
+    <image></image>
+</property>"""
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<listing>
+    <ad id="1">
+        <listingId>1</listingId>
+        <priority>low</priority>
+        <url>a.jpg</url>
+    </ad>
+    <ad id="2">
+        <listingId>2</listingId>
+        <priority>high</priority>
+        <url>b.jpg</url>
+    </ad>
+</listing>"""
+
+
+class TestTransformer(unittest.TestCase):
+
+    def test_transform_from_yaml(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rules = os.path.join(tmp, 'map.yaml')
+            Mapper(INPUT, OUTPUT).dump_yaml_config(rules)
+            transformer = Transformer(rules, TEMPLATE)
+        output = transformer.transform(INPUT)
+        self.assertEqual(output.value_mapping, {
+            'property.id': '353324',
+            'property.salePriority': 'high',
+            'property.image': 'https://img.599245196.jpg'
+        })
+        # the template is copied, not changed
+        self.assertEqual(transformer.template.get_value_by_path(
+            'property.id'), '')
+
+    def test_transform_records(self):
+        rules = {'exact_match': {
+            'property.id': 'listing.ad.0.listingId',
+            'property.salePriority': 'listing.ad.0.priority',
+            'property.image': 'listing.ad.0.url',
+            'property.@ref': 'listing.ad.0.@id'
+        }}
+        transformer = Transformer(rules, TEMPLATE)
+        outputs = list(transformer.transform_records(FEED, 'listing.ad'))
+        self.assertEqual(
+            [o.get_value_by_path('property.id') for o in outputs],
+            ['1', '2']
+        )
+        self.assertEqual(
+            [o.get_value_by_path('property.@ref') for o in outputs],
+            ['1', '2']
+        )
+        self.assertEqual(
+            transformer.transform(FEED).get_value_by_path(
+                'property.salePriority'),
+            'low'
+        )
+
+    def test_unknown_output_path(self):
+        transformer = Transformer(
+            {'exact_match': {'property.price': 'listing.ad.price'}},
+            TEMPLATE)
+        self.assertRaises(ValueError, transformer.transform, INPUT)
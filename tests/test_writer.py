@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import gzip
+import lzma
+from io import BytesIO
+import os
+import tempfile
+import unittest
+
+from xmapper import Transformer, XmlStreamWriter
+from xmapper.utils import dump_xml, parse
+
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<listing version="2" note="a &quot;b&quot;">
+    <ad id="1">
+        <type>Café</type>
+        <my-tag.name>x</my-tag.name>
+        <description>line one
+    line two</description>
+        <images>
+            <image>a.jpg</image>
+            <image>b &amp; c.jpg</image>
+        </images>
+        <empty/>
+        <mixed>some <b>bold</b> text</mixed>
+    </ad>
+    <ad id="2"><type>unit</type></ad>
+</listing>"""
+
+TEMPLATE = """<?xml version='1.0' encoding='UTF-8'?>
+<property>
+    <id></id>
+    <type></type>
+</property>"""
+
+
+class TestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, name, opener=open):
+        with opener(os.path.join(self.tmp.name, name), 'rb') as f:
+            return f.read()
+
+    def test_same_as_dump_xml(self):
+        obj = parse(FEED)
+        dump_xml(obj, os.path.join(self.tmp.name, 'expected.xml'))
+        expected = self.read('expected.xml')
+        attributes = obj.listing._attributes
+        for name, opener in (('out.xml', open), ('out.xml.gz', gzip.open)):
+            with XmlStreamWriter(os.path.join(self.tmp.name, name),
+                                 'listing', attributes) as writer:
+                for ad in obj.listing.ad:
+                    writer.write(ad)
+            self.assertEqual(self.read(name, opener), expected)
+            self.assertEqual(writer.count, 2)
+
+        buffer = BytesIO()
+        with XmlStreamWriter(buffer, 'listing', attributes) as writer:
+            writer.write_many(parse(FEED).listing.ad)
+        self.assertEqual(buffer.getvalue(), expected)
+        self.assertFalse(buffer.closed)
+        with self.assertRaises(ValueError):
+            writer.write(obj.listing.ad[0])
+
+        dump_xml(parse('<listing/>'), os.path.join(self.tmp.name, 'e.xml'))
+        buffer = BytesIO()
+        XmlStreamWriter(buffer, 'listing').close()
+        self.assertEqual(buffer.getvalue(), self.read('e.xml'))
+
+    def test_transform_records(self):
+        rules = {'exact_match': {'property.id': 'listing.ad.0.@id',
+                                 'property.type': 'listing.ad.0.type'}}
+        transformer = Transformer(rules, TEMPLATE)
+        buffer = BytesIO()
+        with XmlStreamWriter(buffer, 'property_list',
+                             compression='xz') as writer:
+            writer.write_many(transformer.transform_records(FEED,
+                                                            'listing.ad'))
+        output = parse(lzma.decompress(buffer.getvalue()))
+        self.assertEqual(output.value_mapping, {
+            'property_list.property.0.id': '1',
+            'property_list.property.0.type': 'Café',
+            'property_list.property.1.id': '2',
+            'property_list.property.1.type': 'unit'})
+        with self.assertRaises(ValueError):
+            XmlStreamWriter(buffer, 'a', compression='zip')
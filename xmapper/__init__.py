@@ -2,38 +2,69 @@ import pprint
 import yaml
 
 from xmapper.utils import parse
+from xmapper.writer import XmlStreamWriter
+from xmapper.aio import aparse, aparse_many
+from xmapper.columns import to_columns
+from xmapper.diff import diff, equal
+from xmapper.inference import infer_candidates
+from xmapper.metrics import collect, stage
+from xmapper.query import compile_query
+from xmapper.search import ValueIndex
+from xmapper.transformer import Transformer
 
 
 _SKIP_SEARCH = ['', 'null']
 
 
+def _default_mapping():
+    """
+    :return: the empty MAPPER, the sections of the yaml config
+    """
+    return {
+        'exact_match': {},
+        'multiple_match': {},
+        'scored_match': {},
+        'human_intervention': {}
+    }
+
+
 class Mapper(object):
-    def __init__(self, input, output):
+    def __init__(self, input, output, normalizers=None):
         self.input_obj = parse(input)
         self.output_obj = parse(output)
+        self.normalizers = normalizers
 
         # default mapping format
-        self.MAPPER = {
-            'exact_match': {},
-            'multiple_match': {},
-            'human_intervention': {}
-        }
+        self.MAPPER = _default_mapping()
 
+    @stage('build_mapping')
     def build_mapping(self):
         # not search the items with value '' or null etc
         needles = {k: v for k, v in self.output_obj.value_mapping.items()
                    if v not in _SKIP_SEARCH}
 
-        haystack = {k: v for k, v in self.input_obj.search_mapping.items()
-                    if k not in _SKIP_SEARCH}
+        haystack = {k: v for k, v in self.input_obj.value_mapping.items()
+                    if v not in _SKIP_SEARCH}
+        if self.normalizers is None:
+            index = ValueIndex(haystack)
+        else:
+            index = ValueIndex(haystack, self.normalizers)
 
         # search and build the MAPPER
         for k, v in needles.items():
-            if v in haystack:
-                if len(haystack[v]) == 1:
-                    self.MAPPER['exact_match'][k] = haystack[v][0]
+            if v in index.exact:
+                paths = index.exact[v]
+                if len(paths) == 1:
+                    self.MAPPER['exact_match'][k] = paths[0]
                 else:
-                    self.MAPPER['multiple_match'][k] = haystack[v]
+                    self.MAPPER['multiple_match'][k] = paths
+                continue
+            # near matches, ranked candidates for the review
+            candidates = index.search(v)
+            if candidates:
+                self.MAPPER['scored_match'][k] = [
+                    {'path': path, 'score': score}
+                    for path, score in candidates]
             else:
                 self.MAPPER['human_intervention'][k] = v
         pprint.pprint(self.MAPPER)
@@ -50,6 +81,36 @@ class Mapper(object):
                       indent=4, Dumper=noalias_dumper)
 
 
+class MultiMapper(Mapper):
+    """
+    infers the rules from many sample (input, output) pairs, a
+    multiple_match of one pair is resolved by the pairs where the
+    candidate paths hold different values
+    """
+    def __init__(self, pairs, jobs=None):
+        self.pairs = pairs
+        self.jobs = jobs
+        self.errors = {}
+
+        # default mapping format
+        self.MAPPER = _default_mapping()
+
+    @stage('build_mapping')
+    def build_mapping(self):
+        inference = infer_candidates(self.pairs, self.jobs, _SKIP_SEARCH)
+        self.errors = inference.errors
+        for k, paths in inference.candidates.items():
+            if len(paths) == 1:
+                self.MAPPER['exact_match'][k] = next(iter(paths))
+            elif paths:
+                self.MAPPER['multiple_match'][k] = sorted(paths)
+            else:
+                self.MAPPER['human_intervention'][k] = inference.samples[k]
+        for idx, error in sorted(self.errors.items()):
+            print('pair {} skipped: {}'.format(idx, error))
+        pprint.pprint(self.MAPPER)
+
+
 class Comparer(object):
     """
     simple object comparer for local test
@@ -58,15 +119,34 @@ class Comparer(object):
         self.obj_file_one = parse(file_one)
         self.obj_file_two = parse(file_two)
 
-    def compare(self):
-        match = True
-        if self.obj_file_one.paths != self.obj_file_two.paths:
-            print('Your input xmls have different structure, pls check')
-            match = False
+    def diff(self, ordered=True):
+        """
+        :return: DiffReport of the two files, see xmapper.diff.diff
+        """
+        return diff(self.obj_file_one, self.obj_file_two, ordered)
+
+    def equal(self, ordered=True):
+        return equal(self.obj_file_one, self.obj_file_two, ordered)
+
+    def compare(self, ordered=True, attributes=False):
+        """
+        print the differences of the leaf values
+        :param attributes: compare the attributes as well
+        :return: True if there is none
+        """
+        report = self.diff(ordered)
+        if attributes:
+            removed, added, changed = (report.removed, report.added,
+                                       report.changed)
         else:
-            for path in self.obj_file_one.paths:
-                if self.obj_file_one.get_value_by_path(path) \
-                        != self.obj_file_two.get_value_by_path(path):
-                    print('mismatch found for path: {}'.format(path))
-                    match = False
-        return match
+            removed = [p for p in report.removed if '@' not in p]
+            added = [p for p in report.added if '@' not in p]
+            changed = {p: v for p, v in report.changed.items()
+                       if '@' not in p}
+        for path in removed:
+            print('only in the first xml: {}'.format(path))
+        for path in added:
+            print('only in the second xml: {}'.format(path))
+        for path in sorted(changed):
+            print('mismatch found for path: {}'.format(path))
+        return not (removed or added or changed)
@@ -0,0 +1,6 @@
+import sys
+
+from xmapper.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+asyncio API to fetch and parse many remote feeds concurrently:
+
+    root = await aparse('https://partner.example.com/feed.xml')
+
+    async for url, root in aparse_many(urls, concurrency=16):
+        ...
+
+The response bytes are fed to an incremental parser as they arrive,
+the parsing itself runs in an executor (the default thread pool of the
+loop) so the event loop keeps downloading the other feeds.
+"""
+import asyncio
+import bz2
+from email.parser import Parser
+from functools import partial
+import lzma
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from xml.sax import make_parser, handler
+import zlib
+
+from xmapper.utils import CompactNode, Handler, Node, is_url, parse
+
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+
+# get_event_loop returns the running loop in a coroutine on python 3.6
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+# magic bytes of the compressed bodies and their decompressor
+_DECOMPRESSORS = ((b'\x1f\x8b', partial(zlib.decompressobj, 31)),
+                  (b'BZh', bz2.BZ2Decompressor),
+                  (b'\xfd7zXZ\x00', lzma.LZMADecompressor))
+
+
+async def _request(url, timeout=None, max_redirects=5):
+    """
+    GET url with HTTP/1.1 over asyncio streams, following redirects
+    :param timeout: seconds to wait for the connection and every line
+        of the head
+    :return: (StreamReader, StreamWriter, headers)
+    """
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        secure = parts.scheme == 'https'
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            parts.hostname, parts.port or (443 if secure else 80),
+            ssl=True if secure else None), timeout)
+        target = parts.path or '/'
+        if parts.query:
+            target = target + '?' + parts.query
+        # the netloc may hold user:password@
+        host = parts.hostname
+        if ':' in host:
+            host = '[' + host + ']'
+        if parts.port:
+            host = '{}:{}'.format(host, parts.port)
+        writer.write(
+            'GET {} HTTP/1.1\r\nHost: {}\r\nUser-Agent: xmapper\r\n'
+            'Accept-Encoding: gzip\r\nConnection: close\r\n\r\n'.format(
+                target, host).encode('latin-1'))
+        try:
+            status_line = (await asyncio.wait_for(
+                reader.readline(), timeout)).decode('latin-1')
+            lines = []
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                lines.append(line.decode('latin-1'))
+        except BaseException:
+            writer.close()
+            raise
+        headers = Parser().parsestr(''.join(lines), headersonly=True)
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            writer.close()
+            raise ValueError('invalid HTTP response from {}: {!r}'.format(
+                url, status_line))
+        if status in _REDIRECTS and headers.get('Location'):
+            writer.close()
+            url = urljoin(url, headers['Location'])
+            continue
+        if status != 200:
+            writer.close()
+            raise HTTPError(url, status, status_line.strip(), headers, None)
+        return reader, writer, headers
+    raise HTTPError(url, status, 'too many redirects', headers, None)
+
+
+async def _read_body(reader, headers, chunk_size, timeout=None):
+    """
+    iterate the body of the response as it arrives, with chunked
+    transfer encoding, a content length or until the connection closes
+    :param timeout: seconds to wait for every read
+    """
+    def wait(awaitable):
+        return asyncio.wait_for(awaitable, timeout)
+
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        while True:
+            line = await wait(reader.readline())
+            size = int(line.split(b';')[0].strip() or b'0', 16)
+            if not size:
+                # the trailers up to the blank line
+                while (await wait(reader.readline())) not in (
+                        b'\r\n', b'\n', b''):
+                    pass
+                return
+            while size:
+                data = await wait(reader.read(min(size, chunk_size)))
+                if not data:
+                    raise ConnectionError('incomplete chunked response')
+                size -= len(data)
+                yield data
+            await wait(reader.readline())
+    length = headers.get('Content-Length')
+    remaining = int(length) if length is not None else None
+    while remaining is None or remaining > 0:
+        data = await wait(reader.read(chunk_size if remaining is None
+                                      else min(remaining, chunk_size)))
+        if not data:
+            if remaining:
+                raise ConnectionError('incomplete response')
+            return
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
+
+
+async def _decode(body, headers):
+    """
+    decompress the gzip content encoding and the compressed feeds
+    """
+    decompressor = None
+    if headers.get('Content-Encoding', '').lower() in ('gzip', 'x-gzip'):
+        decompressor = zlib.decompressobj(31)
+    first = True
+    async for data in body:
+        if first and decompressor is None:
+            for magic, factory in _DECOMPRESSORS:
+                if data.startswith(magic):
+                    decompressor = factory()
+        first = False
+        if decompressor is not None:
+            data = decompressor.decompress(data)
+        if data:
+            yield data
+
+
+async def aparse(url, mode='rw', compact=False, content_hash=False,
+                 executor=None, chunk_size=1 << 16, timeout=60,
+                 **parser_features):
+    """
+    fetch the url and parse it while the response arrives, see parse
+    for the arguments, anything else than an http(s) URL is parsed by
+    parse in the executor
+    :param executor: concurrent.futures executor of the parsing, None
+        for the default executor of the loop
+    :param timeout: seconds to wait for the connection and for every
+        read of the response, None waits forever, raises
+        asyncio.TimeoutError
+    :return: root Node
+    """
+    loop = _running_loop()
+    if not is_url(url):
+        return await loop.run_in_executor(executor, partial(
+            parse, url, mode=mode, compact=compact,
+            content_hash=content_hash, **parser_features))
+    if compact and mode != 'r':
+        raise ValueError("compact trees are read only, use mode='r'")
+    parser = make_parser()
+    for feature, value in parser_features.items():
+        parser.setFeature(getattr(handler, feature), value)
+    sax_handler = Handler(mode, CompactNode if compact else Node,
+                          content_hash)
+    parser.setContentHandler(sax_handler)
+
+    reader, writer, headers = await _request(url, timeout)
+    try:
+        # the next chunk is downloaded while the previous one is parsed
+        pending = None
+        async for data in _decode(_read_body(reader, headers, chunk_size,
+                                             timeout), headers):
+            if pending is not None:
+                await pending
+            pending = loop.run_in_executor(executor, parser.feed, data)
+        if pending is not None:
+            await pending
+    finally:
+        writer.close()
+    await loop.run_in_executor(executor, parser.close)
+    return sax_handler.root
+
+
+async def aparse_many(urls, concurrency=8, return_exceptions=False,
+                      **kwargs):
+    """
+    fetch and parse the urls with at most concurrency of them at a time
+    and yield (url, root Node) in the order they are done, see aparse
+    for the other arguments
+    :param return_exceptions: yield (url, exception) for the failed urls
+        instead of raising the first exception
+    """
+    urls = iter(urls)
+    done = asyncio.Queue()
+
+    async def worker():
+        for url in urls:
+            try:
+                result = await aparse(url, **kwargs)
+            except asyncio.CancelledError:
+                # an Exception up to python 3.7, the worker must stop
+                raise
+            except Exception as e:
+                result = e
+            await done.put((url, result))
+        await done.put(None)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    running = len(workers)
+    try:
+        while running:
+            item = await done.get()
+            if item is None:
+                running -= 1
+                continue
+            url, result = item
+            if isinstance(result, Exception) and not return_exceptions:
+                raise result
+            yield url, result
+    finally:
+        for task in workers:
+            task.cancel()
+        # let the reads waiting with a timeout be cancelled as well
+        await asyncio.gather(*workers, return_exceptions=True)
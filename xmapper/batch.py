@@ -0,0 +1,120 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from xmapper.transformer import Transformer
+from xmapper.utils import dump_xml
+
+
+BatchResult = namedtuple('BatchResult', ['converted', 'errors'])
+
+# (rules, template) -> (file stamps, Transformer) already loaded by this
+# process, the forked workers inherit them
+_TRANSFORMERS = {}
+
+
+def list_files(in_dir, suffix='.xml'):
+    """
+    :return: sorted paths relative to in_dir of the files ending with suffix
+    """
+    files = []
+    for dir_path, _, file_names in os.walk(in_dir):
+        for file_name in file_names:
+            if file_name.endswith(suffix):
+                files.append(os.path.relpath(
+                    os.path.join(dir_path, file_name), in_dir))
+    return sorted(files)
+
+
+def chunk_files(in_dir, files, chunk_bytes=1 << 20, max_files=256):
+    """
+    group the files into chunks of about chunk_bytes so the small
+    files share one round trip to the worker processes
+    :return: list of lists of files
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for name in files:
+        chunk.append(name)
+        size += os.path.getsize(os.path.join(in_dir, name))
+        if size >= chunk_bytes or len(chunk) >= max_files:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _get_transformer(rules, template):
+    # loaded again when a file changed, like ConversionService.transformer
+    key = (rules, template)
+    stamp = (_stamp(rules), _stamp(template))
+    entry = _TRANSFORMERS.get(key)
+    if entry is None or entry[0] != stamp:
+        entry = _TRANSFORMERS[key] = (stamp, Transformer(rules, template))
+    return entry[1]
+
+
+def convert_chunk(rules, template, in_dir, out_dir, files):
+    """
+    convert the files of one chunk, the rules and the template are
+    loaded once per process
+    :return: BatchResult of the chunk
+    """
+    transformer = _get_transformer(rules, template)
+    converted = []
+    errors = {}
+    for name in files:
+        try:
+            output = transformer.transform(os.path.join(in_dir, name))
+            out_path = os.path.join(out_dir, name)
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            dump_xml(output, out_path)
+        except Exception as e:
+            errors[name] = '{}: {}'.format(type(e).__name__, e)
+        else:
+            converted.append(name)
+    return BatchResult(converted, errors)
+
+
+def convert_files(rules, template, in_dir, out_dir, jobs=None,
+                  chunk_bytes=1 << 20, suffix='.xml'):
+    """
+    convert every file of in_dir with the same rules and write the
+    results with the same relative path into out_dir. A file which
+    can not be converted does not stop the others, its error is
+    collected in the result.
+    :param rules: yaml rule file path, see Transformer
+    :param template: output template file path
+    :param jobs: number of worker processes, None for all the cpus,
+        1 converts in this process
+    :param chunk_bytes: input bytes sent to a worker at a time
+    :return: BatchResult(converted file list, {file: error})
+    """
+    files = list_files(in_dir, suffix)
+    chunks = chunk_files(in_dir, files, chunk_bytes)
+    converted = []
+    errors = {}
+    if jobs == 1:
+        results = (convert_chunk(rules, template, in_dir, out_dir, chunk)
+                   for chunk in chunks)
+        for result in results:
+            converted += result.converted
+            errors.update(result.errors)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(convert_chunk, rules, template,
+                                       in_dir, out_dir, chunk)
+                       for chunk in chunks]
+            for future in futures:
+                result = future.result()
+                converted += result.converted
+                errors.update(result.errors)
+    return BatchResult(converted, errors)
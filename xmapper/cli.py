@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+
+from xmapper.batch import convert_files
+from xmapper.compare import compare_dirs
+from xmapper.serve import ConversionService, make_server
+
+
+def convert(args):
+    result = convert_files(args.rules, args.template, args.in_dir,
+                           args.out_dir, jobs=args.jobs)
+    for name, error in sorted(result.errors.items()):
+        print('{}: {}'.format(name, error), file=sys.stderr)
+    print('converted {} files, {} errors'.format(
+        len(result.converted), len(result.errors)))
+    return 1 if result.errors else 0
+
+
+def compare(args):
+    result = compare_dirs(args.old_dir, args.new_dir, cache=args.cache,
+                          jobs=args.jobs)
+    for name, error in sorted(result.errors.items()):
+        print('{}: {}'.format(name, error), file=sys.stderr)
+    for name, file_diff in sorted(result.different.items()):
+        print('{}: {} added, {} removed, {} changed paths'.format(
+            name, len(file_diff.added), len(file_diff.removed),
+            len(file_diff.changed)))
+    stats = result.stats
+    print('compared {compared} files: {identical} identical, '
+          '{different} different, {errors} errors, {only_old} only in '
+          'old, {only_new} only in new, {parsed} parsed, {cached} '
+          'cached'.format(**stats))
+    for path, count in stats['top_paths']:
+        print('{:>8} {}'.format(count, path))
+    if result.different or result.errors or result.only_old or \
+            result.only_new:
+        return 1
+    return 0
+
+
+def serve(args):
+    service = ConversionService(args.root, args.rules, args.template,
+                                workers=args.workers,
+                                max_pending=args.max_pending,
+                                cache_size=args.cache_size)
+    server = make_server(service, args.host, args.port, args.socket,
+                         verbose=args.verbose)
+    print('serving on {}'.format(args.socket or '{}:{}'.format(
+        args.host, server.server_address[1])), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='xmapper', description='Easy XML format converter')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser(
+        'convert', help='convert a directory of XML files')
+    command.add_argument('--rules', required=True,
+                         help='mapping rule yaml file')
+    command.add_argument('--template', required=True,
+                         help='output template XML file')
+    command.add_argument('--jobs', type=int, default=None,
+                         help='worker processes, default all the cpus')
+    command.add_argument('in_dir')
+    command.add_argument('out_dir')
+    command.set_defaults(func=convert)
+
+    command = commands.add_parser(
+        'compare-dirs', help='compare two directories of XML files')
+    command.add_argument('--cache', default=None,
+                         help='sqlite fingerprint cache file, kept '
+                              'between runs')
+    command.add_argument('--jobs', type=int, default=None,
+                         help='worker processes, default all the cpus')
+    command.add_argument('old_dir')
+    command.add_argument('new_dir')
+    command.set_defaults(func=compare)
+
+    command = commands.add_parser(
+        'serve', help='convert the documents posted over HTTP')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8080)
+    command.add_argument('--socket', default=None,
+                         help='listen on this unix socket instead')
+    command.add_argument('--root', default='.',
+                         help='the file paths of the requests must be '
+                              'below this directory')
+    command.add_argument('--rules', default=None,
+                         help='default mapping rule yaml file')
+    command.add_argument('--template', default=None,
+                         help='default output template XML file')
+    command.add_argument('--workers', type=int, default=os.cpu_count(),
+                         help='conversions running at a time, threads '
+                              'of one process')
+    command.add_argument('--max-pending', type=int, default=64,
+                         help='requests waiting for a worker')
+    command.add_argument('--cache-size', type=int, default=32,
+                         help='rule and template pairs kept loaded')
+    command.add_argument('--verbose', action='store_true',
+                         help='log the requests')
+    command.set_defaults(func=serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,267 @@
+"""
+columns of the fields of repeated records, built while streaming the
+document without any Node or dict per record:
+
+    columns = to_columns('feed.xml', 'listing.ad',
+                         ['@id', 'field1', 'images.image.1'])
+
+Every column holds one value per record. Numbers become int64 or
+float64 columns (float with nan for the missing values), the other
+values are dictionary encoded as Dictionary(codes, values) where a
+code of -1 is a missing value. The columns are NumPy arrays when NumPy
+is installed, else array.array.
+"""
+from array import array
+from collections import namedtuple
+import re
+from xml.sax import make_parser, handler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from xmapper.utils import BaseNode, escape_tag, is_string, read_chunks
+
+
+Dictionary = namedtuple('Dictionary', ['codes', 'values'])
+
+# a leading zero followed by a digit is a code (zip, id, phone number),
+# the column stays strings to keep it
+_INT = re.compile(r'[-+]?(0|[1-9][0-9]*)$')
+_FLOAT = re.compile(
+    r'[-+]?((0|[1-9][0-9]*)(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?$')
+_INT64 = 1 << 63
+
+
+def _field_path(field):
+    """
+    'images.image.1' -> ((images, 0), (image, 1)), attribute key or None
+    a name without position is the first one like in the paths
+    """
+    path = []
+    attr = None
+    for segment in field.split('.') if field else ():
+        if attr is not None:
+            raise ValueError('invalid field {!r}'.format(field))
+        if segment.startswith('@'):
+            attr = segment[1:]
+        elif segment.isdigit() and path:
+            path[-1] = (path[-1][0], int(segment))
+        elif segment and not segment.isdigit():
+            path.append((segment, 0))
+        else:
+            raise ValueError('invalid field {!r}'.format(field))
+    return tuple(path), attr
+
+
+def infer_type(values):
+    """
+    :param values: distinct values of a column
+    :return: int, float or None for strings, the empty value does not
+        count
+    """
+    kind = None
+    for value in values:
+        if not value:
+            continue
+        if _INT.match(value) and -_INT64 <= int(value) < _INT64:
+            kind = kind or int
+        elif _FLOAT.match(value):
+            kind = float
+        else:
+            return None
+    return kind
+
+
+class ColumnBuilder(object):
+    """
+    Dictionary encodes the values of every field into a growing code
+    array while the records are read, see to_columns
+    :param fields: paths relative to the record, the last segment can
+        be an @attribute
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        # path tuple -> [(column, attribute key or None)]
+        self.targets = {}
+        self.prefixes = set()
+        for column, field in enumerate(self.fields):
+            path, attr = _field_path(field)
+            self.targets.setdefault(path, []).append((column, attr))
+            for size in range(len(path) + 1):
+                self.prefixes.add(path[:size])
+        self.codes = [array('i') for _ in self.fields]
+        self.lookups = [{} for _ in self.fields]
+        self.row = [-1] * len(self.fields)
+        self.rows = 0
+
+    def set(self, column, value):
+        """
+        the value of a field in the current record, the first one wins
+        """
+        if self.row[column] != -1:
+            return
+        lookup = self.lookups[column]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(lookup)
+        self.row[column] = code
+
+    def end_record(self):
+        for codes, code in zip(self.codes, self.row):
+            codes.append(code)
+        self.row = [-1] * len(self.fields)
+        self.rows += 1
+
+    def add_record(self, record):
+        """
+        add a parsed record Node
+        """
+        stack = [((), record)]
+        while stack:
+            path, node = stack.pop()
+            for column, attr in self.targets.get(path, ()):
+                if attr is None:
+                    self.set(column, node.cdata.strip())
+                elif attr in node._attributes:
+                    self.set(column, node._attributes[attr])
+            counts = {}
+            for child in node.children:
+                idx = counts.get(child._name, 0)
+                counts[child._name] = idx + 1
+                child_path = path + ((child._name, idx),)
+                if child_path in self.prefixes:
+                    stack.append((child_path, child))
+        self.end_record()
+
+    def build(self, infer_types=True, as_numpy=None):
+        """
+        :param infer_types: False to keep every column as strings
+        :param as_numpy: None for NumPy arrays when it is installed
+        :return: {field: column}
+        """
+        if as_numpy is None:
+            as_numpy = numpy is not None
+        elif as_numpy and numpy is None:
+            raise ImportError('as_numpy=True needs NumPy')
+        columns = {}
+        for field, codes, lookup in zip(self.fields, self.codes,
+                                        self.lookups):
+            values = list(lookup)
+            kind = infer_type(values) if infer_types else None
+            if kind is None:
+                if as_numpy:
+                    columns[field] = Dictionary(
+                        numpy.asarray(codes, dtype=numpy.int32),
+                        numpy.array(values, dtype=object))
+                else:
+                    columns[field] = Dictionary(codes, values)
+                continue
+            missing = '' in lookup or -1 in codes
+            if kind is int and not missing:
+                typecode, table = 'q', [int(v) for v in values]
+            else:
+                # the nan at the end is the code -1
+                typecode = 'd'
+                table = [float(v) if v else float('nan') for v in values]
+                table.append(float('nan'))
+            if as_numpy:
+                table = numpy.array(table, dtype=typecode)
+                columns[field] = table[numpy.asarray(codes,
+                                                     dtype=numpy.intp)]
+            else:
+                columns[field] = array(typecode, (table[c] for c in codes))
+        return columns
+
+
+class ColumnHandler(handler.ContentHandler):
+    """
+    SAX handler feeding a ColumnBuilder with the fields of the records
+    found at record_path, only the elements on a field path are looked at
+    """
+    def __init__(self, record_path, builder):
+        self.record_path = record_path.split('.')
+        self.builder = builder
+        self.names = []
+        # (path, child counts, text chunks or None) of the open
+        # elements of the record on a field path
+        self.stack = []
+        # depth of the open elements skipped inside the record
+        self.skipped = 0
+
+    def startElement(self, name, attributes):
+        name = escape_tag(name)
+        if not self.stack:
+            self.names.append(name)
+            if self.names != self.record_path:
+                return
+            path = ()
+        elif self.skipped:
+            self.skipped += 1
+            return
+        else:
+            counts = self.stack[-1][1]
+            idx = counts.get(name, 0)
+            counts[name] = idx + 1
+            path = self.stack[-1][0] + ((name, idx),)
+            if path not in self.builder.prefixes:
+                self.skipped = 1
+                return
+        chunks = None
+        for column, attr in self.builder.targets.get(path, ()):
+            if attr is None:
+                chunks = []
+            elif attr in attributes:
+                self.builder.set(column, attributes[attr])
+        self.stack.append((path, {}, chunks))
+
+    def endElement(self, name):
+        if self.skipped:
+            self.skipped -= 1
+            return
+        if not self.stack:
+            self.names.pop()
+            return
+        path, _, chunks = self.stack.pop()
+        if chunks is not None:
+            value = ''.join(chunks).strip()
+            for column, attr in self.builder.targets[path]:
+                if attr is None:
+                    self.builder.set(column, value)
+        if not self.stack:
+            self.names.pop()
+            self.builder.end_record()
+
+    def characters(self, cdata):
+        if self.stack and not self.skipped and \
+                self.stack[-1][2] is not None:
+            self.stack[-1][2].append(cdata)
+
+
+def to_columns(source, record_path, fields, infer_types=True,
+               as_numpy=None, chunk_size=1 << 16):
+    """
+    the columns of the fields of every record found at record_path,
+    the source is streamed so only the columns are held in memory
+    :param source: filename, URL, file object, XML string or a parsed
+        Node, then record_path is a query, see Node.select
+    :param fields: paths relative to the record like 'price',
+        'images.image.1' or 'agent.@id'
+    :param infer_types: False to keep every column as strings
+    :param as_numpy: None for NumPy arrays when it is installed
+    :return: {field: int64 or float64 column or Dictionary}
+    """
+    builder = ColumnBuilder(fields)
+    if isinstance(source, BaseNode):
+        for record in source.select(record_path):
+            builder.add_record(record)
+        return builder.build(infer_types, as_numpy)
+    if source is None or (is_string(source) and source.strip()) == '':
+        raise ValueError('to_columns() takes a filename, URL or XML string')
+    parser = make_parser()
+    parser.setContentHandler(ColumnHandler(record_path, builder))
+    for data in read_chunks(source, chunk_size):
+        parser.feed(data)
+    parser.close()
+    return builder.build(infer_types, as_numpy)
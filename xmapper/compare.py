@@ -0,0 +1,242 @@
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import sqlite3
+
+from xmapper.batch import chunk_files, list_files
+from xmapper.diff import flat_mapping
+from xmapper.utils import parse
+
+
+# mapping is None when it is not loaded from the cache
+Fingerprint = namedtuple(
+    'Fingerprint', ['mtime', 'size', 'digest', 'content_hash', 'mapping'])
+
+FileDiff = namedtuple('FileDiff', ['added', 'removed', 'changed'])
+
+DirComparison = namedtuple(
+    'DirComparison',
+    ['identical', 'different', 'only_old', 'only_new', 'errors', 'stats'])
+
+
+def file_digest(path, chunk_size=1 << 16):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class FingerprintCache(object):
+    """
+    sqlite file keeping the fingerprint of every compared file by its
+    absolute path, a fingerprint holds the mtime, size and digest of the
+    file, the content hash of the parsed document and its flat mapping
+    """
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            'path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, '
+            'digest TEXT, content_hash TEXT, mapping TEXT)')
+
+    def get(self, path):
+        """
+        :return: Fingerprint without mapping or None
+        """
+        row = self.db.execute(
+            'SELECT mtime, size, digest, content_hash FROM fingerprints '
+            'WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return None
+        return Fingerprint(*row, mapping=None)
+
+    def get_mapping(self, path):
+        row = self.db.execute(
+            'SELECT mapping FROM fingerprints WHERE path = ?',
+            (path,)).fetchone()
+        return json.loads(row[0])
+
+    def put(self, path, fingerprint):
+        """
+        store the fingerprint, without mapping only the mtime and size
+        of an entry with the same digest are updated
+        """
+        if fingerprint.mapping is None:
+            self.db.execute(
+                'UPDATE fingerprints SET mtime = ?, size = ? '
+                'WHERE path = ?',
+                (fingerprint.mtime, fingerprint.size, path))
+        else:
+            self.db.execute(
+                'INSERT OR REPLACE INTO fingerprints VALUES '
+                '(?, ?, ?, ?, ?, ?)',
+                (path, fingerprint.mtime, fingerprint.size,
+                 fingerprint.digest, fingerprint.content_hash,
+                 json.dumps(fingerprint.mapping, sort_keys=True)))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def fingerprint_files(paths, digests):
+    """
+    fingerprint the files of one chunk, a file whose digest did not
+    change since it was cached is not parsed again
+    :param digests: {path: cached digest}
+    :return: ({path: Fingerprint}, {path: error})
+    """
+    fingerprints = {}
+    errors = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest = file_digest(path)
+            if digest == digests.get(path):
+                fingerprints[path] = Fingerprint(
+                    stat.st_mtime_ns, stat.st_size, digest, None, None)
+                continue
+            obj = parse(path, mode='r', compact=True, content_hash=True)
+            fingerprints[path] = Fingerprint(
+                stat.st_mtime_ns, stat.st_size, digest,
+                obj.content_hash.hex(), flat_mapping(obj))
+        except Exception as e:
+            errors[path] = '{}: {}'.format(type(e).__name__, e)
+    return fingerprints, errors
+
+
+def diff_mappings(old, new):
+    """
+    :return: FileDiff(added paths, removed paths,
+                      {path: (old value, new value)})
+    """
+    return FileDiff(
+        sorted(k for k in new if k not in old),
+        sorted(k for k in old if k not in new),
+        {k: (v, new[k]) for k, v in old.items()
+         if k in new and new[k] != v})
+
+
+def compare_dirs(old_dir, new_dir, cache=None, jobs=None, suffix='.xml',
+                 chunk_bytes=1 << 20, top=10):
+    """
+    compare the files with the same relative path in old_dir and
+    new_dir. The files which did not change since the last run, by
+    mtime and size or else by digest, are taken from the cache, only
+    the others are parsed, over worker processes.
+    :param cache: FingerprintCache, sqlite file path or None for
+        a cache in memory
+    :param jobs: number of worker processes, None for all the cpus,
+        1 parses in this process
+    :param top: number of most often different paths in the stats
+    :return: DirComparison(identical files, {file: FileDiff},
+        files only in old_dir, files only in new_dir, {file: error},
+        {stat name: value})
+    """
+    if not isinstance(cache, FingerprintCache):
+        cache = FingerprintCache(cache or ':memory:')
+    old_files = set(list_files(old_dir, suffix))
+    new_files = set(list_files(new_dir, suffix))
+    common = sorted(old_files & new_files)
+    # only the files in both directories are compared
+    paths = {}
+    for name in common:
+        paths[name] = (os.path.abspath(os.path.join(old_dir, name)),
+                       os.path.abspath(os.path.join(new_dir, name)))
+
+    fingerprints = {}
+    digests = {}
+    for path in (p for pair in paths.values() for p in pair):
+        cached = cache.get(path)
+        if cached is not None:
+            stat = os.stat(path)
+            if (cached.mtime, cached.size) == (stat.st_mtime_ns,
+                                               stat.st_size):
+                fingerprints[path] = cached
+                continue
+        digests[path] = cached.digest if cached is not None else None
+
+    errors = {}
+    parsed = 0
+
+    def merge(result):
+        nonlocal parsed
+        chunk_fingerprints, chunk_errors = result
+        errors.update(chunk_errors)
+        for path, fingerprint in chunk_fingerprints.items():
+            cache.put(path, fingerprint)
+            if fingerprint.mapping is not None:
+                parsed += 1
+                fingerprint = fingerprint._replace(mapping=None)
+            else:
+                fingerprint = fingerprint._replace(
+                    content_hash=cache.get(path).content_hash)
+            fingerprints[path] = fingerprint
+
+    chunks = chunk_files('', sorted(digests), chunk_bytes)
+    if jobs == 1:
+        for chunk in chunks:
+            merge(fingerprint_files(chunk, digests))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(fingerprint_files, chunk,
+                                       {p: digests[p] for p in chunk})
+                       for chunk in chunks]
+            for future in futures:
+                merge(future.result())
+    cache.commit()
+
+    identical = []
+    different = {}
+    file_errors = {}
+    counts = Counter()
+    paths_counter = Counter()
+    for name in common:
+        old_path, new_path = paths[name]
+        failed = [errors[p] for p in (old_path, new_path) if p in errors]
+        if failed:
+            file_errors[name] = failed[0]
+            continue
+        if fingerprints[old_path].content_hash == \
+                fingerprints[new_path].content_hash:
+            identical.append(name)
+            continue
+        file_diff = diff_mappings(cache.get_mapping(old_path),
+                                  cache.get_mapping(new_path))
+        if not any(file_diff):
+            # only the order of differently named siblings changed
+            identical.append(name)
+            continue
+        different[name] = file_diff
+        counts['paths_added'] += len(file_diff.added)
+        counts['paths_removed'] += len(file_diff.removed)
+        counts['paths_changed'] += len(file_diff.changed)
+        paths_counter.update(file_diff.added)
+        paths_counter.update(file_diff.removed)
+        paths_counter.update(list(file_diff.changed))
+
+    stats = {
+        'compared': len(common),
+        'identical': len(identical),
+        'different': len(different),
+        'only_old': len(old_files - new_files),
+        'only_new': len(new_files - old_files),
+        'errors': len(file_errors),
+        'parsed': parsed,
+        'cached': 2 * len(common) - parsed - len(errors),
+        'paths_added': counts['paths_added'],
+        'paths_removed': counts['paths_removed'],
+        'paths_changed': counts['paths_changed'],
+        'top_paths': paths_counter.most_common(top),
+    }
+    return DirComparison(identical, different,
+                         sorted(old_files - new_files),
+                         sorted(new_files - old_files), file_errors, stats)
@@ -0,0 +1,170 @@
+from collections import namedtuple
+
+
+DiffReport = namedtuple('DiffReport', ['added', 'removed', 'changed', 'moved'])
+
+
+def _child_path(prefix, node):
+    path = prefix + node._name
+    if node.position is not None:
+        path = path + '.' + node.position
+    return path
+
+
+def _group_by_name(children):
+    groups = {}
+    for child in children:
+        groups.setdefault(child._name, []).append(child)
+    return groups
+
+
+def _pair_unordered(nodes_a, nodes_b):
+    """
+    pair the identical siblings by their content hash, the same
+    position first, then the others in order
+    :return: (identical pairs, other pairs, unpaired a, unpaired b)
+    """
+    by_hash = {}
+    for idx, node in enumerate(nodes_b):
+        by_hash.setdefault(node.unordered_hash, []).append(idx)
+    identical = []
+    rest_a = []
+    used = set()
+    for idx, node in enumerate(nodes_a):
+        candidates = by_hash.get(node.unordered_hash)
+        if not candidates:
+            rest_a.append(node)
+            continue
+        match = idx if idx in candidates else candidates[0]
+        candidates.remove(match)
+        used.add(match)
+        identical.append((node, nodes_b[match]))
+    rest_b = [node for idx, node in enumerate(nodes_b) if idx not in used]
+    size = min(len(rest_a), len(rest_b))
+    return (identical, list(zip(rest_a, rest_b)),
+            rest_a[size:], rest_b[size:])
+
+
+def flat_mapping(node):
+    """
+    the leaf values and the attributes of a tree by path, what diff
+    compares: {'a.b': 'value', 'a.b.@key': 'attribute value'}
+    """
+    mapping = {}
+    stack = [('', node)]
+    while stack:
+        prefix, obj = stack.pop()
+        if obj._name is not None:
+            path = prefix[:-1]
+            for key, value in obj._attributes.items():
+                mapping[path + '.@' + key] = value
+            if not obj.children:
+                mapping[path] = obj.cdata.strip()
+        for child in obj.children:
+            stack.append((_child_path(prefix, child) + '.', child))
+    return mapping
+
+
+def iter_diff(one, two, ordered=True):
+    """
+    walk both trees together and yield their differences as
+    ('added' | 'removed' | 'changed' | 'moved', path, detail) where
+    detail is (old value, new value) for 'changed' and the new path for
+    'moved', attributes have an @name path.
+    With ordered=False the repeated siblings are paired by their
+    content first, a sibling found at another position is 'moved'.
+    The subtrees whose content hashes are already built and equal are
+    skipped.
+    """
+    name = 'content_hash' if ordered else 'unordered_hash'
+    stack = [('', '', one, two)]
+    while stack:
+        prefix_a, prefix_b, a, b = stack.pop()
+        digest = a._cached(name)
+        if digest is not None and digest == b._cached(name):
+            continue
+        if a._name is not None:
+            path = prefix_a[:-1]
+            attrs_a = a._attributes
+            attrs_b = b._attributes
+            if attrs_a != attrs_b:
+                for key, value in attrs_a.items():
+                    if key not in attrs_b:
+                        yield 'removed', path + '.@' + key, None
+                    elif attrs_b[key] != value:
+                        yield ('changed', path + '.@' + key,
+                               (value, attrs_b[key]))
+                for key in attrs_b:
+                    if key not in attrs_a:
+                        yield 'added', prefix_b[:-1] + '.@' + key, None
+            if not a.children or not b.children:
+                value_a = '' if a.children else a.cdata.strip()
+                value_b = '' if b.children else b.cdata.strip()
+                if value_a != value_b:
+                    yield 'changed', path, (value_a, value_b)
+        groups_a = _group_by_name(a.children)
+        groups_b = _group_by_name(b.children)
+        pairs = []
+        for name, nodes_a in groups_a.items():
+            nodes_b = groups_b.get(name)
+            if nodes_b is None:
+                for node in nodes_a:
+                    yield 'removed', _child_path(prefix_a, node), None
+                continue
+            if ordered or (len(nodes_a) == 1 and len(nodes_b) == 1):
+                size = min(len(nodes_a), len(nodes_b))
+                pairs.extend(zip(nodes_a, nodes_b))
+                extra_a, extra_b = nodes_a[size:], nodes_b[size:]
+            else:
+                identical, others, extra_a, extra_b = _pair_unordered(
+                    nodes_a, nodes_b)
+                for node_a, node_b in identical:
+                    path_a = _child_path(prefix_a, node_a)
+                    path_b = _child_path(prefix_b, node_b)
+                    if path_a != path_b:
+                        yield 'moved', path_a, path_b
+                pairs.extend(others)
+            for node in extra_a:
+                yield 'removed', _child_path(prefix_a, node), None
+            for node in extra_b:
+                yield 'added', _child_path(prefix_b, node), None
+        for name, nodes_b in groups_b.items():
+            if name not in groups_a:
+                for node in nodes_b:
+                    yield 'added', _child_path(prefix_b, node), None
+        for node_a, node_b in reversed(pairs):
+            stack.append((_child_path(prefix_a, node_a) + '.',
+                          _child_path(prefix_b, node_b) + '.',
+                          node_a, node_b))
+
+
+def diff(one, two, ordered=True):
+    """
+    structural diff of two parsed documents in one walk
+    :param ordered: False to pair the repeated siblings by content
+    :return: DiffReport(added paths, removed paths,
+                        {path: (old value, new value)},
+                        {old path: new path})
+    """
+    report = DiffReport([], [], {}, {})
+    for kind, path, detail in iter_diff(one, two, ordered):
+        if kind == 'added':
+            report.added.append(path)
+        elif kind == 'removed':
+            report.removed.append(path)
+        else:
+            getattr(report, kind)[path] = detail
+    report.added.sort()
+    report.removed.sort()
+    return report
+
+
+def equal(one, two, ordered=True):
+    """
+    :return: True if diff(one, two, ordered) finds nothing, stops at
+        the first difference
+    """
+    for kind, _, _ in iter_diff(one, two, ordered):
+        if kind != 'moved':
+            return False
+    return True
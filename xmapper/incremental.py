@@ -0,0 +1,434 @@
+"""
+incremental parsing of a large file made of repeated records, like the
+<ad> of a listing feed. The byte range of every record is kept, so once
+the file is edited in place only the records whose bytes changed are
+parsed again and spliced into the tree, and dump copies the bytes of
+the records which did not change instead of serializing them:
+
+    doc = IncrementalDocument('feed.xml', 'listing.ad')
+    doc.root.get_value_by_path('listing.ad.0.price')
+    ...  # feed.xml is edited
+    doc.refresh()
+    doc.dump('out.xml')
+"""
+from collections import deque, namedtuple
+from contextlib import contextmanager
+import hashlib
+import mmap
+import os
+import re
+from xml.parsers import expat
+
+from lxml import etree
+
+from xmapper.utils import Handler, Node, build_etree, dump_xml, escape_tag
+
+
+# byte range of a record in the file and the digest of those bytes
+RecordSpan = namedtuple('RecordSpan', ['start', 'end', 'digest'])
+
+# a tag up to its closing >, the quoted attribute values can hold >
+_TAG = re.compile(rb'<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _is_blank(gap):
+    return not gap.strip()
+
+
+class _Scanner(object):
+    """
+    drives a SAX Handler with expat to get the byte offsets of the
+    records found at record_path, without Handler only the offsets are
+    looked for
+    """
+    def __init__(self, record_path, sax_handler=None, encoding=None):
+        self.record_path = record_path
+        self.sax_handler = sax_handler
+        self.encoding = encoding
+        self.names = []
+        self.start = None
+        self.spans = []
+        self.records = []
+        self.data = None
+        self.parser = expat.ParserCreate(encoding)
+        self.parser.buffer_text = True
+        self.parser.XmlDeclHandler = self.declaration
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        if sax_handler is not None:
+            self.parser.CharacterDataHandler = sax_handler.characters
+
+    def declaration(self, version, encoding, standalone):
+        if encoding:
+            self.encoding = encoding
+
+    def start_element(self, name, attributes):
+        self.names.append(escape_tag(name))
+        if self.names == self.record_path:
+            self.start = self.parser.CurrentByteIndex
+        if self.sax_handler is not None:
+            self.sax_handler.startElement(name, attributes)
+
+    def end_element(self, name):
+        if self.sax_handler is not None:
+            self.sax_handler.endElement(name)
+        if self.names == self.record_path:
+            start = self.start
+            end = _TAG.match(self.data, start).end()
+            if self.data[end - 2:end] != b'/>':
+                # the index is at the end tag, after an empty element
+                end = _TAG.match(self.data, self.parser.CurrentByteIndex)
+                end = end.end()
+            self.spans.append(RecordSpan(
+                start, end, _digest(self.data[start:end])))
+            if self.sax_handler is not None:
+                elements = self.sax_handler.elements
+                parent = elements[-1] if elements else self.sax_handler.root
+                self.records.append(parent.children[-1])
+        self.names.pop()
+
+    def run(self, data, chunk_size=1 << 20):
+        self.data = data
+        for start in range(0, len(data), chunk_size):
+            self.parser.Parse(data[start:start + chunk_size], False)
+        self.parser.Parse(b'', True)
+        self.data = None
+        return self
+
+
+def _containers(root, record_path):
+    """
+    :return: the nodes at the path of the record parents in document
+        order and the digest of the tree without the records
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    containers = []
+    depth = len(record_path) - 1
+    stack = [(root, 0, True)]
+    while stack:
+        node, level, on_path = stack.pop()
+        if node._name is not None:
+            digest.update(repr((level, node._name,
+                                sorted(node._attributes.items()),
+                                node.cdata.strip())).encode('utf-8'))
+        if on_path and level == depth:
+            containers.append(node)
+            stack.extend((child, level + 1, False)
+                         for child in reversed(node.children)
+                         if child._name != record_path[-1])
+            continue
+        for child in reversed(node.children):
+            stack.append((child, level + 1, on_path and
+                          child._name == record_path[level]))
+    return containers, digest.digest()
+
+
+class IncrementalDocument(object):
+    """
+    Node tree of a file with the byte range of every record found at
+    record_path, see the module doc. dump sees the records changed
+    with set_value_by_path, set_attr_by_path or add_child, like the
+    caches do. Only ASCII compatible encodings are supported.
+
+    :param path: file path
+    :param record_path: dotted path of the records like 'listing.ad'
+    """
+    def __init__(self, path, record_path, mode='rw'):
+        self.path = path
+        self.record_path = record_path.split('.')
+        self.mode = mode
+        self.load()
+
+    @contextmanager
+    def _open(self):
+        """
+        map the file in memory
+        :return: ((mtime, size), mmap)
+        """
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if not stat.st_size:
+                raise ValueError('{} is empty'.format(self.path))
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield (stat.st_mtime_ns, stat.st_size), data
+
+    def _layout(self, spans, data):
+        """
+        :return: the bytes between the records, one more than spans
+        """
+        gaps = []
+        last = 0
+        for span in spans:
+            gaps.append(data[last:span.start])
+            last = span.end
+        gaps.append(data[last:])
+        return gaps
+
+    def _boundaries(self, gaps):
+        """
+        :return: the gaps which are not only whitespace, the first and
+            last gaps always, they separate the groups of sibling records
+        """
+        return [gap for idx, gap in enumerate(gaps)
+                if idx in (0, len(gaps) - 1) or not _is_blank(gap)]
+
+    def load(self):
+        """
+        parse the whole file
+        """
+        with self._open() as (stat, data):
+            sax_handler = Handler(self.mode, Node)
+            scanner = _Scanner(self.record_path, sax_handler).run(data)
+            if scanner.encoding and scanner.encoding.lower().replace(
+                    '-', '') in ('utf16', 'utf32'):
+                raise ValueError(
+                    '{} is not supported'.format(scanner.encoding))
+            self.gaps = self._layout(scanner.spans, data)
+        self.stat = stat
+        self.encoding = scanner.encoding
+        self.root = sax_handler.root
+        self.spans = scanner.spans
+        self.records = scanner.records
+        # the generation of every record, any change in memory bumps it
+        self.generations = [record._content for record in self.records]
+        self.containers, self.skeleton = _containers(self.root,
+                                                     self.record_path)
+        self._group()
+
+    def _group(self):
+        """
+        group the records into segments, the sibling records which are
+        not separated by anything else than whitespace
+        """
+        self.segments = self._segments_of(self.gaps)
+        self.parents = [self.records[segment[0]]._parent
+                        for segment in self.segments]
+
+    def _parse_record(self, data):
+        sax_handler = Handler(self.mode, Node)
+        _Scanner(self.record_path[-1:], sax_handler, self.encoding).run(data)
+        record = sax_handler.root.children[0]
+        record._parent = None
+        return record
+
+    def refresh(self):
+        """
+        bring the tree up to date with the file, only the records whose
+        bytes changed are parsed again. The whole file is parsed again
+        when something else than the records and the whitespace between
+        them changed. The records edited in memory are kept as they are
+        when their bytes did not change.
+        :return: {'records': count, 'parsed': records parsed again,
+                  'full': whether the whole file was parsed}
+        """
+        with self._open() as (stat, data):
+            if stat == self.stat:
+                return {'records': len(self.records), 'parsed': 0,
+                        'full': False}
+            spans = _Scanner(self.record_path).run(data).spans
+            gaps = self._layout(spans, data)
+            records = None
+            if spans and self.spans and \
+                    self._boundaries(gaps) == self._boundaries(self.gaps):
+                records, generations, parsed = self._reuse(spans, data)
+        if records is None:
+            self.load()
+            return {'records': len(self.records),
+                    'parsed': len(self.records), 'full': True}
+
+        old_records, old_segments = self.records, self.segments
+        self.spans, self.gaps, self.stat = spans, gaps, stat
+        self.records, self.generations = records, generations
+        # splice the records of every segment in place of the old ones,
+        # the number of segments is the same with the same boundaries
+        replaced = {}
+        for old, new in zip(old_segments, self._segments_of(gaps)):
+            old_nodes = [old_records[idx] for idx in old]
+            new_nodes = [records[idx] for idx in new]
+            if len(old_nodes) != len(new_nodes) or any(
+                    a is not b for a, b in zip(old_nodes, new_nodes)):
+                replaced[id(old_nodes[0])] = (old_nodes, new_nodes)
+        if replaced:
+            self._splice(replaced)
+        self._group()
+        return {'records': len(records), 'parsed': parsed, 'full': False}
+
+    def _segments_of(self, gaps):
+        """
+        :return: list of lists of record indexes
+        """
+        segments = []
+        for idx in range(len(gaps) - 1):
+            if idx == 0 or not _is_blank(gaps[idx]):
+                segments.append([])
+            segments[-1].append(idx)
+        return segments
+
+    def _reuse(self, spans, data):
+        """
+        the records of spans, the old ones with the same bytes are
+        reused, the others are parsed
+        :return: (records, their generations, count of parsed) or
+            (None, None, None) if a record can not be parsed alone
+        """
+        pool = {}
+        for idx, span in enumerate(self.spans):
+            pool.setdefault(span.digest, deque()).append(idx)
+        records = []
+        generations = []
+        parsed = 0
+        for span in spans:
+            same = pool.get(span.digest)
+            if same:
+                idx = same.popleft()
+                records.append(self.records[idx])
+                generations.append(self.generations[idx])
+                continue
+            try:
+                record = self._parse_record(data[span.start:span.end])
+            except expat.ExpatError:
+                # like an entity declared in the DTD
+                return None, None, None
+            records.append(record)
+            generations.append(record._content)
+            parsed += 1
+        return records, generations, parsed
+
+    def _splice(self, replaced):
+        """
+        :param replaced: {id of the first old record of a segment:
+                          (old records, new records)}
+        """
+        parents = []
+        for old_nodes, _ in replaced.values():
+            parent = old_nodes[0]._parent
+            if parent not in parents:
+                parents.append(parent)
+        dropped = {id(node) for old_nodes, _ in replaced.values()
+                   for node in old_nodes}
+        name = self.record_path[-1]
+        for parent in parents:
+            children = []
+            for child in parent.children:
+                if id(child) in replaced:
+                    children.extend(replaced[id(child)][1])
+                elif id(child) not in dropped:
+                    children.append(child)
+            for child in children:
+                child._parent = parent
+                if child._name == name:
+                    child.position = None
+            # the child lookup untangle cached for that name
+            cached = parent.__dict__.get(name)
+            if isinstance(cached, Node) or (
+                    isinstance(cached, list) and
+                    cached is not parent.children):
+                del parent.__dict__[name]
+            parent.children[:] = children
+            parent._build_position()
+            parent._changed(structure=True)
+
+    def _record_bytes(self, data, idx, node, gap):
+        """
+        the original bytes of an unchanged record, else the record
+        serialized with the indentation of the gap before it
+        """
+        if idx is not None and node._content == self.generations[idx]:
+            span = self.spans[idx]
+            return data[span.start:span.end], True
+        xml = etree.tostring(build_etree(node, strip_blank=True),
+                             encoding=self.encoding or 'utf-8',
+                             xml_declaration=False, pretty_print=True)
+        indent = gap.rpartition(b'\n')[2] if b'\n' in gap else b''
+        if not _is_blank(indent):
+            indent = b''
+        return xml.rstrip(b'\n').replace(b'\n', b'\n' + indent), False
+
+    def dump(self, xml_name):
+        """
+        write the tree, the records which did not change since they were
+        parsed and everything between them are copied from the file.
+        Falls back to dump_xml when the tree changed outside the
+        records or records were moved to another parent.
+        :return: {'copied': records copied, 'written': records
+                  serialized, 'full': whether dump_xml was used}
+        """
+        plan = self._plan()
+        if plan is None:
+            dump_xml(self.root, xml_name)
+            return {'copied': 0, 'written': len(self.records), 'full': True}
+        stats = {'copied': 0, 'written': 0, 'full': False}
+        with self._open() as (stat, data):
+            if stat != self.stat:
+                raise ValueError(
+                    '{} changed since it was parsed, refresh first'.format(
+                        self.path))
+            # the source itself can be the output
+            tmp_name = '{}.{}.tmp'.format(xml_name, os.getpid())
+            with open(tmp_name, 'wb') as f:
+                self._write(f, data, plan, stats)
+        os.replace(tmp_name, xml_name)
+        if os.path.abspath(xml_name) == os.path.abspath(self.path):
+            self.refresh()
+        return stats
+
+    def _write(self, f, data, plan, stats):
+        for segment, records in plan:
+            separator = self.gaps[segment[1]] if len(segment) > 1 \
+                else b'\n'
+            gap = self.gaps[segment[0]]
+            f.write(gap)
+            for pos, (idx, node) in enumerate(records):
+                if pos:
+                    gap = separator
+                    if idx is not None and \
+                            segment[0] < idx <= segment[-1]:
+                        gap = self.gaps[idx]
+                    f.write(gap)
+                piece, copied = self._record_bytes(data, idx, node, gap)
+                f.write(piece)
+                stats['copied' if copied else 'written'] += 1
+        f.write(self.gaps[-1])
+
+    def _plan(self):
+        """
+        :return: list of (segment, [(record index or None, record)]) in
+            document order, or None when the layout of the file can not
+            be reused
+        """
+        containers, skeleton = _containers(self.root, self.record_path)
+        if skeleton != self.skeleton or len(containers) != len(
+                self.containers) or any(
+                a is not b for a, b in zip(containers, self.containers)):
+            return
+        name = self.record_path[-1]
+        index = {id(node): idx for idx, node in enumerate(self.records)}
+        by_parent = {}
+        for segment, parent in zip(self.segments, self.parents):
+            by_parent.setdefault(id(parent), []).append(segment)
+        current = {}
+        for container in containers:
+            records = [c for c in container.children if c._name == name]
+            if records and id(container) not in by_parent:
+                return
+            current[id(container)] = records
+        plan = []
+        for parent_id, segments in by_parent.items():
+            records = current.get(parent_id)
+            if records is None:
+                return
+            indexes = [index.get(id(record)) for record in records]
+            if indexes == [idx for segment in segments for idx in segment]:
+                for segment in segments:
+                    plan.append((segment, [(idx, self.records[idx])
+                                           for idx in segment]))
+            elif len(segments) == 1:
+                plan.append((segments[0], list(zip(indexes, records))))
+            else:
+                return
+        plan.sort(key=lambda item: item[0][0])
+        return plan
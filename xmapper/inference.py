@@ -0,0 +1,90 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from xmapper.utils import parse
+
+
+Inference = namedtuple('Inference', ['candidates', 'samples', 'errors'])
+
+
+def pair_candidates(input, output, skip=()):
+    """
+    the input paths holding the value of every output path of one pair
+    :param skip: output values which are not searched
+    :return: {output path: (value, frozenset of input paths)}
+    """
+    search = parse(input, mode='r', compact=True).search_mapping
+    value_mapping = parse(output, mode='r', compact=True).value_mapping
+    candidates = {}
+    for path, value in value_mapping.items():
+        if value not in skip:
+            candidates[path] = (value, frozenset(search.get(value, ())))
+    return candidates
+
+
+def chunk_candidates(pairs, skip=()):
+    """
+    the candidates of the pairs of one chunk, only they are sent back
+    by the worker processes, not the trees
+    :return: list of {output path: (value, frozenset)}, {pair index: error}
+    """
+    results = []
+    errors = {}
+    for idx, (input, output) in pairs:
+        try:
+            results.append(pair_candidates(input, output, skip))
+        except Exception as e:
+            errors[idx] = '{}: {}'.format(type(e).__name__, e)
+    return results, errors
+
+
+def infer_candidates(pairs, jobs=None, skip=(), chunk_size=16):
+    """
+    intersect the candidate input paths of every output path over all
+    the sample pairs, a rule found in one pair only survives when the
+    other pairs agree with it. An output path missing from a pair or
+    holding a skipped value there does not restrict it.
+    :param pairs: iterable of (input, output), file paths or XML strings
+    :param jobs: number of worker processes, None for all the cpus,
+        1 reads the pairs in this process
+    :param skip: output values which are not searched
+    :param chunk_size: pairs sent to a worker at a time
+    :return: Inference({output path: set of input paths},
+                       {output path: value of the first pair},
+                       {pair index: error})
+    """
+    chunks = []
+    chunk = []
+    for pair in enumerate(pairs):
+        chunk.append(pair)
+        if len(chunk) == chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+
+    candidates = {}
+    samples = {}
+    errors = {}
+
+    def merge(result):
+        results, chunk_errors = result
+        errors.update(chunk_errors)
+        for pair in results:
+            for path, (value, paths) in pair.items():
+                if path in candidates:
+                    candidates[path] &= paths
+                else:
+                    candidates[path] = set(paths)
+                    samples[path] = value
+
+    if jobs == 1:
+        for chunk in chunks:
+            merge(chunk_candidates(chunk, skip))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(chunk_candidates, chunk, skip)
+                       for chunk in chunks]
+            for future in futures:
+                merge(future.result())
+    return Inference(candidates, samples, errors)
@@ -0,0 +1,287 @@
+"""
+opt-in timings and counters of the parse / map / dump stages:
+
+    with collect('feed.xml') as metrics:
+        output = transformer.transform('feed.xml')
+        dump_xml(output, 'out.xml')
+    print(metrics.to_prometheus())
+
+Nothing is recorded out of a collect block. The stages are functions
+decorated with stage, which only check that no collector is active, the
+per lookup counters are hooked into the classes while a collector is
+active only. The collectors are process wide, every active one records
+what any thread does.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+import json
+import time
+import tracemalloc
+
+
+# the active collectors, the innermost last
+_collectors = []
+
+# (owner, attribute name, original) of the hooks while collecting
+_hooks = []
+
+# the outermost collector tracing the memory, the one which started or
+# cleared tracemalloc
+_tracing = None
+
+COUNTERS = ('elements', 'cdata_bytes', 'path_lookups', 'cache_hits',
+            'cache_misses')
+
+
+class Metrics(object):
+    """
+    stage timings, counters and peak memory of one document or run
+    :param name: document name, the label of the exported metrics
+    """
+    def __init__(self, name=None):
+        self.name = name
+        # stage -> [calls, seconds]
+        self.stages = {}
+        self.counts = Counter()
+        self.seconds = 0.0
+        self.peak_bytes = None
+        # traced bytes at the start and highest seen while tracing
+        self._traced_from = None
+        self._traced_peak = 0
+        # depth of the running stages, a stage inside itself is not
+        # timed twice
+        self._running = Counter()
+
+    def __repr__(self):
+        return 'Metrics({!r})'.format(self.name)
+
+    def add_stage(self, name, seconds):
+        entry = self.stages.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def as_dict(self):
+        return {
+            'document': self.name,
+            'seconds': self.seconds,
+            'stages': {name: {'calls': calls, 'seconds': seconds}
+                       for name, (calls, seconds) in self.stages.items()},
+            'counts': {name: self.counts[name] for name in COUNTERS},
+            'peak_memory_bytes': self.peak_bytes,
+        }
+
+    def to_json(self, **kwargs):
+        return to_json([self], **kwargs)
+
+    def to_prometheus(self, prefix='xmapper'):
+        return to_prometheus([self], prefix)
+
+
+def _fold_peak():
+    """
+    add the peak since the last reset to every tracing collector and
+    reset it, so an inner collector does not see the peaks before it
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for metrics in _collectors:
+        if metrics._traced_from is not None:
+            metrics._traced_peak = max(metrics._traced_peak, peak)
+    # python < 3.9 can not reset the peak, the inner collectors get the
+    # peak since the outermost one started
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def _start_tracing(metrics):
+    global _tracing
+    started = False
+    if _tracing is None:
+        if tracemalloc.is_tracing():
+            tracemalloc.clear_traces()
+        else:
+            tracemalloc.start()
+            started = True
+        _tracing = metrics
+    else:
+        _fold_peak()
+    metrics._traced_from = metrics._traced_peak = \
+        tracemalloc.get_traced_memory()[0]
+    return started
+
+
+def _stop_tracing(metrics, started):
+    global _tracing
+    _fold_peak()
+    metrics.peak_bytes = metrics._traced_peak - metrics._traced_from
+    metrics._traced_from = None
+    if _tracing is metrics:
+        _tracing = None
+        if started:
+            tracemalloc.stop()
+
+
+def _count(name, value=1):
+    for metrics in _collectors:
+        metrics.counts[name] += value
+
+
+def count_tree(root):
+    """
+    count the elements and cdata bytes of a parsed tree
+    """
+    elements = cdata_bytes = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node._name is not None:
+            elements += 1
+        if node.cdata:
+            cdata_bytes += len(node.cdata.encode('utf-8'))
+        stack.extend(node.children)
+    _count('elements', elements)
+    _count('cdata_bytes', cdata_bytes)
+
+
+def stage(name, count=None):
+    """
+    decorator timing the calls of a function as the stage name
+    :param count: called with the result to update the counters
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _collectors:
+                return func(*args, **kwargs)
+            collectors = [m for m in _collectors if not m._running[name]]
+            for metrics in collectors:
+                metrics._running[name] += 1
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                for metrics in collectors:
+                    metrics._running[name] -= 1
+                    metrics.add_stage(name, elapsed)
+            if count is not None:
+                count(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def _install():
+    from xmapper.utils import BaseNode, CachedProperty
+
+    get_value_by_path = BaseNode.get_value_by_path
+    cached_get = CachedProperty.__get__
+
+    @wraps(get_value_by_path)
+    def counted_get_value_by_path(self, path):
+        _count('path_lookups')
+        return get_value_by_path(self, path)
+
+    @wraps(cached_get)
+    def counted_get(self, instance, owner):
+        if instance is not None:
+            if instance._cached(self._attr_name) is None:
+                _count('cache_misses')
+            else:
+                _count('cache_hits')
+        return cached_get(self, instance, owner)
+
+    _hooks.append((BaseNode, 'get_value_by_path', get_value_by_path))
+    _hooks.append((CachedProperty, '__get__', cached_get))
+    BaseNode.get_value_by_path = counted_get_value_by_path
+    CachedProperty.__get__ = counted_get
+
+
+def _uninstall():
+    while _hooks:
+        owner, attr, original = _hooks.pop()
+        setattr(owner, attr, original)
+
+
+@contextmanager
+def collect(name=None, memory=False, callback=None):
+    """
+    record the metrics of everything done in the block, the outer
+    collectors record it as well
+    :param name: document name
+    :param memory: trace the peak memory of the Python allocations with
+        tracemalloc, slows everything down. The outermost collector
+        tracing starts or clears tracemalloc, the inner ones record the
+        peak above the memory traced when they start
+    :param callback: called with the Metrics at the end of the block
+    :return: Metrics
+    """
+    metrics = Metrics(name)
+    if not _collectors:
+        _install()
+    _collectors.append(metrics)
+    started = _start_tracing(metrics) if memory else False
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.seconds = time.perf_counter() - start
+        if memory:
+            _stop_tracing(metrics, started)
+        _collectors.remove(metrics)
+        if not _collectors:
+            _uninstall()
+    if callback is not None:
+        callback(metrics)
+
+
+def to_json(metrics, **kwargs):
+    """
+    :param metrics: iterable of Metrics
+    :return: JSON list of the Metrics.as_dict
+    """
+    return json.dumps([m.as_dict() for m in metrics], **kwargs)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def to_prometheus(metrics, prefix='xmapper'):
+    """
+    :param metrics: iterable of Metrics
+    :return: the Prometheus text exposition format of the metrics, the
+        document name is the document label
+    """
+    families = {}
+
+    def add(family, kind, help_text, labels, value):
+        entry = families.setdefault(family, (kind, help_text, []))
+        entry[2].append((labels, value))
+
+    for m in metrics:
+        document = (('document', '' if m.name is None else m.name),)
+        add('document_seconds', 'gauge', 'wall time of the collect block',
+            document, m.seconds)
+        for name, (calls, seconds) in sorted(m.stages.items()):
+            labels = document + (('stage', name),)
+            add('stage_seconds_total', 'counter', 'time spent in the stage',
+                labels, seconds)
+            add('stage_calls_total', 'counter', 'calls of the stage',
+                labels, calls)
+        for name in COUNTERS:
+            add(name + '_total', 'counter', name.replace('_', ' '),
+                document, m.counts[name])
+        if m.peak_bytes is not None:
+            add('peak_memory_bytes', 'gauge',
+                'peak traced Python memory', document, m.peak_bytes)
+    lines = []
+    for family, (kind, help_text, samples) in families.items():
+        name = '{}_{}'.format(prefix, family)
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            lines.append('{}{{{}}} {}'.format(name, ','.join(
+                '{}="{}"'.format(k, _label(v)) for k, v in labels), value))
+    return '\n'.join(lines) + '\n'
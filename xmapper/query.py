@@ -0,0 +1,290 @@
+"""
+small query language over the dotted paths:
+
+    listing.ad[@status='active'].images.image
+    **.ad[@status!='sold'].images.image[0:2]
+    listing.*.@id
+
+a segment is a tag name, ``*`` for any child, ``**`` for any number of
+levels, a position or a range like ``1`` or ``0:2``, or a last ``@key``
+for the attribute values. A name or ``*`` takes ``[@key]``,
+``[@key='value']``, ``[@key!='value']``, ``[1]`` and ``[0:2]``
+predicates, positions and ranges count the matched siblings of each
+parent like the positions of the paths.
+
+A ``**.name`` step is answered by the tag_index of the node, or its
+attr_index with a ``[@key='value']``, the leading names by the
+path_index when it is built already.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+
+# name is None for *, predicates is a tuple of slices and
+# (key, operator, value) attribute tests
+Step = namedtuple('Step', ['name', 'descendant', 'predicates'])
+
+_SEGMENT = re.compile(r'[^.\[\]\s\'"]+')
+_RANGE = re.compile(r'(-?\d+)?(?:(:)(-?\d+)?)?$')
+_PREDICATE = re.compile(
+    r'''\[\s*(?:@(?P<key>[^\s=!\]]+)\s*'''
+    r'''(?:(?P<op>!?=)\s*(?P<quote>['"])(?P<value>.*?)(?P=quote)\s*)?'''
+    r'''|(?P<range>[-\d:\s]+))\]''')
+
+
+def _range(text):
+    """
+    :return: slice for a position or a range or None
+    """
+    match = _RANGE.match(text.replace(' ', ''))
+    if match is None or not text.strip(' :'):
+        return
+    start, colon, stop = match.groups()
+    start = int(start) if start is not None else None
+    if colon:
+        return slice(start, int(stop) if stop is not None else None)
+    if start is None:
+        return
+    return slice(start, start + 1 or None)
+
+
+def _test(node, key, op, value):
+    actual = node._attributes.get(key)
+    if actual is None:
+        return False
+    if op == '=':
+        return actual == value
+    if op == '!=':
+        return actual != value
+    return True
+
+
+class Query(object):
+    """
+    compiled query, see compile_query
+    :param steps: tuple of Step
+    :param attr: attribute key of a last @key segment or None
+    """
+    def __init__(self, query, steps, attr=None):
+        self.query = query
+        self.steps = steps
+        self.attr = attr
+        # the same node can be reached twice after two ** only
+        self.unique = sum(step.descendant for step in steps) > 1
+        # leading plain names, resolved with a built path_index
+        prefix = []
+        for step in steps:
+            if step.descendant or step.name is None or step.predicates:
+                break
+            prefix.append(step.name)
+        self.prefix = '.'.join(prefix)
+
+    def __repr__(self):
+        return 'Query({!r})'.format(self.query)
+
+    def match_children(self, node, step):
+        """
+        :return: list of the children of node matching step
+        """
+        if step.name is None:
+            group = node.children
+        else:
+            group = [c for c in node.children if c._name == step.name]
+        for predicate in step.predicates:
+            if isinstance(predicate, slice):
+                group = group[predicate]
+            else:
+                group = [c for c in group if _test(c, *predicate)]
+        return group
+
+    def expand(self, node, idx):
+        """
+        the nodes reached from node by the step idx
+        :return: iterator of (node, index of the next step)
+        """
+        step = self.steps[idx]
+        if not step.descendant:
+            return ((child, idx + 1)
+                    for child in self.match_children(node, step))
+        if step.name is not None and \
+                not any(isinstance(p, slice) for p in step.predicates):
+            return ((match, idx + 1) for match in self.candidates(node, step)
+                    if match is not node and
+                    all(_test(match, *p) for p in step.predicates))
+        return self.walk(node, idx)
+
+    def candidates(self, node, step):
+        """
+        the nodes of the step tag name below node in document order from
+        the tag_index, or from the attr_index with a [@key='value']
+        """
+        for key, op, value in step.predicates:
+            if op == '=':
+                entry = node.attr_index.get((step.name, key, value))
+                return entry[2] if entry is not None else ()
+        return node.tag_index.iter(step.name)
+
+    def walk(self, node, idx):
+        """
+        a ** step matching the children of every node below node, for
+        the * and position steps the tag_index can not answer
+        """
+        matched = {id(c) for c in self.match_children(node, self.steps[idx])}
+        for child in node.children:
+            if id(child) in matched:
+                yield child, idx + 1
+            if child.children:
+                # the same step again below the child
+                yield child, idx
+
+    def start(self, node):
+        """
+        :return: the first contexts, from the path_index when it is
+            built already
+        """
+        if self.prefix:
+            path_index = node._cached('path_index')
+            if path_index is not None:
+                target = path_index.get(self.prefix)
+                if target is not None:
+                    if not isinstance(target, list):
+                        target = [target]
+                    size = self.prefix.count('.') + 1
+                    return ((match, size) for match in target)
+        return iter([(node, 0)])
+
+    def iter(self, node):
+        """
+        lazily iterate the nodes matching the query below node, or the
+        attribute values with a last @key segment. The matches come in
+        document order unless the query has more than one **.
+        """
+        size = len(self.steps)
+        seen = set() if self.unique else None
+        stack = [self.start(node)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            match, idx = item
+            if idx < size:
+                stack.append(self.expand(match, idx))
+                continue
+            if seen is not None:
+                if id(match) in seen:
+                    continue
+                seen.add(id(match))
+            if self.attr is None:
+                yield match
+            elif self.attr in match._attributes:
+                yield match._attributes[self.attr]
+
+    def values(self, node):
+        """
+        like iter but the stripped cdata of the matched nodes
+        """
+        if self.attr is not None:
+            return self.iter(node)
+        return (match.cdata.strip() for match in self.iter(node))
+
+    def iter_records(self, records, values=False):
+        """
+        run the query on every record of a stream, see iterparse
+        :param values: True for the values instead of the nodes
+        """
+        for record in records:
+            if values:
+                yield from self.values(record)
+            else:
+                yield from self.iter(record)
+
+
+def _error(query, pos, reason):
+    return ValueError('invalid query {!r} at {}: {}'.format(
+        query, pos, reason))
+
+
+@lru_cache(maxsize=256)
+def compile_query(query):
+    """
+    parse the query once, the compiled queries are cached
+    :return: Query
+    """
+    steps = []
+    attr = None
+    descendant = False
+    pos = 0
+    while True:
+        match = _SEGMENT.match(query, pos)
+        if match is None:
+            raise _error(query, pos, 'segment expected')
+        segment = match.group()
+        pos = match.end()
+        predicates = []
+        while True:
+            found = _PREDICATE.match(query, pos)
+            if found is None:
+                break
+            if found.group('key') is not None:
+                predicates.append((found.group('key'), found.group('op'),
+                                   found.group('value')))
+            else:
+                predicate = _range(found.group('range'))
+                if predicate is None:
+                    raise _error(query, pos, 'bad position')
+                predicates.append(predicate)
+            pos = found.end()
+        position = _range(segment) if segment[0] in '-0123456789:' else None
+        if segment.startswith('@'):
+            if predicates or pos != len(query) or len(segment) == 1:
+                raise _error(query, match.start(),
+                             'the @key segment must be the last one')
+            attr = segment[1:]
+        elif segment == '**':
+            if predicates:
+                raise _error(query, match.start(), '** takes no predicate')
+            descendant = True
+        elif position is not None:
+            # book.1 is book[1]
+            if not steps or descendant or predicates:
+                raise _error(query, match.start(), 'position of nothing')
+            last = steps[-1]
+            steps[-1] = last._replace(
+                predicates=last.predicates + (position,))
+        else:
+            name = None if segment == '*' else segment
+            steps.append(Step(name, descendant, tuple(predicates)))
+            descendant = False
+        if pos == len(query):
+            break
+        if query[pos] != '.':
+            raise _error(query, pos, "'.' expected")
+        pos += 1
+    if descendant:
+        # a last ** is every node below
+        steps.append(Step(None, True, ()))
+    if not steps and attr is None:
+        raise _error(query, 0, 'empty query')
+    return Query(query, tuple(steps), attr)
+
+
+def select(node, query):
+    """
+    :param query: query string or Query
+    :return: iterator of the matched nodes or attribute values
+    """
+    if not isinstance(query, Query):
+        query = compile_query(query)
+    return query.iter(node)
+
+
+def select_values(node, query):
+    """
+    :return: iterator of the stripped values of the matched nodes or
+        of the attribute values
+    """
+    if not isinstance(query, Query):
+        query = compile_query(query)
+    return query.values(node)
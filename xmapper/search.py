@@ -0,0 +1,162 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from urllib.parse import unquote
+
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_space(value):
+    return _SPACES.sub(' ', value).strip()
+
+
+def normalize_case(value):
+    return value.casefold()
+
+
+def normalize_number(value):
+    """
+    '30.00', '30' and '3E1' are the same number
+    """
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return value
+    # keep huge exponents as they are instead of writing all the digits
+    if not number.is_finite() or abs(number.adjusted()) > 30:
+        return value
+    number = number.normalize()
+    if number == number.to_integral_value():
+        return '{:d}'.format(int(number))
+    return '{:f}'.format(number)
+
+
+def normalize_url(value):
+    if '%' in value:
+        return unquote(value)
+    return value
+
+
+DEFAULT_NORMALIZERS = (normalize_url, normalize_space, normalize_case,
+                       normalize_number)
+
+
+def ngrams(value, n=3):
+    """
+    the set of n-grams of value, padded so short values have some too
+    """
+    value = ' ' + value + ' '
+    return {value[i:i + n] for i in range(max(len(value) - n + 1, 1))}
+
+
+class ValueIndex(object):
+    """
+    Search index over the values of a document to find the paths of a
+    value which is equal once normalized, or similar by its n-grams.
+
+    :param value_mapping: {path: value}, see BaseNode.value_mapping
+    :param normalizers: functions applied in order to every value
+    :param n: size of the n-grams
+    """
+    max_postings = 1000
+
+    def __init__(self, value_mapping, normalizers=DEFAULT_NORMALIZERS, n=3):
+        self.normalizers = normalizers
+        self.n = n
+        self.exact = {}
+        self.normalized = {}
+        for path, value in value_mapping.items():
+            self.exact.setdefault(value, []).append(path)
+        for value, paths in self.exact.items():
+            self.normalized.setdefault(
+                self.normalize(value), []).extend(paths)
+        # built on the first fuzzy search
+        self.values = None
+        self.sizes = None
+        self.postings = None
+
+    def normalize(self, value):
+        for normalizer in self.normalizers:
+            value = normalizer(value)
+        return value
+
+    def build_ngrams(self):
+        self.values = [v for v in self.normalized if v]
+        self.sizes = []
+        self.postings = {}
+        for i, value in enumerate(self.values):
+            grams = ngrams(value, self.n)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(i)
+
+    def search(self, value, limit=5, min_score=0.5):
+        """
+        the candidate paths of value, best first
+        :return: list of (path, score), 1.0 for the same value,
+                 0.9 for the same normalized value, else the Dice
+                 coefficient of the n-grams scaled down to 0.8
+        """
+        if value in self.exact:
+            return [(path, 1.0) for path in sorted(self.exact[value])][:limit]
+        normalized = self.normalize(value)
+        if normalized in self.normalized:
+            return [(path, 0.9) for path in
+                    sorted(self.normalized[normalized])][:limit]
+        if not normalized:
+            return []
+        if self.postings is None:
+            self.build_ngrams()
+        grams = ngrams(normalized, self.n)
+        # a score of min_score needs that many n-grams in common, so a
+        # candidate is in one of the rarest len - needed + 1 postings
+        needed = max(int(math.ceil(min_score * len(grams) / 2.0)), 1)
+        postings = sorted((self.postings[g] for g in grams
+                           if g in self.postings), key=len)
+        probe = len(postings) - needed + 1
+        if probe <= 0:
+            return []
+        # the n-grams shared by too many values only confirm the
+        # candidates found by the rarer ones
+        while probe > 1 and len(postings[probe - 1]) > self.max_postings:
+            probe -= 1
+        rest = postings[probe:]
+        shared = Counter()
+        for posting in postings[:probe]:
+            shared.update(posting)
+        # verify the best upper bounds first, until they can not beat
+        # the limit-th best score found
+        bounds = sorted(
+            ((2.0 * (count + len(rest)) / (len(grams) + self.sizes[i]),
+              count, i) for i, count in shared.items()),
+            reverse=True)
+        best = []
+        candidates = []
+        for bound, count, i in bounds:
+            if bound < min_score or (len(best) == limit and bound < best[0]):
+                break
+            # the postings are sorted, look the candidate up in the rest
+            for posting in rest:
+                j = bisect_left(posting, i)
+                if j < len(posting) and posting[j] == i:
+                    count += 1
+            score = 2.0 * count / (len(grams) + self.sizes[i])
+            if score < min_score:
+                continue
+            candidates.append((round(0.8 * score, 3), self.values[i]))
+            if len(best) < limit:
+                heapq.heappush(best, score)
+            elif score > best[0]:
+                heapq.heapreplace(best, score)
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        result = []
+        for score, candidate in candidates:
+            for path in sorted(self.normalized[candidate]):
+                result.append((path, score))
+                if len(result) == limit:
+                    return result
+        return result
@@ -0,0 +1,332 @@
+"""
+long running conversion service, the rules and the parsed templates
+stay loaded between the requests:
+
+    xmapper serve --port 8080 --rules map.yaml --template template.xml
+
+    POST /convert                   the XML input as the body
+    POST /convert?source=in.xml     an input file below --root
+    GET  /stats                     cache and request counters
+
+The rules, template, record_path and wrapper query parameters override
+the defaults of the server. With record_path the records are converted
+one at a time and streamed back inside a <wrapper> element as they are
+done (<records> by default).
+At most --workers conversions run at a time, --max-pending more wait,
+the other requests get a 503. The conversions are threads of one
+process, the workers bound how many run at a time and the memory they
+take, not the CPU they get: for more cores run one server per core
+behind a load balancer.
+"""
+from collections import OrderedDict
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from itertools import chain, islice
+import json
+import os
+import socket
+from socketserver import ThreadingMixIn, UnixStreamServer
+import threading
+from urllib.parse import parse_qs, urlsplit
+from xml.sax import SAXParseException
+
+from xmapper.transformer import Transformer
+from xmapper.utils import dump_str
+from xmapper.writer import DECLARATION, RecordSerializer
+
+
+class LRUCache(object):
+    """
+    thread safe mapping of the last maxsize values built by get
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, factory):
+        """
+        :param factory: called without the lock to build a missing value
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = factory()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
+
+class Busy(Exception):
+    """
+    too many requests waiting for a worker
+    """
+
+
+class ConversionService(object):
+    """
+    converts documents with the Transformer of a rule file and a
+    template, both loaded once and kept in an LRU cache until their
+    files change
+    :param root: the file paths of the requests must be below it
+    :param rules: default rule yaml file
+    :param template: default output template file
+    :param workers: conversions running at a time, in threads sharing
+        the GIL
+    :param max_pending: requests waiting for a worker
+    """
+    def __init__(self, root='.', rules=None, template=None, workers=4,
+                 max_pending=64, cache_size=32):
+        self.root = os.path.realpath(root)
+        self.rules = rules
+        self.template = template
+        self.workers = workers
+        self.max_pending = max_pending
+        self.transformers = LRUCache(cache_size)
+        self.requests = 0
+        self.errors = 0
+        self._slots = threading.BoundedSemaphore(workers)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def resolve(self, path):
+        """
+        :return: real path of a file below root
+        """
+        real = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, real]) != self.root:
+            raise PermissionError('{} is not below {}'.format(path,
+                                                              self.root))
+        if not os.path.isfile(real):
+            raise FileNotFoundError('no such file: {}'.format(path))
+        return real
+
+    def transformer(self, rules=None, template=None):
+        """
+        :return: the cached Transformer of the rules and template files
+        """
+        rules = rules or self.rules
+        template = template or self.template
+        if not rules or not template:
+            raise ValueError('no rules or template file')
+        rules = self.resolve(rules)
+        template = self.resolve(template)
+        key = (rules, os.stat(rules).st_mtime_ns, template,
+               os.stat(template).st_mtime_ns)
+        return self.transformers.get(key, lambda: Transformer(rules,
+                                                              template))
+
+    def acquire(self):
+        """
+        wait for a worker slot, raise Busy when too many requests wait
+        """
+        with self._lock:
+            if self._waiting >= self.workers + self.max_pending:
+                raise Busy('{} requests waiting'.format(self._waiting))
+            self._waiting += 1
+        self._slots.acquire()
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def release(self):
+        self._slots.release()
+        with self._lock:
+            self._waiting -= 1
+
+    def convert(self, document, rules=None, template=None):
+        """
+        :param document: input file path below root or the XML bytes
+        :return: output XML string
+        """
+        transformer = self.transformer(rules, template)
+        if isinstance(document, str):
+            document = self.resolve(document)
+        return dump_str(transformer.transform(document))
+
+    def convert_records(self, document, record_path, rules=None,
+                        template=None, wrapper='records'):
+        """
+        :param wrapper: tag name of the element around the records
+        :return: iterator of the utf-8 chunks of the output, the outputs
+            of the records inside the wrapper element like XmlStreamWriter
+        """
+        # an invalid tag name raises ValueError
+        serializer = RecordSerializer(wrapper)
+        transformer = self.transformer(rules, template)
+        if isinstance(document, str):
+            document = self.resolve(document)
+        outputs = transformer.transform_records(document, record_path)
+        # nothing is yielded before two records are converted, so the
+        # errors up to there, like the end of a truncated body, still get
+        # a status
+        first = [serializer.serialize(output)
+                 for output in islice(outputs, 2)]
+        yield DECLARATION
+        written = False
+        for data in chain(first, (serializer.serialize(output)
+                                  for output in outputs)):
+            if data and not written:
+                yield serializer.head
+                written = True
+            yield data
+        yield serializer.tail if written else serializer.empty
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors,
+                'workers': self.workers, 'waiting': self._waiting,
+                'transformers': self.transformers.stats()}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/stats':
+            return self.reply(404, 'not found\n')
+        self.reply(200, json.dumps(self.server.service.stats()) + '\n',
+                   'application/json')
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if url.path != '/convert':
+            return self.reply(404, 'not found\n')
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        document = params.get('source') or body
+        if not document:
+            return self.reply(400, 'no XML body or source\n')
+        service.count('requests')
+        try:
+            service.acquire()
+        except Busy as e:
+            service.count('errors')
+            return self.reply(503, '{}\n'.format(e))
+        try:
+            if params.get('record_path'):
+                chunks = service.convert_records(
+                    document, params['record_path'], params.get('rules'),
+                    params.get('template'), params.get('wrapper', 'records'))
+                # the errors of the first records still get a status
+                first = next(chunks)
+                self.stream(first, chunks)
+            else:
+                self.reply(200, service.convert(
+                    document, params.get('rules'), params.get('template')),
+                    'application/xml')
+        except (FileNotFoundError, PermissionError) as e:
+            service.count('errors')
+            self.reply(404 if isinstance(e, FileNotFoundError) else 403,
+                       '{}\n'.format(e))
+        except (SAXParseException, ValueError) as e:
+            service.count('errors')
+            self.reply(400, '{}: {}\n'.format(type(e).__name__, e))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as e:
+            service.count('errors')
+            self.reply(500, '{}: {}\n'.format(type(e).__name__, e))
+        finally:
+            service.release()
+
+    def reply(self, status, text, content_type='text/plain'):
+        if getattr(self, '_streaming', False):
+            # too late for a status, cut the response
+            self.close_connection = True
+            return
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type + '; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, first, chunks):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._streaming = True
+        self.write_chunk(first)
+        for text in chunks:
+            self.write_chunk(text)
+        self.wfile.write(b'0\r\n\r\n')
+        self._streaming = False
+
+    def write_chunk(self, data):
+        if not data:
+            # an empty chunk ends the response
+            return
+        self.wfile.write('{:x}\r\n'.format(len(data)).encode('ascii') +
+                         data + b'\r\n')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(RequestHandler, self).log_message(format, *args)
+
+    def address_string(self):
+        # the client address of a unix socket is ''
+        return str(self.client_address[0]) if self.client_address else '-'
+
+
+class HTTPService(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        HTTPServer.__init__(self, address, RequestHandler)
+
+
+class UnixHTTPService(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        if os.path.exists(path):
+            os.unlink(path)
+        UnixStreamServer.__init__(self, path, RequestHandler)
+
+
+def make_server(service, host='127.0.0.1', port=8080, socket_path=None,
+                verbose=False):
+    """
+    :param socket_path: listen on that unix socket instead of host:port
+    :return: the server, call its serve_forever
+    """
+    if socket_path:
+        return UnixHTTPService(socket_path, service, verbose)
+    return HTTPService((host, port), service, verbose)
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    http.client connection to a unix socket server
+    """
+    def __init__(self, path, timeout=60):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
@@ -0,0 +1,403 @@
+"""
+binary snapshots of parsed trees, to reload the documents parsed again
+and again (templates, golden files) without parsing them:
+
+    save_snapshot(parse('template.xml'), 'template.xsnap')
+    obj = load_snapshot('template.xsnap')
+
+The nodes are stored in document order as flat arrays (parent, end of
+the subtree, tag, position, attributes) with an interned string table
+and the cdata in one buffer. load_snapshot memory maps the file and by
+default materializes a read only node with its children, cdata and
+attributes on first access only.
+
+parse(source, cache=directory) keeps a snapshot per source content in
+the directory and loads it instead of parsing when the content did not
+change.
+"""
+from array import array
+import gc
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from xmapper import utils
+from xmapper.utils import (_NO_ATTRIBUTES, _NO_CHILDREN, BaseNode,
+                           CompactNode, Node, is_string, is_url, parse,
+                           read_chunks)
+
+
+MAGIC = b'XMSNAP01'
+# node count, string count, attribute count, strings blob size, cdata
+# blob size, little endian flag
+_HEADER = struct.Struct('<6Q')
+_LITTLE = sys.byteorder == 'little'
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def save_snapshot(obj, path):
+    """
+    write the tree of obj to path, obj can be any Node of a tree
+    """
+    if not isinstance(obj, BaseNode):
+        raise TypeError('input must be a Xmapper.Node instance')
+    strings = {}
+
+    def string_id(value):
+        if value is None:
+            return -1
+        idx = strings.get(value)
+        if idx is None:
+            idx = strings[value] = len(strings)
+        return idx
+
+    parent, end, tag, position = (array('i') for _ in range(4))
+    attr_start, attr_key, attr_value = array('i'), array('i'), array('i')
+    # byte offsets for the lazy nodes, character offsets for the trees
+    # built at once out of the whole decoded cdata
+    cdata_offsets = array('q', [0])
+    cdata_chars = array('q', [0])
+    cdata = []
+    cdata_size = chars = 0
+    stack = [(obj, -1)]
+    while stack:
+        node, parent_idx = stack.pop()
+        idx = len(parent)
+        parent.append(parent_idx)
+        end.append(idx + 1)
+        tag.append(string_id(node._name))
+        position.append(string_id(node.position))
+        attr_start.append(len(attr_key))
+        for key, value in (node._attributes or {}).items():
+            attr_key.append(string_id(key))
+            attr_value.append(string_id(value))
+        data = node.cdata.encode('utf-8')
+        cdata.append(data)
+        cdata_size += len(data)
+        cdata_offsets.append(cdata_size)
+        chars += len(node.cdata)
+        cdata_chars.append(chars)
+        stack.extend((child, idx) for child in reversed(node.children))
+    # a subtree ends where the subtree of its last child ends
+    for idx in range(len(parent) - 1, 0, -1):
+        if end[idx] > end[parent[idx]]:
+            end[parent[idx]] = end[idx]
+    attr_start.append(len(attr_key))
+
+    string_offsets = array('q', [0])
+    blobs = []
+    size = 0
+    for value in strings:
+        data = value.encode('utf-8')
+        blobs.append(data)
+        size += len(data)
+        string_offsets.append(size)
+    strings_blob = b''.join(blobs)
+    cdata_blob = b''.join(cdata)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_HEADER.pack(len(parent), len(strings), len(attr_key),
+                                 len(strings_blob), len(cdata_blob),
+                                 int(_LITTLE)))
+            for data in (string_offsets, strings_blob, parent, end, tag,
+                         position, attr_start, attr_key, attr_value,
+                         cdata_offsets, cdata_chars, cdata_blob):
+                data = bytes(data) if isinstance(data, array) else data
+                f.write(data)
+                f.write(_padding(len(data)))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Snapshot(object):
+    """
+    the arrays of a memory mapped snapshot file
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        offset = len(MAGIC) + _HEADER.size
+        if len(view) < offset or bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a xmapper snapshot: {}'.format(path))
+        (nodes, strings, attrs, strings_size, cdata_size,
+         little) = _HEADER.unpack(view[len(MAGIC):offset])
+        if bool(little) != _LITTLE:
+            raise ValueError('snapshot written with another byte order')
+        sections = []
+        for fmt, count in (('q', strings + 1), ('B', strings_size),
+                           ('i', nodes), ('i', nodes), ('i', nodes),
+                           ('i', nodes), ('i', nodes + 1), ('i', attrs),
+                           ('i', attrs), ('q', nodes + 1),
+                           ('q', nodes + 1), ('B', cdata_size)):
+            size = count * struct.calcsize(fmt)
+            if offset + size > len(view):
+                raise ValueError('truncated snapshot: {}'.format(path))
+            sections.append(view[offset:offset + size].cast(fmt))
+            offset += size + (-size % 8)
+        (self.string_offsets, self.strings_blob, self.parent, self.end,
+         self.tag, self.position, self.attr_start, self.attr_key,
+         self.attr_value, self.cdata_offsets, self.cdata_chars,
+         self.cdata_blob) = sections
+        self.size = nodes
+        self._strings = [None] * strings
+
+    def string(self, idx):
+        if idx < 0:
+            return None
+        value = self._strings[idx]
+        if value is None:
+            value = self._strings[idx] = sys.intern(str(
+                self.strings_blob[self.string_offsets[idx]:
+                                  self.string_offsets[idx + 1]], 'utf-8'))
+        return value
+
+    def cdata(self, idx):
+        return str(self.cdata_blob[self.cdata_offsets[idx]:
+                                   self.cdata_offsets[idx + 1]], 'utf-8')
+
+    def attributes(self, idx):
+        start, stop = self.attr_start[idx], self.attr_start[idx + 1]
+        if start == stop:
+            return None
+        return {self.string(self.attr_key[i]): self.string(self.attr_value[i])
+                for i in range(start, stop)}
+
+    def child_indexes(self, idx):
+        child = idx + 1
+        end = self.end[idx]
+        while child < end:
+            yield child
+            child = self.end[child]
+
+    def node(self, idx):
+        """
+        :return: LazyNode of the node idx
+        """
+        return LazyNode(self, idx)
+
+    def build(self, node_class=CompactNode, mode='r'):
+        """
+        :return: the whole tree built out of node_class
+        """
+        # nothing to collect while the nodes are only added, the cyclic
+        # gc passes would take as long as the building
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._build(node_class, mode)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def _build(self, node_class, mode):
+        # plain lists and one decoded text are faster to index, the
+        # string -1 is None
+        strings = [self.string(idx) for idx in range(len(self._strings))]
+        strings.append(None)
+        text = str(self.cdata_blob, 'utf-8')
+        chars = self.cdata_chars.tolist()
+        attr_start = self.attr_start.tolist()
+        keys = self.attr_key.tolist()
+        values = self.attr_value.tolist()
+        parents = self.parent.tolist()
+        blanks = {}
+        nodes = []
+        children = []
+        for idx, (tag, position, parent) in enumerate(zip(
+                self.tag.tolist(), self.position.tolist(), parents)):
+            name = strings[tag]
+            start, stop = attr_start[idx], attr_start[idx + 1]
+            if start != stop:
+                attributes = {strings[keys[i]]: strings[values[i]]
+                              for i in range(start, stop)}
+            else:
+                # the root is built without attributes like by the Handler
+                attributes = None if name is None else {}
+            node = node_class(name, attributes, mode)
+            cdata = text[chars[idx]:chars[idx + 1]]
+            if cdata.isspace():
+                # share the indentation strings
+                cdata = blanks.setdefault(cdata, cdata)
+            node.cdata = cdata
+            node.position = strings[position]
+            nodes.append(node)
+            children.append(None)
+            if parent >= 0:
+                if children[parent] is None:
+                    children[parent] = []
+                children[parent].append(node)
+        for node, kids in zip(nodes, children):
+            if kids is None:
+                continue
+            if node_class is CompactNode:
+                node.children = tuple(kids)
+            else:
+                for kid in kids:
+                    node._attach(kid)
+        root = nodes[0]
+        if root._name is None and not root.is_root:
+            root.is_root = True
+        return root
+
+
+def _lazy_children(node):
+    snapshot = node._snapshot
+    return tuple(LazyNode(snapshot, idx)
+                 for idx in snapshot.child_indexes(node._index)) or \
+        _NO_CHILDREN
+
+
+def _lazy_attributes(node):
+    return node._snapshot.attributes(node._index) or _NO_ATTRIBUTES
+
+
+def _lazy_cdata(node):
+    return node._snapshot.cdata(node._index)
+
+
+_LAZY = {'children': _lazy_children, '_attributes': _lazy_attributes,
+         'cdata': _lazy_cdata}
+
+
+class LazyNode(CompactNode):
+    """
+    CompactNode of a memory mapped Snapshot, its children, cdata and
+    attributes are read out of the snapshot on first access
+    """
+    __slots__ = ('_snapshot', '_index')
+
+    def __init__(self, snapshot, idx):
+        self._snapshot = snapshot
+        self._index = idx
+        self._name = snapshot.string(snapshot.tag[idx])
+        self.position = snapshot.string(snapshot.position[idx])
+        self._cache = None
+
+    def __getattr__(self, key):
+        loader = _LAZY.get(key)
+        if loader is None:
+            return super(LazyNode, self).__getattr__(key)
+        value = loader(self)
+        setattr(self, key, value)
+        return value
+
+    def __repr__(self):
+        return 'LazyNode(name = {}, attributes = {}, cdata = {})'.format(
+            self._name, self._attributes, self.cdata)
+
+
+def load_snapshot(path, mode='r', compact=True, lazy=True):
+    """
+    :param mode: 'rw' builds a Node tree which can be changed
+    :param compact: with mode='r', CompactNodes instead of Nodes
+    :param lazy: with mode='r' and compact, materialize the nodes on
+        first access out of the memory mapped file
+    :return: root node
+    """
+    snapshot = Snapshot(path)
+    if mode == 'r' and compact:
+        if lazy:
+            return snapshot.node(0)
+        return snapshot.build(CompactNode)
+    return snapshot.build(Node, mode)
+
+
+class SnapshotCache(object):
+    """
+    directory of the snapshots of the parsed sources keyed by a hash of
+    their content, see parse(..., cache=...)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, source):
+        """
+        :return: hex digest of the content of the source, None when it
+            can not be read twice like a file object or an URL
+        """
+        if isinstance(source, str):
+            if is_url(source):
+                return None
+        elif not isinstance(source, (bytes, bytearray)):
+            return None
+        digest = hashlib.blake2b(MAGIC, digest_size=20)
+        text = False
+        for data in read_chunks(source, 1 << 20, views=True):
+            if is_string(data):
+                text = True
+                data = data.encode('utf-8')
+            digest.update(data)
+        # the encoding declaration applies to bytes only, a string and
+        # its utf-8 bytes can be parsed to different trees
+        digest.update(b'str' if text else b'bytes')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.xsnap')
+
+    def parse(self, source, mode='rw', compact=False, content_hash=False,
+              tag_index=False):
+        """
+        load the snapshot of the source or parse it and save one
+        """
+        key = self.key(source)
+        if key is None:
+            return parse(source, mode=mode, compact=compact,
+                         content_hash=content_hash, tag_index=tag_index,
+                         cache=False)
+        path = self.path(key)
+        root = None
+        if os.path.exists(path):
+            try:
+                root = load_snapshot(path, mode, compact)
+            except ValueError:
+                root = None
+        if root is None:
+            root = parse(source, mode=mode, compact=compact, cache=False)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            save_snapshot(root, path)
+        if content_hash:
+            root.content_hash
+        if tag_index:
+            root.tag_index
+        return root
+
+    def clear(self):
+        """
+        remove every snapshot of the directory
+        """
+        for folder, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.xsnap'):
+                    os.unlink(os.path.join(folder, name))
+
+
+def set_default_cache(cache):
+    """
+    parse every source with that cache unless parse is given one
+    :param cache: directory, SnapshotCache or None to stop
+    """
+    utils._default_cache = get_cache(cache) if cache is not None else None
+
+
+def get_cache(cache):
+    """
+    :param cache: directory or SnapshotCache
+    :return: SnapshotCache
+    """
+    if isinstance(cache, SnapshotCache):
+        return cache
+    return SnapshotCache(cache)
@@ -0,0 +1,175 @@
+import yaml
+
+from xmapper.metrics import stage
+from xmapper.utils import BaseNode, Node, _split_attr, iterparse, parse
+
+
+class Transformer(object):
+    """
+    applies the exact_match rules of a Mapper yaml config:
+
+    transformer = Transformer('map.yaml', 'output_template.xml')
+    dump_xml(transformer.transform('input.xml'), 'output.xml')
+
+    the rules and the output template are loaded once, every rule is
+    compiled into a getter on the input document and a setter on a
+    fresh copy of the template.
+    """
+    def __init__(self, rules, template, mode='rw'):
+        """
+        :param rules: yaml config file path or the Mapper.MAPPER dict
+        :param template: output template, anything parse accepts or a Node
+        :param mode: mode of the output Nodes
+        """
+        if not isinstance(rules, dict):
+            with open(rules) as f:
+                rules = yaml.safe_load(f)
+        self.rules = dict(rules.get('exact_match') or {})
+        if isinstance(template, BaseNode):
+            self.template = template
+        else:
+            self.template = parse(template, mode='r')
+        self.mode = mode
+        self._compiled = {}
+
+    def compile(self, record_path=None):
+        """
+        compile the rules for documents or for the records at record_path
+        :param record_path: path of the records the input paths are
+            relative to, None for whole documents
+        :return: list of (getter, setter)
+        """
+        if record_path in self._compiled:
+            return self._compiled[record_path]
+        order = {id(node): idx for idx, node in
+                 enumerate(_preorder(self.template))}
+        index = self.template.path_index
+        compiled = []
+        for output_path, input_path in sorted(self.rules.items()):
+            output_path, output_attr = _split_attr(output_path)
+            target = index.resolve(output_path)
+            if target is None:
+                raise ValueError(
+                    'output path not in template: {}'.format(output_path))
+            if isinstance(target, list):
+                targets = [order[id(node)] for node in target]
+            else:
+                targets = [order[id(target)]]
+            if record_path is not None:
+                input_path = _relative_path(input_path, record_path)
+            compiled.append((_compile_getter(input_path),
+                             _compile_setter(targets, output_attr)))
+        self._compiled[record_path] = compiled
+        return compiled
+
+    @stage('transform')
+    def transform(self, document, record_path=None):
+        """
+        :param document: input Node, or anything parse accepts
+        :param record_path: see compile, for records from iterparse
+        :return: output Node
+        """
+        if not isinstance(document, BaseNode):
+            document = parse(document)
+        root, nodes = _copy_tree(self.template, self.mode)
+        for getter, setter in self.compile(record_path):
+            setter(nodes, getter(document))
+        return root
+
+    def transform_records(self, source, record_path, **parser_features):
+        """
+        stream the records at record_path out of source and
+        yield one output Node per record
+        """
+        compiled = self.compile(record_path)
+        for record in iterparse(source, record_path, **parser_features):
+            root, nodes = _copy_tree(self.template, self.mode)
+            for getter, setter in compiled:
+                setter(nodes, getter(record))
+            yield root
+
+
+def _relative_path(path, record_path):
+    """
+    'listing.ad.0.id' relative to 'listing.ad' is 'id'
+    """
+    prefix = record_path + '.'
+    if not path.startswith(prefix):
+        raise ValueError(
+            'input path {} is outside of {}'.format(path, record_path))
+    path = path[len(prefix):]
+    position, _, rest = path.partition('.')
+    if position.isdigit():
+        path = rest
+    return path
+
+
+def _compile_getter(path):
+    path, attr_key = _split_attr(path)
+
+    if attr_key is not None:
+        def getter(document):
+            obj = document.path_index.resolve(path)
+            if isinstance(obj, BaseNode):
+                return obj._attributes.get(attr_key, '')
+            return ''
+    else:
+        def getter(document):
+            obj = document.path_index.resolve(path)
+            if obj is None:
+                return ''
+            if isinstance(obj, list):
+                return [node.cdata.strip() for node in obj]
+            return obj.cdata.strip()
+    return getter
+
+
+def _compile_setter(targets, attr_key):
+    first = targets[0]
+
+    if attr_key is not None:
+        def setter(nodes, value):
+            nodes[first]._attributes[attr_key] = value
+    else:
+        def setter(nodes, value):
+            # same as set_value_by_path: a list of values fills the
+            # repeated target nodes, a single value the first one
+            if isinstance(value, list):
+                for idx, val in zip(targets, value):
+                    nodes[idx].cdata = val
+            else:
+                nodes[first].cdata = value
+    return setter
+
+
+def _preorder(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+def _copy_tree(node, mode):
+    """
+    :return: (copy of the tree, list of the copied Nodes in preorder)
+    """
+    nodes = []
+    root = None
+    stack = [(node, None)]
+    while stack:
+        node, parent = stack.pop()
+        attributes = None if node._attributes is None \
+            else dict(node._attributes)
+        new = Node(node._name, attributes, mode)
+        new.cdata = node.cdata
+        new.position = node.position
+        new.is_root = node.is_root
+        nodes.append(new)
+        if parent is None:
+            root = new
+        else:
+            # a new tree, nothing cached to drop yet
+            parent._attach(new)
+        stack.extend((child, new) for child in reversed(node.children))
+    return root, nodes
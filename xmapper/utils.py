@@ -1,6 +1,15 @@
-from collections import Counter
-import copy
+import bz2
+from collections import Counter, deque
+from functools import lru_cache
+import gzip
+import hashlib
+from io import BufferedReader, BytesIO
+import lzma
+import mmap
 import os
+from sys import intern
+from types import MappingProxyType
+from urllib.request import urlopen
 
 from lxml import etree
 from untangle import Element
@@ -8,10 +17,24 @@ from untangle import is_url, is_string
 from untangle import StringIO
 from xml.sax import make_parser, handler
 
+from xmapper.metrics import count_tree, stage
+from xmapper.query import select, select_values
+
+
+# characters of the blank text dropped by lxml remove_blank_text,
+# \r is written as &#13; so it never counts as blank
+_XML_BLANKS = ' \t\n'
+
+# SnapshotCache used by parse when it is not given one, see
+# xmapper.snapshot.set_default_cache
+_default_cache = None
+
 
 class CachedProperty(object):
     """
     Descriptor (non-data) for building an attribute on-demand on first use.
+    The attribute is cached by the node until the node or one of its
+    descendants changes, see Node._changed.
     """
     def __init__(self, factory):
         """
@@ -21,20 +44,253 @@ class CachedProperty(object):
         self._factory = factory
 
     def __get__(self, instance, owner):
-        # Build the attribute.
-        attr = self._factory(instance)
-
-        # If readonly mode cache the value; hide ourselves.
-        if instance.mode == 'r':
-            setattr(instance, self._attr_name, attr)
+        if instance is None:
+            return self
+        attr = instance._cached(self._attr_name)
+        if attr is None:
+            # Build the attribute.
+            attr = self._factory(instance)
+            instance._store_cache(self._attr_name, attr)
         return attr
 
 
-class Node(Element):
-    def __init__(self, name, attributes, mode='rw'):
-        super(Node, self).__init__(name, attributes)
-        self.position = None
-        self.mode = mode
+class IndexProperty(CachedProperty):
+    """
+    CachedProperty depending on the tree structure only, setting values
+    does not invalidate it, adding children does.
+    """
+
+
+class ContentProperty(CachedProperty):
+    """
+    CachedProperty depending on the values and attributes as well,
+    setting them invalidates it, its name goes in _CONTENT_CACHES.
+    """
+
+
+# the cached attributes depending on the values, the others only depend
+# on the structure
+_CONTENT_CACHES = ('content_hash', 'unordered_hash', 'attr_index')
+
+
+def _hash_node(node, child_digests):
+    """
+    digest of the name, the sorted attributes, the value of a leaf
+    (stripped like get_value_by_path) and the child digests
+    """
+    value = '' if node.children else node.cdata.strip()
+    digest = hashlib.blake2b(digest_size=16)
+    attributes = sorted(node._attributes.items()) if node._attributes else []
+    digest.update(repr((node._name, attributes, value)).encode('utf-8'))
+    for child in child_digests:
+        digest.update(child)
+    return digest.digest()
+
+
+class PathIndex(object):
+    """
+    Maps the dotted paths of a tree to their Node, or to the list of
+    Nodes when the tag name is repeated under the same parent:
+    {'bookstore': <bookstore>,
+     'bookstore.book': [<book>, <book>],
+     'bookstore.book.0': <book>,
+     'bookstore.book.0.title': <title>,
+     ...}
+    The keys are the same as Node.all_paths, other valid paths like
+    'bookstore.book.title' (first book) are resolved on first use
+    and remembered.
+    """
+    def __init__(self, node):
+        self.root = node
+        self.nodes = {}
+        self.aliases = {}
+        nodes = self.nodes
+        stack = [('', node)]
+        while stack:
+            prefix, parent = stack.pop()
+            for name, children in _group_children(parent).items():
+                key = prefix + name
+                if len(children) == 1:
+                    nodes[key] = children[0]
+                    stack.append((key + '.', children[0]))
+                else:
+                    nodes[key] = children
+                    for idx, child in enumerate(children):
+                        child_key = '{}.{}'.format(key, idx)
+                        nodes[child_key] = child
+                        stack.append((child_key + '.', child))
+
+    def get(self, path):
+        """
+        :param path: path in Node.all_paths
+        :return: Node, list of Node or None
+        """
+        return self.nodes.get(path)
+
+    def resolve(self, path):
+        """
+        :param path: any path get_value_by_path accepts, without @attr
+        :return: Node, list of Node or None
+        """
+        if not path:
+            return self.root
+        target = self.nodes.get(path)
+        if target is None:
+            target = self.aliases.get(path)
+        if target is not None:
+            return target
+        parent_path, _, segment = path.rpartition('.')
+        parent = self.resolve(parent_path)
+        if parent is None:
+            return
+        target = _step(parent, segment)
+        if target is not None:
+            self.aliases[path] = target
+        return target
+
+
+class TagIndex(object):
+    """
+    Inverted index of a subtree: tag name -> its nodes in document
+    order, with their preorder number and the preorder number of their
+    last descendant to skip the nodes nested in a match:
+    {'book': ([1, 5], [4, 8], [<book>, <book>])}
+    """
+    def __init__(self, node=None):
+        self.tags = {}
+        self.count = 0
+        if node is not None:
+            self.build(node)
+
+    def open(self, node):
+        """
+        add the node, called in document order
+        :return: handle for close
+        """
+        entry = self.tags.get(node._name)
+        if entry is None:
+            entry = self.tags[node._name] = ([], [], [])
+        entry[0].append(self.count)
+        entry[1].append(None)
+        entry[2].append(node)
+        self.count += 1
+        return entry, len(entry[0]) - 1
+
+    def close(self, handle):
+        """
+        called once all the descendants of the node are added
+        """
+        entry, idx = handle
+        entry[1][idx] = self.count - 1
+
+    def build(self, node):
+        stack = [(node, None)]
+        while stack:
+            obj, handle = stack.pop()
+            if handle is not None:
+                self.close(handle)
+                continue
+            if obj._name is not None:
+                stack.append((obj, self.open(obj)))
+            stack.extend((child, None) for child in reversed(obj.children))
+
+    def iter(self, tag, outermost=False):
+        """
+        the nodes of that tag name in document order
+        :param outermost: skip the nodes nested in a previous one
+        """
+        entry = self.tags.get(tag)
+        if entry is not None:
+            return _iter_entry(entry, outermost)
+        return iter(())
+
+    def build_attributes(self):
+        """
+        :return: {(tag, attribute key, value): entry like in tags}
+        """
+        attributes = {}
+        for tag, (pres, ends, nodes) in self.tags.items():
+            for pre, end, node in zip(pres, ends, nodes):
+                if not node._attributes:
+                    continue
+                for key, value in node._attributes.items():
+                    entry = attributes.get((tag, key, value))
+                    if entry is None:
+                        entry = attributes[tag, key, value] = ([], [], [])
+                    entry[0].append(pre)
+                    entry[1].append(end)
+                    entry[2].append(node)
+        return attributes
+
+
+def _iter_entry(entry, outermost, predicate=None):
+    if not outermost and predicate is None:
+        yield from entry[2]
+        return
+    last = -1
+    for pre, end, node in zip(*entry):
+        if pre > last and (predicate is None or predicate(node)):
+            if outermost:
+                last = end
+            yield node
+
+
+def _group_children(node):
+    """
+    :return: dict of tag name -> list of children in document order
+    """
+    groups = {}
+    for child in node.children:
+        groups.setdefault(child._name, []).append(child)
+    return groups
+
+
+def _step(obj, segment):
+    """
+    one step of a dotted path walk the same way as untangle getattr
+    :param obj: Node or list of Node
+    :param segment: tag name or position
+    :return: Node, list of Node or None
+    """
+    if segment.isdigit():
+        if not isinstance(obj, list):
+            return
+        try:
+            return obj[int(segment)]
+        except IndexError:
+            return
+    if isinstance(obj, list):
+        obj = obj[0]
+    children = [c for c in obj.children if c._name == segment]
+    if not children:
+        return
+    if len(children) == 1:
+        return children[0]
+    return children
+
+
+def _split_attr(path):
+    """
+    split 'property.agent.@name' into ('property.agent', 'name')
+    :return: (path, attribute key or None)
+    """
+    if '@' not in path:
+        return path, None
+    path_list = path.split('.')
+    for idx, segment in enumerate(path_list):
+        if segment.startswith('@'):
+            return '.'.join(path_list[:idx]), segment[1:]
+    return path, None
+
+
+class BaseNode(object):
+    """
+    xmapper API shared by Node and CompactNode, the subclasses provide
+    _name, _attributes, children, cdata, position and mode
+    """
+    __slots__ = ()
+
+    compact = False
 
     def raw_paths(self):
         if not self.children:
@@ -52,26 +308,113 @@ class Node(Element):
         return raw_paths
 
     def build_position(self):
+        if self._build_position():
+            # the paths below self hold the positions
+            self._changed(structure=True)
+
+    def _build_position(self):
+        """
+        build_position without invalidation, for building new trees
+        :return: True if a position changed
+        """
+        if len(self.children) < 2:
+            return False
         names = [i._name for i in self.children]
+        if len(set(names)) == len(names):
+            return False
         count = Counter(names)
         duplicates = {k: 0 for k, v in count.items() if v > 1}
+        changed = False
         for item in duplicates:
             for child in self.children:
                 if child._name == item:
-                    child.position = str(duplicates[item])
+                    position = intern(str(duplicates[item]))
+                    if child.position != position:
+                        child.position = position
+                        changed = True
                     duplicates[item] = duplicates[item] + 1
+        return changed
+
+    @stage('paths')
+    def build_paths(self):
+        """
+        walk the tree once and collect the full paths and
+        the partial paths together, see paths and all_paths
+        :return: (set of full paths, set of all paths)
+        """
+        if self._name is not None and self.position is not None:
+            base = self.position
+        else:
+            base = ''
+        if not self.children:
+            return {base}, {base}
+        paths = set()
+        all_paths = {base} if base else set()
+        stack = [(base + '.' if base else '', self)]
+        while stack:
+            prefix, node = stack.pop()
+            for child in node.children:
+                path = prefix + child._name
+                all_paths.add(path)
+                if child.position is not None:
+                    path = path + '.' + child.position
+                    all_paths.add(path)
+                if child.children:
+                    stack.append((path + '.', child))
+                else:
+                    paths.add(path)
+        return paths, all_paths
 
     def clean_path_cache(self):
         """
-        clean the path cache after the structure changed
+        clean the caches of the whole tree, only needed after changing
+        the children lists directly instead of with add_child
         pls use this on top level tree
         """
-        if 'paths' in self.__dict__:
-            delattr(self, 'paths')
-        if 'all_paths' in self.__dict__:
-            delattr(self, 'all_paths')
-        for child in self.children:
-            child.clean_path_cache()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._drop_cache()
+            stack.extend(node.children)
+
+    @ContentProperty
+    def content_hash(self):
+        """
+        digest of the names, attributes and leaf values of the subtree,
+        equal subtrees have the same digest wherever they are, see
+        parse(..., content_hash=True) to build them while parsing
+        """
+        return self.build_hash('content_hash')
+
+    @ContentProperty
+    def unordered_hash(self):
+        """
+        content_hash where the order of the children does not count
+        """
+        return self.build_hash('unordered_hash')
+
+    def build_hash(self, name):
+        """
+        build the hashes of the subtree bottom-up, reusing the ones
+        already cached
+        :param name: 'content_hash' or 'unordered_hash'
+        """
+        ordered = name == 'content_hash'
+        stack = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children
+                             if child._cached(name) is None)
+                continue
+            digests = [child._cached(name) for child in node.children]
+            if not ordered:
+                digests.sort()
+            digest = _hash_node(node, digests)
+            if node is self:
+                return digest
+            node._store_cache(name, digest)
 
     @CachedProperty
     def paths(self):
@@ -91,14 +434,8 @@ class Node(Element):
         :return set of full paths
         :type set
         """
-        raw_paths = copy.deepcopy(self.raw_paths())
-        for p in raw_paths:
-            if None in p:
-                p.remove(None)
-        if self._name is not None:
-            for p in raw_paths:
-                del p[0]
-        paths = {str('.'.join(p)) for p in raw_paths}
+        paths, all_paths = self.build_paths()
+        self._store_cache('all_paths', all_paths)
         return paths
 
     @CachedProperty
@@ -123,18 +460,17 @@ class Node(Element):
         :return: a set of all the paths
         :type set
         """
-        paths = set()
-        for full_path in self.paths:
-            partials = full_path.split('.')
-            for i in range(1, len(partials) + 1)[::-1]:
-                partial = partials[0:i]
-                if partial:
-                    to_add_path = '.'.join(partial)
-                    if to_add_path in paths:
-                        break
-                    else:
-                        paths.add(to_add_path)
-        return paths
+        paths, all_paths = self.build_paths()
+        self._store_cache('paths', paths)
+        return all_paths
+
+    @IndexProperty
+    def path_index(self):
+        """
+        path -> Node index of the tree, see PathIndex
+        :return: PathIndex
+        """
+        return PathIndex(self)
 
     def get_value_by_path(self, path):
         """
@@ -145,30 +481,73 @@ class Node(Element):
         """
         obj = self
         if isinstance(path, str):
-            path_list = path.split('.')
-            for i in path_list:
-                if i.isdigit():
-                    obj = obj[int(i)]
-                elif isinstance(obj, list):
-                    try:
-                        obj = getattr(obj[0], i)
-                    except AttributeError:
-                        return ''
-                elif i[0] == '@':
-                    return obj._attributes.get(i[1:], '')
-                else:
-                    try:
-                        obj = getattr(obj, i)
-                    except AttributeError:
-                        return ''
+            path, attr_key = _split_attr(path)
+            obj = self.path_index.resolve(path)
+            if attr_key is not None:
+                if isinstance(obj, BaseNode):
+                    return obj._attributes.get(attr_key, '')
+                return ''
+            if obj is None:
+                return ''
         if isinstance(obj, list):
             return [node.cdata.strip() for node in obj]
-        if isinstance(obj, str) and obj.strip() == '':
-            return []
-        if isinstance(obj, str):
-            return obj
         return obj.cdata.strip()
 
+    @IndexProperty
+    def tag_index(self):
+        """
+        tag name -> nodes index of the subtree, see TagIndex
+        :return: TagIndex
+        """
+        return TagIndex(self)
+
+    @ContentProperty
+    def attr_index(self):
+        """
+        (tag name, attribute key, value) -> nodes index of the subtree
+        """
+        return self.tag_index.build_attributes()
+
+    def iter_by_tag(self, tag, outermost=False):
+        """
+        iterate the nodes of that tag name, self included, in document
+        order
+        :param outermost: skip the nodes inside a previous match
+        """
+        return self.tag_index.iter(tag, outermost)
+
+    def iter_by_attr_value(self, tag, attr_key, value):
+        """
+        iterate the outermost nodes of that tag name whose attribute
+        attr_key is value
+        """
+        if value is None:
+            # the nodes without that attribute, not in the index
+            entry = self.tag_index.tags.get(tag)
+
+            def predicate(node):
+                return node._attributes.get(attr_key) is None
+        else:
+            entry = self.attr_index.get((tag, attr_key, value))
+            predicate = None
+        if entry is not None:
+            return _iter_entry(entry, True, predicate)
+        return iter(())
+
+    def select(self, query):
+        """
+        lazily iterate the nodes matching the query, or the attribute
+        values with a last @key segment, see xmapper.query
+        :param query: query string or compiled Query
+        """
+        return select(self, query)
+
+    def select_values(self, query):
+        """
+        like select but the stripped values of the matched nodes
+        """
+        return select_values(self, query)
+
     def get_value_by_tag(self, tag):
         """
         get all the object.cdata of that tag name
@@ -176,17 +555,10 @@ class Node(Element):
         :param tag: tag name
         :return: empty list or list of value
         """
-        if not self.children:
-            if self._name == tag:
-                return [self.cdata]
-            else:
-                return
-        results = []
-        for child in self.children:
-            result = child.get_value_by_tag(tag)
-            if result:
-                results += result
-        return results
+        if not self.children and self._name != tag:
+            return
+        return [node.cdata for node in self.iter_by_tag(tag)
+                if not node.children]
 
     def set_value_by_tag(self, tag, value):
         """
@@ -196,10 +568,9 @@ class Node(Element):
         :param tag: tag name
         :value value: value for that tag
         """
-        if self._name == tag:
-            self.cdata = value
-        for child in self.children:
-            child.set_value_by_tag(tag, value)
+        for node in list(self.iter_by_tag(tag)):
+            node.cdata = value
+            node._changed()
 
     def get_attr_by_tag(self, tag):
         """
@@ -210,12 +581,9 @@ class Node(Element):
         """
         if self._name == tag:
             return [self._attributes]
-        results = []
-        for child in self.children:
-            result = child.get_attr_by_tag(tag)
-            if result:
-                results += result
-        return [i for i in results if i]
+        return [node._attributes
+                for node in self.iter_by_tag(tag, outermost=True)
+                if node._attributes]
 
     def get_attr_value_by_tag(self, tag, attr_key):
         """
@@ -227,12 +595,9 @@ class Node(Element):
         """
         if self._name == tag:
             return [self._attributes.get(attr_key, '')]
-        results = []
-        for child in self.children:
-            result = child.get_attr_value_by_tag(tag, attr_key)
-            if result:
-                results += result
-        return [i for i in results if i]
+        values = (node._attributes.get(attr_key, '')
+                  for node in self.iter_by_tag(tag, outermost=True))
+        return [value for value in values if value]
 
     def get_obj_by_tag(self, tag):
         """
@@ -241,14 +606,7 @@ class Node(Element):
         :param tag: tag name
         :return: empty list or list of Node object
         """
-        if self._name == tag:
-            return [self]
-        results = []
-        for child in self.children:
-            result = child.get_obj_by_tag(tag)
-            if result:
-                results += result
-        return results
+        return list(self.iter_by_tag(tag, outermost=True))
 
     def get_obj_by_attr_value(self, tag, attr_key, value):
         """
@@ -257,42 +615,28 @@ class Node(Element):
         :param tag: tag name
         :return: empty list or list of Node object
         """
-        if self._name == tag and \
-                self._attributes.get(attr_key) == value:
-            return [self]
-        results = []
-        for child in self.children:
-            result = child.get_obj_by_attr_value(tag, attr_key, value)
-            if result:
-                results += result
-        return results
+        return list(self.iter_by_attr_value(tag, attr_key, value))
 
     def get_object_by_path(self, path):
-        obj = self
         if isinstance(path, str):
-            if path not in self.all_paths:
-                return
-            path_list = path.split('.')
-            for i in path_list:
-                try:
-                    if i.isdigit():
-                        obj = obj[int(i)]
-                    else:
-                        obj = getattr(obj, i)
-                except AttributeError:
-                    return
+            return self.path_index.get(path)
+        return self
+
+    def _resolve_path(self, path):
+        """
+        resolve path like getattr does and raise AttributeError
+        if it does not exist
+        """
+        if not isinstance(path, str):
+            return self
+        obj = self.path_index.resolve(path)
+        if obj is None:
+            raise AttributeError(
+                "'{}' has no path '{}'".format(self._name, path))
         return obj
 
     def get_attr_by_path(self, path):
-        obj = self
-        if isinstance(path, str):
-            path_list = path.split('.')
-            for i in path_list:
-                if i.isdigit():
-                    obj = obj[int(i)]
-                else:
-                    obj = getattr(obj, i)
-        return obj._attributes
+        return self._resolve_path(path)._attributes
 
     def get_attr_value_by_path(self, path):
         """
@@ -305,47 +649,34 @@ class Node(Element):
         obj = self
         attr_key = ''
         if isinstance(path, str):
-            path_list = path.split('.')
-            attr_key = path_list[-1].strip('@')
-            if '.'.join(path_list[:-1]) not in self.all_paths:
+            path, _, attr_key = path.rpartition('.')
+            attr_key = attr_key.strip('@')
+            obj = self.path_index.get(path) if path else self
+            if not isinstance(obj, BaseNode):
                 return ''
-            for i in path_list[:-1]:
-                if i.isdigit():
-                    obj = obj[int(i)]
-                else:
-                    obj = getattr(obj, i)
         return obj._attributes.get(attr_key, '')
 
     def set_value_by_path(self, path, value):
-        obj = self
-        if isinstance(path, str):
-            path_list = path.split('.')
-            for i in path_list:
-                if i.isdigit():
-                    obj = obj[int(i)]
-                else:
-                    obj = getattr(obj, i)
-            if isinstance(value, list):
-                for idx, val in enumerate(value):
-                    setattr(obj[idx], 'cdata', val)
-            elif isinstance(obj, list):
-                setattr(obj[0], 'cdata', value)
-            else:
-                setattr(obj, 'cdata', value)
+        obj = self._resolve_path(path)
+        if isinstance(value, list):
+            for idx, val in enumerate(value):
+                setattr(obj[idx], 'cdata', val)
+                obj[idx]._changed()
+        elif isinstance(obj, list):
+            setattr(obj[0], 'cdata', value)
+            obj[0]._changed()
+        else:
+            setattr(obj, 'cdata', value)
+            obj._changed()
 
     def set_attr_by_path(self, path, value):
-        obj = self
-        if isinstance(path, str):
-            path_list = path.split('.')
-            for i in path_list:
-                if i.isdigit():
-                    obj = obj[int(i)]
-                else:
-                    obj = getattr(obj, i)
-            for k, v in value.items():
-                obj._attributes[k] = v
+        obj = self._resolve_path(path)
+        for k, v in value.items():
+            obj._attributes[k] = v
+        obj._changed()
 
     @property
+    @stage('value_mapping')
     def value_mapping(self):
         mapping = {}
         for i in self.paths:
@@ -368,47 +699,621 @@ class Node(Element):
         return mapping
 
 
+class Node(BaseNode, Element):
+    """
+    untangle Element with the xmapper API. The cached attributes are
+    kept with the generation of the node they were built for, every
+    change bumps the generations of the changed node and its ancestors
+    only, so the caches of the other subtrees stay valid.
+    """
+    def __init__(self, name, attributes, mode='rw'):
+        super(Node, self).__init__(name, attributes)
+        self.position = None
+        self.mode = mode
+        self._parent = None
+        # {name: (generation, value)}
+        self._caches = None
+        # bumped by structure changes / by any change
+        self._structure = 0
+        self._content = 0
+
+    def add_child(self, element):
+        # drop the child lookup untangle cached for that name
+        cached = self.__dict__.get(element._name)
+        if isinstance(cached, Node) or (isinstance(cached, list) and
+                                        cached is not self.children):
+            del self.__dict__[element._name]
+        self._attach(element)
+        self._changed(structure=True)
+
+    def _attach(self, element):
+        # add_child without invalidation, for building new trees
+        element._parent = self
+        self.children.append(element)
+
+    def _changed(self, structure=False):
+        """
+        invalidate the caches of the node and its ancestors
+        :param structure: children were added or removed, else only
+            values or attributes changed
+        """
+        node = self
+        while node is not None:
+            node._content += 1
+            if structure:
+                node._structure += 1
+            node = node._parent
+
+    def _generation(self, name):
+        return self._content if name in _CONTENT_CACHES else self._structure
+
+    def _store_cache(self, name, value):
+        if self._caches is None:
+            self._caches = {}
+        self._caches[name] = (self._generation(name), value)
+
+    def _cached(self, name):
+        if self._caches is None:
+            return None
+        entry = self._caches.get(name)
+        if entry is None or entry[0] != self._generation(name):
+            return None
+        return entry[1]
+
+    def _drop_cache(self):
+        self._caches = None
+
+
+# shared by all the CompactNodes without attributes / children
+_NO_ATTRIBUTES = MappingProxyType({})
+_NO_CHILDREN = ()
+
+
+class CompactNode(BaseNode):
+    """
+    Read only Node using __slots__ instead of an untangle Element,
+    see parse(..., mode='r', compact=True). Tag names are interned,
+    empty attributes and children are shared, children become a
+    tuple once the element is closed and the root is the Node
+    without name.
+    """
+    __slots__ = ('_name', '_attributes', 'children', 'cdata', 'position',
+                 '_cache')
+
+    compact = True
+    mode = 'r'
+
+    def __init__(self, name, attributes, mode='r'):
+        self._name = name
+        self._attributes = attributes or _NO_ATTRIBUTES
+        self.children = []
+        self.cdata = ''
+        self.position = None
+        self._cache = None
+
+    @property
+    def is_root(self):
+        return self._name is None
+
+    def _store_cache(self, name, value):
+        if self._cache is None:
+            self._cache = {}
+        self._cache[name] = value
+
+    def _cached(self, name):
+        if self._cache is None:
+            return None
+        return self._cache.get(name)
+
+    def _drop_cache(self):
+        self._cache = None
+
+    def _changed(self, structure=False):
+        # read only tree, only drop the caches of the node itself
+        if self._cache is not None:
+            for name in (self._cache.copy() if structure else _CONTENT_CACHES):
+                self._cache.pop(name, None)
+
+    def set_value_by_path(self, *args):
+        # without parents the hashes of the ancestors would stay stale
+        raise ValueError("compact trees are read only, parse with "
+                         "mode='rw'")
+
+    set_attr_by_path = set_value_by_tag = add_child = set_value_by_path
+
+    def _build_position(self):
+        """
+        called once the element is closed, pack the children and cdata
+        """
+        changed = super(CompactNode, self)._build_position()
+        self.children = tuple(self.children) or _NO_CHILDREN
+        if not self.cdata.strip():
+            self.cdata = intern(self.cdata)
+        return changed
+
+    # untangle Element API, add_child raises like the setters
+    def _attach(self, element):
+        self.children.append(element)
+
+    def add_cdata(self, cdata):
+        self.cdata = self.cdata + cdata
+
+    def get_attribute(self, key):
+        return self._attributes.get(key)
+
+    def get_elements(self, name=None):
+        if name:
+            return [e for e in self.children if e._name == name]
+        return self.children
+
+    def __getitem__(self, key):
+        return self.get_attribute(key)
+
+    def __getattr__(self, key):
+        matching_children = [x for x in self.children if x._name == key]
+        if not matching_children:
+            raise AttributeError(
+                "'{}' has no attribute '{}'".format(self._name, key))
+        if len(matching_children) == 1:
+            return matching_children[0]
+        return matching_children
+
+    def __iter__(self):
+        yield self
+
+    def __repr__(self):
+        return 'CompactNode(name = {}, attributes = {}, cdata = {})'.format(
+            self._name, self._attributes, self.cdata)
+
+    def __bool__(self):
+        return self.is_root or self._name is not None
+
+    def __eq__(self, val):
+        return self.cdata == val
+
+    __hash__ = None
+
+    def __dir__(self):
+        return [x._name for x in self.children]
+
+    def __len__(self):
+        return len(self.children)
+
+    def __contains__(self, key):
+        return key in dir(self)
+
+
 class Handler(handler.ContentHandler):
     """
     SAX handler which creates the Python object structure out of ``Node``s
     """
-    def __init__(self,  mode='rw'):
+    def __init__(self,  mode='rw', node_class=Node, content_hash=False,
+                 tag_index=False):
         self.mode = mode
-        self.root = Node(None, None, self.mode)
-        self.root.is_root = True
+        self.node_class = node_class
+        # build the content_hash of every element once it is closed
+        self.content_hash = content_hash
+        # TagIndex of the document built in the same pass
+        self.tag_index = TagIndex() if tag_index else None
+        self.tag_handles = []
+        self.root = node_class(None, None, self.mode)
+        if not self.root.is_root:
+            self.root.is_root = True
         self.elements = []
+        # cdata chunks of the open elements, joined once at endElement
+        self.chunks = []
         self.index = {}
 
     def startElement(self, name, attributes):
-        name = name.replace('-', '~')
-        name = name.replace('.', '!')
-        name = name.replace(':', '*')
+        name = escape_tag(name)
         attrs = dict()
         for k, v in attributes.items():
-            attrs[k] = v
-        element = Node(name, attrs, self.mode)
+            attrs[intern(k)] = v
+        element = self.node_class(name, attrs, self.mode)
         self.index[element._name] = 0
         if len(self.elements) > 0:
-            self.elements[-1].add_child(element)
+            self.elements[-1]._attach(element)
             self.index[element._name] = self.index[element._name] + 1
         else:
-            self.root.add_child(element)
+            self.root._attach(element)
             self.index[element._name] = self.index[element._name] + 1
         self.elements.append(element)
+        self.chunks.append([])
+        if self.tag_index is not None:
+            self.tag_handles.append(self.tag_index.open(element))
 
     def endElement(self, name):
-        self.elements[-1].build_position()
-        self.elements.pop()
+        element = self.elements.pop()
+        element.cdata = ''.join(self.chunks.pop())
+        element._build_position()
+        if self.content_hash:
+            # the children are hashed already, build and cache it
+            element.content_hash
+        if self.tag_index is not None:
+            self.tag_index.close(self.tag_handles.pop())
 
     def characters(self, cdata):
-        self.elements[-1].add_cdata(cdata)
+        self.chunks[-1].append(cdata)
+
+
+class RecordHandler(Handler):
+    """
+    SAX handler which only builds the ``Node``s of the record subtrees
+    found at record_path, everything outside of them is dropped
+    """
+    def __init__(self, record_path, mode='rw', content_hash=False):
+        super(RecordHandler, self).__init__(mode, content_hash=content_hash)
+        self.record_path = record_path.split('.')
+        self.names = []
+        self.records = deque()
+
+    def startElement(self, name, attributes):
+        self.names.append(escape_tag(name))
+        if self.elements or self.names == self.record_path:
+            super(RecordHandler, self).startElement(name, attributes)
+
+    def endElement(self, name):
+        self.names.pop()
+        if self.elements:
+            super(RecordHandler, self).endElement(name)
+            if not self.elements:
+                record = self.root.children.pop()
+                record._parent = None
+                self.records.append(record)
+
+    def characters(self, cdata):
+        if self.elements:
+            self.chunks[-1].append(cdata)
+
+
+@lru_cache(maxsize=1024)
+def escape_tag(name):
+    """
+    escape the characters of a tag name which can not be
+    used in a dotted path or python attribute
+    """
+    name = name.replace('-', '~')
+    name = name.replace('.', '!')
+    name = name.replace(':', '*')
+    return intern(name)
+
+
+@lru_cache(maxsize=1024)
+def unescape_tag(name):
+    """
+    restore the tag name escaped by escape_tag
+    """
+    name = name.replace('!', '.')
+    name = name.replace('*', ':')
+    name = name.replace('~', '-')
+    return name
+
+
+# magic bytes of the compressed sources, decompressed as a stream
+_COMPRESSIONS = ((b'\x1f\x8b', gzip.open), (b'BZh', bz2.open),
+                 (b'\xfd7zXZ\x00', lzma.open))
+
+
+def _opener(head):
+    """
+    :return: the open function of the compression starting with head
+        or None
+    """
+    for magic, opener in _COMPRESSIONS:
+        if head.startswith(magic):
+            return opener
+
+
+class _ClosingStream(object):
+    """
+    decompressed stream closing the raw stream it reads as well, the
+    gzip, bz2 and lzma files leave the file objects they get open
+    """
+    def __init__(self, stream, raw):
+        self.stream = stream
+        self.raw = raw
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.raw.close()
 
-def parse(filename, mode='rw', **parser_features):
+
+def _decompress(stream, head):
+    opener = _opener(head)
+    if opener is None:
+        return stream
+    return _ClosingStream(opener(stream, 'rb'), stream)
+
+
+def open_source(source):
+    """
+    Interprets the given source as a filename, URL, file object or
+    XML data the same way as parse, gzip, bz2 and xz compressed files,
+    URLs and bytes are decompressed as a stream
+    :return: (readable stream, whether the caller has to close it)
+    """
+    if is_string(source) and os.path.exists(source):
+        stream = open(source, 'rb')
+        return _decompress(stream, stream.peek(6)), True
+    if is_url(source):
+        stream = BufferedReader(urlopen(source))
+        return _decompress(stream, stream.peek(6)), True
+    if hasattr(source, 'read'):
+        return source, False
+    if isinstance(source, (bytes, bytearray)):
+        return _decompress(BytesIO(source), source[:6]), True
+    return StringIO(source), True
+
+
+def _in_memory(source):
+    """
+    :return: the source if it is XML data which can be sliced as it is,
+        an mmap of an uncompressed local file or None
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return source if _opener(source[:6]) is None else None
+    if not is_string(source) or is_url(source):
+        return None
+    # no path check on the XML strings, it would encode them
+    if len(source) > 4096 or source[:64].lstrip().startswith('<') or \
+            not os.path.exists(source):
+        return source
+    if not os.path.isfile(source):
+        return None
+    with open(source, 'rb') as f:
+        if _opener(f.read(6)) is not None or not f.tell():
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_chunks(source, chunk_size=1 << 16, views=False):
+    """
+    read the source (see open_source) chunk by chunk. Local files are
+    memory mapped and XML strings and bytes are sliced, without reading
+    or copying the whole source at once.
+    :param views: memoryviews instead of bytes for the mapped files and
+        bytes, only valid until the next chunk
+    """
+    data = _in_memory(source)
+    if data is None:
+        yield from _read_stream(source, chunk_size)
+        return
+    try:
+        yield from _slice(data, chunk_size, views)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def _read_stream(source, chunk_size):
+    stream, close = open_source(source)
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        if close:
+            stream.close()
+
+
+def _slice(data, chunk_size, views):
+    """
+    the chunks of a str, bytes or mmap, the mapped pages already read
+    are given back to the system
+    """
+    mapped = isinstance(data, mmap.mmap)
+    if mapped and hasattr(data, 'madvise'):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    if isinstance(data, (bytes, bytearray, mmap.mmap)) and views:
+        view = memoryview(data)
+    else:
+        view = None
+    try:
+        for start in range(0, len(data), chunk_size):
+            if view is not None:
+                chunk = view[start:start + chunk_size]
+                try:
+                    yield chunk
+                finally:
+                    # also when the consumer stops on a parse error, the
+                    # mmap can not be closed while a view is alive
+                    chunk.release()
+            elif isinstance(data, bytearray):
+                yield bytes(data[start:start + chunk_size])
+            else:
+                yield data[start:start + chunk_size]
+            if mapped and hasattr(data, 'madvise') and \
+                    not chunk_size % mmap.PAGESIZE:
+                data.madvise(mmap.MADV_DONTNEED, start,
+                             min(chunk_size, len(data) - start))
+    finally:
+        if view is not None:
+            view.release()
+
+
+if etree.LXML_VERSION >= (5, 0):
+    _LXML_OPTIONS = {'resolve_entities': 'internal'}
+else:
+    _LXML_OPTIONS = {'resolve_entities': False}
+_XML_NS_PREFIXES = {'http://www.w3.org/XML/1998/namespace': 'xml'}
+
+
+def _lxml_qname(element):
+    tag = element.tag
+    if tag[0] != '{':
+        return tag
+    local = tag.rpartition('}')[2]
+    if element.prefix:
+        return element.prefix + ':' + local
+    return local
+
+
+def _lxml_entity(entity, entities):
+    """
+    :return: the text of an unresolved entity and its tail, an external
+        entity has none like with xml.sax
+    """
+    content = entities.get(entity.name)
+    if content and ('<' in content or '&' in content):
+        raise ValueError(
+            "entity {} holds markup, parse it with backend='sax'".format(
+                entity.name))
+    return [text for text in (content, entity.tail) if text]
+
+
+def _lxml_attributes(element, nsmap, parent_nsmap):
+    """
+    the attributes like xml.sax reports them: qualified names and
+    the namespaces declared by the element as xmlns attributes
+    """
+    attrs = {}
+    if nsmap != parent_nsmap:
+        for prefix, uri in nsmap.items():
+            if parent_nsmap.get(prefix) != uri:
+                attrs['xmlns:' + prefix if prefix else 'xmlns'] = uri
+    for key, value in element.attrib.items():
+        if key[0] == '{':
+            uri, _, local = key[1:].partition('}')
+            prefix = _XML_NS_PREFIXES.get(uri)
+            if prefix is None:
+                prefix = [p for p, u in nsmap.items() if u == uri and p][0]
+            key = prefix + ':' + local
+        attrs[intern(key)] = value
+    return attrs
+
+
+def lxml_parse(source, mode='rw', node_class=Node, content_hash=False):
+    """
+    parse the source with lxml's C parser and build the same Nodes as
+    the SAX Handler does, the cdata of an element is made of its text
+    and the tails of its children
+    """
+    # without comments and processing instructions the text around them
+    # is merged, so every child is an element
+    parser = etree.XMLParser(remove_comments=True, remove_pis=True,
+                             **_LXML_OPTIONS)
+    for data in read_chunks(source):
+        parser.feed(data)
+    top = parser.close()
+    # lxml < 5 can not resolve the internal entities only, they are kept
+    # as Entity children with the DTD holding their text
+    entities = {}
+    dtd = top.getroottree().docinfo.internalDTD
+    if dtd is not None:
+        entities = {entity.name: entity.content
+                    for entity in dtd.iterentities()}
+
+    root = node_class(None, None, mode)
+    if not root.is_root:
+        root.is_root = True
+    stack = [(root, iter([top]), {}, [], top)]
+    while stack:
+        parent, children, parent_nsmap, chunks, _ = stack[-1]
+        for element in children:
+            if element.tag is etree.Entity:
+                chunks.extend(_lxml_entity(element, entities))
+                continue
+            nsmap = element.nsmap
+            node = node_class(
+                escape_tag(_lxml_qname(element)),
+                _lxml_attributes(element, nsmap, parent_nsmap),
+                mode)
+            parent._attach(node)
+            text = element.text
+            stack.append((node, iter(element), nsmap,
+                          [text] if text else [], element))
+            break
+        else:
+            element = stack.pop()[4]
+            if parent is root:
+                break
+            parent.cdata = ''.join(chunks)
+            parent._build_position()
+            if content_hash:
+                parent.content_hash
+            if element.tail:
+                stack[-1][3].append(element.tail)
+    return root
+
+
+def iterparse(source, record_path, mode='rw', chunk_size=1 << 16,
+              content_hash=False, **parser_features):
+    """
+    Streams the given filename, URL, file object or XML string and yields
+    every element found at record_path as its own ``Node`` as soon as
+    it is closed, so only one record is held in memory at a time:
+
+    for ad in iterparse('export.xml', 'listing.ad'):
+        ad.get_value_by_path('listingId')
+
+    paths of the yielded records are relative to the record.
+    ``content_hash=True`` builds the content hashes of the records while
+    parsing, see parse.
+    Extra arguments are treated as parser features like in parse.
+
+    Raises ``ValueError`` if the first argument is None / empty string.
+
+    Raises ``xml.sax.SAXParseException`` if something goes wrong
+    during parsing.
+    """
+    if source is None or (is_string(source) and source.strip()) == '':
+        raise ValueError('iterparse() takes a filename, URL or XML string')
+    parser = make_parser()
+    for feature, value in parser_features.items():
+        parser.setFeature(getattr(handler, feature), value)
+    sax_handler = RecordHandler(record_path, mode, content_hash)
+    parser.setContentHandler(sax_handler)
+    records = sax_handler.records
+    for data in read_chunks(source, chunk_size):
+        parser.feed(data)
+        while records:
+            yield records.popleft()
+    parser.close()
+    while records:
+        yield records.popleft()
+
+
+@stage('parse', count=count_tree)
+def parse(filename, mode='rw', compact=False, backend='sax',
+          content_hash=False, tag_index=False, cache=None, **parser_features):
     """
     Interprets the given string as a filename, URL or XML data string,
     parses it and returns a Python object which represents the given
-    document.
+    document. Bytes and file objects are parsed as well, gzip, bz2 and
+    xz compressed files, URLs and bytes are decompressed as a stream.
+
+    With ``compact=True`` the document is built out of ``CompactNode``s,
+    which take less than half of the memory but are read only, so it
+    needs ``mode='r'``.
+
+    ``backend='lxml'`` parses with lxml's C parser instead of xml.sax,
+    the resulting Nodes are the same.
+
+    ``content_hash=True`` builds the ``content_hash`` of every Node
+    bottom-up while parsing, else it is built on first use.
+    ``tag_index=True`` builds the ``tag_index`` of the document used by
+    the ``*_by_tag`` queries while parsing as well.
+
+    ``cache`` is a directory or ``xmapper.snapshot.SnapshotCache`` keeping
+    a binary snapshot of the parsed files, XML strings and bytes by their
+    content, they are loaded instead of parsed when their content did not
+    change. None uses the default cache if one is set, False none.
 
     Extra arguments to this function are treated as feature values to pass
     to ``parser.setFeature()``. For example, ``feature_external_ges=False``
@@ -423,89 +1328,111 @@ def parse(filename, mode='rw', **parser_features):
     Raises ``xml.sax.SAXParseException`` if something goes wrong
     during parsing.
     """
-    if filename is None or (is_string(filename) and filename.strip()) == '':
+    if filename is None or (is_string(filename) or isinstance(
+            filename, bytes)) and (not filename or filename.isspace()):
         raise ValueError('parse() takes a filename, URL or XML string')
+    if compact and mode != 'r':
+        raise ValueError("compact trees are read only, use mode='r'")
+    if cache is None:
+        cache = _default_cache
+    if cache and backend == 'sax' and not parser_features:
+        from xmapper.snapshot import get_cache
+        return get_cache(cache).parse(filename, mode, compact, content_hash,
+                                      tag_index)
+    node_class = CompactNode if compact else Node
+    if backend == 'lxml':
+        if parser_features:
+            raise ValueError('parser features need the sax backend')
+        root = lxml_parse(filename, mode, node_class, content_hash)
+        if tag_index:
+            root.tag_index
+        return root
+    if backend != 'sax':
+        raise ValueError('unknown parser backend: {}'.format(backend))
     parser = make_parser()
     for feature, value in parser_features.items():
         parser.setFeature(getattr(handler, feature), value)
-    sax_handler = Handler(mode)
+    sax_handler = Handler(mode, node_class, content_hash, tag_index)
     parser.setContentHandler(sax_handler)
-    if is_string(filename) and (os.path.exists(filename) or is_url(filename)):
+    if parser_features.get('feature_external_ges') and \
+            is_string(filename) and os.path.exists(filename):
+        # the parser needs the file name to resolve the external entities
         parser.parse(filename)
     else:
-        if hasattr(filename, 'read'):
-            parser.parse(filename)
-        else:
-            parser.parse(StringIO(filename))
+        for data in read_chunks(filename, 1 << 20, views=True):
+            parser.feed(data)
+        parser.close()
 
+    if tag_index:
+        sax_handler.root._store_cache('tag_index', sax_handler.tag_index)
     return sax_handler.root
 
 
-def build_etree(obj):
+@stage('dump.tree')
+def build_etree(obj, strip_blank=False):
     """
     :param obj: obj must be instance of xmapper Node
+    :param strip_blank: drop the whitespace only cdata of the Nodes
+        having children, like parsing with remove_blank_text would
     :return: etree object
     """
-    if not obj.children:
-        return element_gen(obj)
-    else:
-        tree = element_gen(obj)
-        position = 0
-        for child in obj.children:
-            tree.insert(position, build_etree(child))
-            position += 1
-        return tree
+    tree = element_gen(obj)
+    tree.text = _element_text(obj, strip_blank)
+    stack = [(obj, tree)]
+    while stack:
+        node, element = stack.pop()
+        for child in node.children:
+            sub_element = etree.SubElement(
+                element, unescape_tag(child._name), child._attributes)
+            sub_element.text = _element_text(child, strip_blank)
+            if child.children:
+                stack.append((child, sub_element))
+    return tree
 
 
-def dump_xml(obj, xml_name):
-    if not isinstance(obj, Node):
+def _element_text(obj, strip_blank):
+    text = obj.cdata
+    if not text:
+        return None
+    if strip_blank and obj.children and not text.strip(_XML_BLANKS):
+        return None
+    return text
+
+
+def _output_tree(obj):
+    """
+    build the pretty printable etree of a Node, the tree root
+    (without name) is written as its first child
+    """
+    if not isinstance(obj, BaseNode):
         raise TypeError('input must be a Xmapper.Node instance')
 
-    if obj._name is not None:
-        temp_tree = build_etree(obj)
-    else:
-        temp_tree = build_etree(obj.children[0])
+    if obj._name is None:
+        obj = obj.children[0]
+    return etree.ElementTree(build_etree(obj, strip_blank=True))
 
-    xml_str = etree.tostring(temp_tree, encoding='utf-8',
-                             xml_declaration=True, pretty_print=True)
-    parser = etree.XMLParser(remove_blank_text=True)
-    temp_tree = etree.XML(xml_str, parser)
-    new_tree = etree.ElementTree(temp_tree)
-    new_tree.write(
+
+@stage('dump')
+def dump_xml(obj, xml_name):
+    _output_tree(obj).write(
         xml_name,
         encoding='utf-8',
         xml_declaration=True,
         pretty_print=True)
 
 
+@stage('dump')
 def dump_str(obj):
-    if not isinstance(obj, Node):
-        raise TypeError('input must be a Xmapper.Node instance')
-
-    if obj._name is not None:
-        temp_tree = build_etree(obj)
-    else:
-        temp_tree = build_etree(obj.children[0])
-
-    temp_str = etree.tostring(temp_tree, encoding='utf-8',
-                              xml_declaration=True, pretty_print=True)
-    parser = etree.XMLParser(remove_blank_text=True)
-    new_tree = etree.XML(temp_str, parser)
-    temp_tree = etree.ElementTree(new_tree)
-    xml_str = etree.tostring(temp_tree, encoding='utf-8',
+    xml_str = etree.tostring(_output_tree(obj), encoding='utf-8',
                              xml_declaration=True, pretty_print=True)
     return xml_str.decode('utf-8')
 
 
 def element_gen(obj):
-    if not isinstance(obj, Node):
+    if not isinstance(obj, BaseNode):
         raise TypeError('input must be a Xmapper.Node instance')
 
-    tag_name = obj._name
-    tag_name = tag_name.replace('!', '.')
-    tag_name = tag_name.replace('*', ':')
-    tag_name = tag_name.replace('~', '-')
-    element = etree.Element(tag_name)
+    element = etree.Element(unescape_tag(obj._name))
     element.text = obj.cdata
     if obj._attributes:
         for k, v in obj._attributes.items():
@@ -0,0 +1,149 @@
+"""
+record at a time XML output, for feeds too big to be one Node tree:
+
+    with XmlStreamWriter('out.xml.gz', root='property_list') as writer:
+        for output in transformer.transform_records('feed.xml', 'ad'):
+            writer.write(output)
+
+Every record is serialized as soon as it is written, the file is the
+same as dump_xml of a tree holding all the records below root.
+"""
+import bz2
+import gzip
+import lzma
+
+from lxml import etree
+
+from xmapper.utils import BaseNode, build_etree
+
+
+# dump_xml writes the declaration of ElementTree.write
+DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+_EXTENSIONS = (('.gz', 'gzip'), ('.bz2', 'bz2'), ('.xz', 'xz'))
+
+
+class RecordSerializer(object):
+    """
+    serializes records one at a time with the indentation they get
+    inside the root element in dump_xml
+    :param root: tag name of the root element
+    :param attributes: attributes of the root element
+    """
+    def __init__(self, root, attributes=None):
+        self.wrapper = etree.Element(root, attributes or {})
+        # the root start tag is what precedes a child
+        etree.SubElement(self.wrapper, 'x')
+        data = etree.tostring(self.wrapper, encoding='utf-8',
+                              pretty_print=True)
+        self.head = data[:data.index(b'\n') + 1]
+        self.tail = data[data.rindex(b'\n', 0, -1) + 1:]
+        del self.wrapper[0]
+        self.empty = etree.tostring(self.wrapper, encoding='utf-8',
+                                    pretty_print=True)
+
+    def records(self, obj):
+        """
+        :return: the record Nodes of obj, the children of a tree root
+        """
+        if not isinstance(obj, BaseNode):
+            raise TypeError('input must be a Xmapper.Node instance')
+        if obj._name is None:
+            return obj.children
+        return [obj]
+
+    def serialize(self, obj):
+        """
+        :return: utf-8 bytes of the records of obj
+        """
+        parts = []
+        for record in self.records(obj):
+            element = build_etree(record, strip_blank=True)
+            self.wrapper.append(element)
+            try:
+                data = etree.tostring(self.wrapper, encoding='utf-8',
+                                      pretty_print=True)
+            finally:
+                self.wrapper.remove(element)
+            parts.append(data[len(self.head):len(data) - len(self.tail)])
+        return b''.join(parts)
+
+
+class XmlStreamWriter(object):
+    """
+    writes the records below a root element as they come, the output
+    memory does not grow with the number of records
+    :param target: file path or binary file object, a path ending with
+        .gz, .bz2 or .xz is compressed
+    :param root: tag name of the root element
+    :param attributes: attributes of the root element
+    :param compression: None for the path extension, or 'gzip', 'bz2'
+        or 'xz'
+    :param buffer_size: write buffer of an uncompressed file path
+    """
+    def __init__(self, target, root, attributes=None, compression=None,
+                 buffer_size=1 << 20):
+        self.serializer = RecordSerializer(root, attributes)
+        if compression is None and isinstance(target, str):
+            for extension, name in _EXTENSIONS:
+                if target.endswith(extension):
+                    compression = name
+        if compression is not None and compression not in _OPENERS:
+            raise ValueError('unknown compression: {}'.format(compression))
+        if isinstance(target, str):
+            if compression is None:
+                self.file = open(target, 'wb', buffering=buffer_size)
+            else:
+                self.file = _OPENERS[compression](target, 'wb')
+            self._own_file = True
+        else:
+            self.file = target
+            if compression is not None:
+                self.file = _OPENERS[compression](target, 'wb')
+            self._own_file = compression is not None
+        self.count = 0
+        self.closed = False
+        self.file.write(DECLARATION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, obj):
+        """
+        write a record Node, or the records of a tree root like the
+        outputs of Transformer.transform_records
+        """
+        if self.closed:
+            raise ValueError('write to a closed XmlStreamWriter')
+        data = self.serializer.serialize(obj)
+        if not data:
+            return
+        if not self.count:
+            self.file.write(self.serializer.head)
+        self.file.write(data)
+        self.count += len(self.serializer.records(obj))
+
+    def write_many(self, records):
+        for obj in records:
+            self.write(obj)
+
+    def close(self):
+        """
+        end the root element and close the file it opened
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self.count:
+                self.file.write(self.serializer.tail)
+            else:
+                self.file.write(self.serializer.empty)
+            self.file.flush()
+        finally:
+            if self._own_file:
+                self.file.close()